@@ -1,251 +1,524 @@
-from flask import Flask, jsonify, request
-import awsgi
-from db_connection import get_connection
+from flask import Flask, Response, g, jsonify, request
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from db_connection import pooled_connection, pool_stats, POOL_MAX_SIZE
+from result_cache import ResultCache, DayRangeCache
+from live_feed import LiveFeed
+from encoding import (
+    negotiate, to_columns, to_arrow, compress_response, NotAcceptable,
+    ARROW_MIMETYPE, COLUMNS_MIMETYPE,
+)
+from queries import (
+    fetch_subscriptions, fetch_top_content, fetch_revenue_trends, fetch_payments_trend,
+    fetch_watch_history_genre, fetch_user_stats, fetch_popular_content_trend,
+    fetch_payment_method_distribution, stream_user_stats, stream_popular_content_trend,
+    fetch_popular_content_top, fetch_recommendations, fetch_data_versions, revenue_range, revenue_by_day, revenue_total_row,
+    page_limit, USER_STATS_SECTIONS, CACHED_ENDPOINTS, ENDPOINT_TABLES, TOP_N_PARAMS,
+)
+from metrics import (
+    TimedCursor, begin_request, end_request, current_request, run_in_request,
+    record_cache, record_pool_acquire, request_duration, response_bytes, render as render_metrics,
+)
 from flask_cors import CORS
 import logging
 
 app = Flask(__name__)
 
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor", "ETag"])
 
-# Logger configuration
-logging.basicConfig(level=logging.INFO)
+# Logger configuration (handlers are set up by app.run below or by the Lambda runtime)
 logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+# Aggregate results only change when the ingestion scripts load new rows, so
+# they are cached per endpoint, query parameters and the data versions of the
+# tables they read, until their TTL runs out. A write bumps the versions in
+# data_versions, so every process stops serving the old results within
+# DATA_VERSION_TTL.
+result_cache = ResultCache()
+for endpoint, (tables, ttl) in CACHED_ENDPOINTS.items():
+    result_cache.register(endpoint, tables, ttl=ttl)
+
+# Revenue is cached per day instead, so any date range is assembled from
+# days fetched once (under one paymenthistory version)
+revenue_cache = DayRangeCache(ttl=CACHED_ENDPOINTS["revenue-trends"][1])
+
+CACHE_INVALIDATE_TOKEN = os.environ.get("CACHE_INVALIDATE_TOKEN")
+
+# ANALYTICS_BACKEND=memory answers every query from NumPy arrays loaded into
+# this process (see memory_backend.py) instead of querying the database
+ANALYTICS_BACKEND = os.environ.get("ANALYTICS_BACKEND", "database")
+memory_backend = None
+if ANALYTICS_BACKEND == "memory":
+    from memory_backend import MemoryBackend
+    memory_backend = MemoryBackend()
+elif ANALYTICS_BACKEND != "database":
+    raise ValueError("ANALYTICS_BACKEND must be 'database' or 'memory'")
+
+# Run one of the fetch_* queries on a pooled connection, timing the wait for
+# the connection and the query (labelled with the fetch function's name)
+def run_query(fetch, *args):
+    if memory_backend is not None:
+        return memory_backend.query(fetch.__name__, *args)
+    return run_database_query(fetch, *args)
+
+def run_database_query(fetch, *args):
+    started = time.perf_counter()
+    with pooled_connection() as connection:
+        record_pool_acquire(time.perf_counter() - started)
+        with TimedCursor(connection.cursor(), fetch.__name__) as cursor:
+            return fetch(cursor, *args)
+
+# Per-table data versions, re-read at most every DATA_VERSION_TTL seconds
+def read_data_versions():
+    key = result_cache.make_key("data-versions")
+    versions, hit = result_cache.get(key)
+    if not hit:
+        versions = run_query(fetch_data_versions)
+        result_cache.put(key, versions)
+    return versions
+
+# None when they cannot be read: responses then go without ETags and cached
+# results only expire by TTL
+def data_versions():
+    try:
+        return read_data_versions()
+    except Exception as e:
+        logger.warning("Data versions unavailable: %s", e)
+        return None
+
+def table_versions(tables):
+    versions = data_versions() or {}
+    return tuple(versions.get(table) for table in tables)
+
+def cached_query(endpoint, params, fetch, *args, run=run_query):
+    key = result_cache.make_key(endpoint, params, table_versions(CACHED_ENDPOINTS[endpoint][0]))
+    value, hit = result_cache.get(key)
+    record_cache(endpoint, hit)
+    if not hit:
+        value = run(fetch, *args)
+        result_cache.put(key, value)
+    return value
+
+# ?approx=true answers from the sketches maintained at ingestion time (see
+# shared/sketch_format.py for their error bounds). They live in the
+# database, so they are read from it even with ANALYTICS_BACKEND=memory.
+def approx_requested(params):
+    return params.get("approx") == "true"
+
+def approx_queries():
+    try:
+        import sketches
+    except ImportError:
+        raise ValueError("approx=true needs numpy installed on the server")
+    return sketches
+
+# Panel functions: compute one endpoint's data from its parameters. Shared by
+# the individual routes and the /api/dashboard bundle.
+def subscriptions_panel(params):
+    return cached_query("subscriptions", params, fetch_subscriptions)
+
+def top_content_panel(params):
+    return cached_query("top-content", params, fetch_top_content)
+
+# Only the days of the range no earlier request covered are queried;
+# ?total=true returns the range's sum (from the cache's prefix sums)
+def revenue_trends_panel(params):
+    start, end = revenue_range(params)
+    total = params.get("total") == "true"
+    generation, gaps = revenue_cache.missing(start, end, table_versions(CACHED_ENDPOINTS["revenue-trends"][0]))
+    record_cache("revenue-trends", not gaps)
+    for first, last in gaps:
+        rows = run_query(fetch_revenue_trends, first.isoformat(), last.isoformat())
+        revenue_cache.fill(generation, first, last, revenue_by_day(rows))
+    if total:
+        cached = revenue_cache.total(start, end)
+        if cached is not None:
+            return [revenue_total_row(start, end, cached)]
+    else:
+        cached = revenue_cache.values(start, end)
+        if cached is not None:
+            return [{"date": str(day), "revenue": revenue} for day, revenue in cached]
+    # The cache was invalidated while the gaps were fetched
+    rows = run_query(fetch_revenue_trends, start.isoformat(), end.isoformat())
+    return [revenue_total_row(start, end, sum(row["revenue"] for row in rows))] if total else rows
+
+def payments_trend_panel(params):
+    return cached_query("payments-trend", params, fetch_payments_trend)
+
+def watch_history_genre_panel(params):
+    if approx_requested(params):
+        return cached_query("watch-history-genre", params, approx_queries().fetch_watch_history_genre_approx,
+                            run=run_database_query)
+    return cached_query("watch-history-genre", params, fetch_watch_history_genre)
+
+# ?limit= caps each history page, ?watch_cursor= / ?payment_cursor= continue
+# from a previous page and ?history=watch|payment returns only that history
+def user_stats_panel(params):
+    history = params.get("history")
+    if history and history not in USER_STATS_SECTIONS:
+        raise ValueError(f"history must be one of {', '.join(USER_STATS_SECTIONS)}")
+    return run_query(fetch_user_stats, params["user_id"], page_limit(params.get("limit")),
+                     params.get("watch_cursor"), params.get("payment_cursor"),
+                     (history,) if history else USER_STATS_SECTIONS)
+
+# ?limit= sets how many titles to recommend (default 10). The neighbor index
+# lives in the database, so it is read from there even with
+# ANALYTICS_BACKEND=memory.
+def recommendations_panel(params):
+    limit = params.get("limit", "10")
+    if not str(limit).isdigit():
+        raise ValueError("limit must be a positive integer")
+    return run_database_query(fetch_recommendations, params["user_id"], int(limit))
+
+# Returns (rows, next_cursor); ?limit= caps the page and ?cursor= continues
+def popular_content_trend_page(params):
+    return run_query(fetch_popular_content_trend, page_limit(params.get("limit")), params.get("cursor"))
+
+# ?n= switches to the top N titles per ?granularity=day|week|month bucket,
+# optionally limited to one ?month=YYYY-MM
+def popular_content_top_panel(params):
+    n = params.get("n", "10")
+    if not str(n).isdigit():
+        raise ValueError("n must be a positive integer")
+    fetch, run = fetch_popular_content_top, run_query
+    if approx_requested(params):
+        fetch, run = approx_queries().fetch_popular_content_top_approx, run_database_query
+    return cached_query("popular-content-top", {key: params[key] for key in TOP_N_PARAMS if key in params},
+                        fetch, int(n), params.get("granularity", "month"), params.get("month"), run=run)
+
+def popular_content_trend_panel(params):
+    if "n" in params:
+        return popular_content_top_panel(params)
+    return popular_content_trend_page(params)[0]
+
+def payment_method_distribution_panel(params):
+    return cached_query("payment-method-distribution", params, fetch_payment_method_distribution)
+
+# Panel name -> (panel function, query parameters it reads)
+DASHBOARD_PANELS = {
+    "revenue-trends": (revenue_trends_panel, ("start_date", "end_date", "total")),
+    "subscriptions": (subscriptions_panel, ()),
+    "top-content": (top_content_panel, ()),
+    "payments-trend": (payments_trend_panel, ()),
+    "watch-history-genre": (watch_history_genre_panel, ("approx",)),
+    "popular-content-trend": (popular_content_trend_panel, TOP_N_PARAMS),
+    "payment-method-distribution": (payment_method_distribution_panel, ()),
+    "user-stats": (user_stats_panel, ("user_id",)),
+}
+
+# Panels of one bundle run concurrently, each on its own pooled connection
+panel_executor = ThreadPoolExecutor(max_workers=POOL_MAX_SIZE, thread_name_prefix="panel")
+
+# ?format=ndjson: one JSON document per line, read from a server-side cursor
+# and sent as rows arrive. The pooled connection is held until the stream ends.
+def stream_ndjson(stream, *args):
+    if memory_backend is not None:
+        rows = memory_backend.query(stream.__name__, *args)
+        return Response((app.json.dumps(row) + "\n" for row in rows), mimetype="application/x-ndjson")
+
+    def generate():
+        with pooled_connection() as connection:
+            # Named cursors only exist inside a transaction
+            connection.autocommit = False
+            try:
+                for row in stream(connection, *args):
+                    yield app.json.dumps(row) + "\n"
+            finally:
+                connection.rollback()
+                connection.autocommit = True
+    return Response(generate(), mimetype="application/x-ndjson")
+
+# Live updates (/api/stream): aggregates re-read when ingestion bumps the
+# data version of a table they depend on, pushed as the rows that changed
+def live_revenue():
+    return {row["date"]: row for row in run_query(fetch_revenue_trends, "0001-01-01", "9999-12-31")}
+
+def live_genres():
+    return {row["genre"]: row for row in run_query(fetch_watch_history_genre)}
+
+# The top 10 titles of each month, as the dashboard requests them; a month
+# whose ranking changed is sent whole
+def live_top_content():
+    months = {}
+    for row in run_query(fetch_popular_content_top, 10, "month"):
+        months.setdefault(row["month"], []).append(row)
+    return months
+
+live_feed = LiveFeed(
+    read_data_versions,
+    {
+        "revenue": (ENDPOINT_TABLES["revenue-trends"], live_revenue, "revenue"),
+        "genres": (ENDPOINT_TABLES["watch-history-genre"], live_genres, "watch_count"),
+        "top-content": (ENDPOINT_TABLES["popular-content-trend"], live_top_content, None),
+    },
+    dumps=app.json.dumps,
+)
+
+# Request metrics: latency and payload size per route, plus one structured
+# log line per request. Registered before compress() so it runs after it
+# and sees the bytes actually sent.
+@app.before_request
+def start_request_metrics():
+    g.started = time.perf_counter()
+    begin_request()
+
+@app.after_request
+def record_request_metrics(response):
+    elapsed = time.perf_counter() - g.started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    request_duration.observe(elapsed, route, request.method, response.status_code)
+    size = None if response.is_streamed else response.calculate_content_length()
+    if size is not None:
+        response_bytes.observe(size, route)
+    fields = {key: round(value, 2) for key, value in (end_request() or {}).items()}
+    logger.info(json.dumps(dict(fields, route=route, method=request.method, status=response.status_code,
+                                duration_ms=round(elapsed * 1000, 2), bytes=size)))
+    return response
+
+# Conditional GET: the ETag of a response is derived from the data versions
+# of the tables its endpoint reads (bumped by ingestion on commit, see
+# ingestion/versions.py) plus the URL and Accept header, so it is known before
+# any query runs. A matching If-None-Match is answered with 304 right away.
+def etag_tables():
+    if not request.url_rule or request.method != "GET":
+        return ()
+    name = request.url_rule.rule.split("/")[2]
+    if name == "dashboard":
+        panels = request.args.get("panels")
+        names = [panel.strip() for panel in panels.split(",")] if panels else ENDPOINT_TABLES
+        return sorted({table for panel in names for table in ENDPOINT_TABLES.get(panel, ())})
+    return sorted(ENDPOINT_TABLES.get(name, ()))
+
+@app.before_request
+def check_etag():
+    g.etag = None
+    tables = etag_tables()
+    if not tables:
+        return None
+    versions = data_versions()
+    if versions is None:
+        return None
+    key = json.dumps([request.full_path, request.headers.get("Accept", ""),
+                      [versions.get(table) for table in tables]])
+    g.etag = hashlib.sha1(key.encode()).hexdigest()[:24]
+    if request.if_none_match.contains_weak(g.etag):
+        response = Response(status=304)
+        response.set_etag(g.etag, weak=True)
+        return response
+    return None
+
+@app.after_request
+def set_etag(response):
+    if g.get("etag") and response.status_code == 200:
+        response.set_etag(g.etag, weak=True)
+        # Clients may keep the response but must revalidate it before reuse
+        response.cache_control.no_cache = True
+    return response
+
+def server_error(e):
+    logger.exception("Request to %s failed", request.path)
+    return jsonify({"error": str(e)}), 500
+
+# Encode a list of rows as JSON objects, column arrays or Arrow, as negotiated
+# by ?format= / Accept (see encoding.py)
+def respond(rows):
+    try:
+        encoding = negotiate(request.args, request.accept_mimetypes)
+        if encoding == "arrow":
+            return Response(to_arrow(rows), mimetype=ARROW_MIMETYPE)
+    except (ValueError, NotAcceptable) as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 406 if isinstance(e, NotAcceptable) else 400
+        return response
+    if encoding == "columns":
+        response = jsonify(to_columns(rows))
+        response.mimetype = COLUMNS_MIMETYPE
+        return response
+    return jsonify(rows)
+
+@app.after_request
+def compress(response):
+    return compress_response(response, request.accept_encodings)
+
+def timed_panel(panel, params):
+    started = time.perf_counter()
+    try:
+        data = panel(params)
+    except Exception as e:
+        data = {"error": str(e)}
+    return data, round((time.perf_counter() - started) * 1000, 2)
 
 # Endpoint: Subscription Metrics
 @app.route('/api/subscriptions', methods=['GET'])
 def get_subscriptions():
     try:
-        connection = get_connection()
-        cursor = connection.cursor()
-        query = """
-            SELECT s.name, COUNT(*) AS user_count
-            FROM users u
-            JOIN subscriptions s ON u.subscription_id = s.subscription_id
-            GROUP BY s.name;
-        """
-        cursor.execute(query)
-        result = [{"subscription": row[0], "user_count": row[1]} for row in cursor.fetchall()]
-        return jsonify(result)
+        return respond(subscriptions_panel(request.args))
     except Exception as e:
-        return jsonify({"error": str(e)})
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return server_error(e)
 
 # Endpoint: Top Content
 @app.route('/api/top-content', methods=['GET'])
 def get_top_content():
     try:
-        connection = get_connection()
-        cursor = connection.cursor()
-        query = "SELECT title, genre, rating FROM content ORDER BY rating DESC LIMIT 10;"
-        cursor.execute(query)
-        result = [{"title": row[0], "genre": row[1], "rating": row[2]} for row in cursor.fetchall()]
-        return jsonify(result)
+        return respond(top_content_panel(request.args))
     except Exception as e:
-        return jsonify({"error": str(e)})
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return server_error(e)
 
 # Endpoint: Revenue Trends
 @app.route('/api/revenue-trends', methods=['GET'])
 def get_revenue_trends():
     try:
-        start_date = request.args.get('start_date', '2024-09-01')
-        end_date = request.args.get('end_date', '2024-09-30')
-
-        connection = get_connection()
-        cursor = connection.cursor()
-        query = """
-            SELECT DATE(p.payment_date) AS date, SUM(p.amount) AS revenue
-            FROM paymenthistory p
-            WHERE DATE(p.payment_date) BETWEEN %s AND %s
-            GROUP BY DATE(p.payment_date)
-            ORDER BY DATE(p.payment_date);
-        """
-        cursor.execute(query, (start_date, end_date))
-        result = [{"date": str(row[0]), "revenue": float(row[1])} for row in cursor.fetchall()]
-        return jsonify(result)
+        return respond(revenue_trends_panel(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)})
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return server_error(e)
 
 # Other Advanced Endpoints (Payments Trend, Watch History by Genre, etc.)
 @app.route('/api/payments-trend', methods=['GET'])
 def get_payments_trend():
     try:
-        connection = get_connection()
-        cursor = connection.cursor()
-        query = """
-            SELECT DATE_TRUNC('week', payment_date) AS week, SUM(amount) AS total_revenue
-            FROM paymenthistory
-            GROUP BY DATE_TRUNC('week', payment_date)
-            ORDER BY week;
-        """
-        cursor.execute(query)
-        result = [{"week": row[0], "total_revenue": float(row[1])} for row in cursor.fetchall()]
-        return jsonify(result)
+        return respond(payments_trend_panel(request.args))
     except Exception as e:
-        return jsonify({"error": str(e)})
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return server_error(e)
 
 @app.route('/api/watch-history-genre', methods=['GET'])
 def get_watch_history_genre():
     try:
-        connection = get_connection()
-        cursor = connection.cursor()
-        query = """
-            SELECT c.genre, COUNT(*) AS watch_count
-            FROM watchhistory w
-            JOIN content c ON w.content_id = c.content_id
-            GROUP BY c.genre
-            ORDER BY watch_count DESC;
-        """
-        cursor.execute(query)
-        result = [{"genre": row[0], "watch_count": row[1]} for row in cursor.fetchall()]
-        return jsonify(result)
+        return respond(watch_history_genre_panel(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)})
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return server_error(e)
 
 @app.route('/api/user-stats/<user_id>', methods=['GET'])
 def get_user_stats(user_id):
     try:
-        connection = get_connection()
-        cursor = connection.cursor()
-
-        watch_query = """
-            SELECT c.title, w.progress, w.watched_on
-            FROM watchhistory w
-            JOIN content c ON w.content_id = c.content_id
-            WHERE w.user_id = %s
-            ORDER BY w.watched_on DESC;
-        """
-        cursor.execute(watch_query, (user_id,))
-        watch_history = [{"title": row[0], "progress": float(row[1]), "watched_on": row[2]} for row in cursor.fetchall()]
-
-        payment_query = """
-            SELECT amount, method, payment_date
-            FROM paymenthistory
-            WHERE user_id = %s
-            ORDER BY payment_date DESC;
-        """
-        cursor.execute(payment_query, (user_id,))
-        payment_history = [{"amount": float(row[0]), "method": row[1], "payment_date": row[2]} for row in cursor.fetchall()]
-
-        result = {
-            "user_id": user_id,
-            "watch_history": watch_history,
-            "payment_history": payment_history
-        }
-        return jsonify(result)
+        if request.args.get("format") == "ndjson":
+            return stream_ndjson(stream_user_stats, user_id)
+        return jsonify(user_stats_panel(dict(request.args.to_dict(), user_id=user_id)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)})
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return server_error(e)
+
+@app.route('/api/recommendations/<user_id>', methods=['GET'])
+def get_recommendations(user_id):
+    try:
+        return respond(recommendations_panel(dict(request.args.to_dict(), user_id=user_id)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return server_error(e)
 
 # 4. Popular Content Over Time
 @app.route('/api/popular-content-trend', methods=['GET'])
 def get_popular_content_trend():
     try:
-        connection = get_connection()
-        cursor = connection.cursor()
-        query = """
-            SELECT DATE_TRUNC('month', w.watched_on) AS month, c.title, COUNT(*) AS watch_count
-            FROM watchhistory w
-            JOIN content c ON w.content_id = c.content_id
-            GROUP BY DATE_TRUNC('month', w.watched_on), c.title
-            ORDER BY month, watch_count DESC;
-        """
-        cursor.execute(query)
-        result = [{"month": row[0], "title": row[1], "watch_count": row[2]} for row in cursor.fetchall()]
-        return jsonify(result)
+        if request.args.get("format") == "ndjson":
+            return stream_ndjson(stream_popular_content_trend)
+        if "n" in request.args:
+            return respond(popular_content_top_panel(request.args))
+        rows, next_cursor = popular_content_trend_page(request.args)
+        response = respond(rows)
+        if next_cursor and response.status_code == 200:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        return jsonify({"error": str(e)})
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return server_error(e)
 
 # Add Payment Method Distribution Endpoint
 @app.route('/api/payment-method-distribution', methods=['GET'])
 def get_payment_method_distribution():
     try:
-        connection = get_connection()
-        cursor = connection.cursor()
-        query = """
-            SELECT method, COUNT(*) AS count
-            FROM paymenthistory
-            GROUP BY method
-            ORDER BY count DESC;
-        """
-        cursor.execute(query)
-        result = [{"method": row[0], "count": row[1]} for row in cursor.fetchall()]
-        return jsonify(result)
+        return respond(payment_method_distribution_panel(request.args))
     except Exception as e:
-        return jsonify({"error": str(e)})
-    finally:
-        if connection:
-            cursor.close()
-            connection.close()
+        return server_error(e)
+
+# Dashboard bundle: every panel's data in one response, queried in parallel.
+# ?panels=revenue-trends,subscriptions selects panels (default: all; user-stats
+# only when user_id is given). Panel parameters are passed as usual, e.g.
+# start_date, end_date and user_id.
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    requested = request.args.get("panels")
+    if requested:
+        names = [name.strip() for name in requested.split(",") if name.strip()]
+        unknown = [name for name in names if name not in DASHBOARD_PANELS]
+        if unknown:
+            return jsonify({"error": f"Unknown panels: {', '.join(unknown)}"}), 400
+    else:
+        names = [name for name in DASHBOARD_PANELS if name != "user-stats" or "user_id" in request.args]
 
-# AWS Lambda Handler
+    started = time.perf_counter()
+    futures = {}
+    for name in names:
+        panel, param_names = DASHBOARD_PANELS[name]
+        params = {key: request.args[key] for key in param_names if key in request.args}
+        if name == "user-stats" and "user_id" not in params:
+            futures[name] = None
+            continue
+        futures[name] = panel_executor.submit(run_in_request, current_request(), timed_panel, panel, params)
+
+    panels, timings = {}, {}
+    for name, future in futures.items():
+        if future is None:
+            panels[name], timings[name] = {"error": "user_id is required for user-stats"}, 0.0
+        else:
+            panels[name], timings[name] = future.result()
+    return jsonify({
+        "panels": panels,
+        "timings_ms": timings,
+        "total_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
+
+# Server-Sent Events: "revenue", "genres" and "top-content" events carry
+# {"changed": [rows], "removed": [keys]} as ingestion commits. Needs a server
+# that can hold a response open (app.run, gunicorn with threads), not Lambda.
+@app.route('/api/stream', methods=['GET'])
+def get_stream():
+    return Response(live_feed.stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Invalidation hook called by the ingestion scripts after they commit.
+# Body: {"tables": ["watchhistory", ...]}; omit "tables" to clear everything.
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    # Refused unless a token is configured, so anyone who can reach the API
+    # cannot flush the caches
+    if not CACHE_INVALIDATE_TOKEN:
+        return jsonify({"error": "Cache invalidation is disabled; set CACHE_INVALIDATE_TOKEN"}), 403
+    if request.headers.get("X-Invalidate-Token") != CACHE_INVALIDATE_TOKEN:
+        return jsonify({"error": "Forbidden"}), 403
+    payload = request.get_json(silent=True) or {}
+    dropped = result_cache.invalidate(payload.get("tables"))
+    if payload.get("tables") is None or set(payload["tables"]) & set(CACHED_ENDPOINTS["revenue-trends"][0]):
+        dropped += revenue_cache.invalidate()
+    logger.info("Cache invalidated for %s (%d entries dropped)", payload.get("tables", "all tables"), dropped)
+    result = {"invalidated": dropped, "cache": result_cache.snapshot(), "revenue_cache": revenue_cache.snapshot()}
+    if memory_backend is not None:
+        # Pick up the new rows now rather than at the next periodic refresh
+        result["memory_rows_loaded"] = memory_backend.refresh()
+    return jsonify(result)
+
+# Prometheus scrape endpoint for the metrics above, the result cache and the pool
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(render_metrics(result_cache.snapshot(), pool_stats()),
+                    mimetype="text/plain; version=0.0.4")
+
+# AWS Lambda Handler, kept for deployments configured with app.lambda_handler;
+# the Lambda entry point itself lives in lambda_entry.py
 def lambda_handler(event, context):
-    try:
-        # Log the received event for debugging
-        print("Received event:", event)
-
-        # Determine the HTTP method and path based on the event structure
-        if "httpMethod" in event:  # REST API (v1)
-            http_method = event["httpMethod"]
-            event["path"] = event["path"]
-        elif "requestContext" in event and "http" in event["requestContext"]:  # HTTP API (v2)
-            http_method = event["requestContext"]["http"]["method"]
-            event["httpMethod"] = http_method  # Add to event for compatibility
-            event["path"] = event["rawPath"]  # Add to event for compatibility
-
-            # Handle query parameters for HTTP API (v2)
-            if "rawQueryString" in event and event["rawQueryString"]:
-                event["queryStringParameters"] = {
-                    key: value for key, value in 
-                    (pair.split("=") for pair in event["rawQueryString"].split("&"))
-                }
-            else:
-                event["queryStringParameters"] = {}
-
-        # Ensure required keys are present in the event
-        if "httpMethod" not in event or "path" not in event:
-            raise KeyError("The required keys 'httpMethod' or 'path' are missing in the event.")
-
-        # Process the event with awsgi
-        return awsgi.response(app, event, context)
-    except KeyError as e:
-        print(f"KeyError in lambda_handler: {e}")
-        return {
-            "statusCode": 400,
-            "body": f"Bad Request: {str(e)}",
-        }
-    except Exception as e:
-        print(f"Exception in lambda_handler: {e}")
-        return {
-            "statusCode": 500,
-            "body": f"Internal Server Error: {str(e)}",
-        }
+    from lambda_entry import handler
+    return handler(event, context)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,388 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from datetime import date
+from decimal import Decimal
+from contextlib import asynccontextmanager
+from psycopg_pool import AsyncConnectionPool
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import http_date, parse_accept_header
+from db_connection import connection_url
+from result_cache import ResultCache, DayRangeCache
+from encoding import (
+    negotiate, to_columns, to_arrow, NotAcceptable, JSON_MIMETYPE, COLUMNS_MIMETYPE, ARROW_MIMETYPE,
+    COMPRESS_MIN_BYTES, COMPRESSION_ENABLED,
+)
+from queries import (
+    fetch_subscriptions, fetch_top_content, fetch_revenue_trends, fetch_payments_trend,
+    fetch_watch_history_genre, fetch_user_watch_page, fetch_user_payment_page,
+    fetch_popular_content_trend, fetch_popular_content_top, fetch_payment_method_distribution, fetch_recommendations,
+    fetch_data_versions,
+    user_stats_statements, popular_content_trend_statements, revenue_range, revenue_by_day, revenue_total_row,
+    page_limit, USER_STATS_SECTIONS, CACHED_ENDPOINTS, TOP_N_PARAMS, STREAM_FETCH_SIZE,
+)
+
+# Asynchronous variant of app.py: the same /api/* routes served by Starlette
+# on psycopg 3's asyncio driver, so one process can keep thousands of
+# dashboard requests in flight while their queries wait on the database.
+#
+#     uvicorn asgi_app:app --port 8000
+#
+# The SQL is the one in queries.py; independent queries of one request (the
+# two user-stats histories, the panels of /api/dashboard) run concurrently.
+
+ASYNC_POOL_MIN = int(os.environ.get("ASYNC_DB_POOL_MIN", "2"))
+ASYNC_POOL_MAX = int(os.environ.get("ASYNC_DB_POOL_MAX", "20"))
+
+logger = logging.getLogger(__name__)
+
+pool = AsyncConnectionPool(connection_url(), min_size=ASYNC_POOL_MIN, max_size=ASYNC_POOL_MAX,
+                           timeout=float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+                           kwargs={"autocommit": True}, open=False)
+
+result_cache = ResultCache()
+for endpoint, (tables, ttl) in CACHED_ENDPOINTS.items():
+    result_cache.register(endpoint, tables, ttl=ttl)
+revenue_cache = DayRangeCache(ttl=CACHED_ENDPOINTS["revenue-trends"][1])
+
+CACHE_INVALIDATE_TOKEN = os.environ.get("CACHE_INVALIDATE_TOKEN")
+
+# The fetch_* functions in queries.py run execute() then fetchall() on a
+# synchronous cursor. Each is called twice: against a capturing cursor to get
+# its statement, which runs on the async pool, then against the fetched rows
+# to shape them.
+class _Captured(Exception):
+    def __init__(self, query, params):
+        self.query = query
+        self.params = params
+
+class _CaptureCursor:
+    def execute(self, query, params=()):
+        raise _Captured(query, params)
+
+class _ReplayCursor:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def execute(self, query, params=()):
+        pass
+
+    def fetchall(self):
+        return self._rows
+
+async def run_query(fetch, *args):
+    try:
+        fetch(_CaptureCursor(), *args)
+        raise RuntimeError(f"{fetch.__name__} did not execute a query")
+    except _Captured as captured:
+        query, params = captured.query, captured.params
+    async with pool.connection() as connection:
+        cursor = await connection.execute(query, params)
+        rows = await cursor.fetchall()
+    return fetch(_ReplayCursor(rows), *args)
+
+# Results are cached under the data versions of the tables they read, as in
+# app.py, so writes by any loader reach every process within DATA_VERSION_TTL
+async def table_versions(tables):
+    key = result_cache.make_key("data-versions")
+    versions, hit = result_cache.get(key)
+    if not hit:
+        try:
+            versions = await run_query(fetch_data_versions)
+        except Exception as e:
+            logger.warning("Data versions unavailable: %s", e)
+            return tuple(None for _ in tables)
+        result_cache.put(key, versions)
+    return tuple(versions.get(table) for table in tables)
+
+async def cached_query(endpoint, params, fetch, *args):
+    key = result_cache.make_key(endpoint, params, await table_versions(CACHED_ENDPOINTS[endpoint][0]))
+    value, hit = result_cache.get(key)
+    if hit:
+        return value
+    value = await run_query(fetch, *args)
+    result_cache.put(key, value)
+    return value
+
+# The approx=true readers in sketches.py run several dependent statements,
+# which the capture/replay above cannot, so they are only served by app.py
+def reject_approx(params):
+    if params.get("approx") == "true":
+        raise ValueError("approx=true is not supported by the async app; use app.py")
+
+# Panel functions, as in app.py
+async def subscriptions_panel(params):
+    return await cached_query("subscriptions", params, fetch_subscriptions)
+
+async def top_content_panel(params):
+    return await cached_query("top-content", params, fetch_top_content)
+
+async def revenue_trends_panel(params):
+    start, end = revenue_range(params)
+    total = params.get("total") == "true"
+    generation, gaps = revenue_cache.missing(start, end,
+                                             await table_versions(CACHED_ENDPOINTS["revenue-trends"][0]))
+    fetched = await asyncio.gather(*(run_query(fetch_revenue_trends, first.isoformat(), last.isoformat())
+                                     for first, last in gaps))
+    for (first, last), rows in zip(gaps, fetched):
+        revenue_cache.fill(generation, first, last, revenue_by_day(rows))
+    if total:
+        cached = revenue_cache.total(start, end)
+        if cached is not None:
+            return [revenue_total_row(start, end, cached)]
+    else:
+        cached = revenue_cache.values(start, end)
+        if cached is not None:
+            return [{"date": str(day), "revenue": revenue} for day, revenue in cached]
+    rows = await run_query(fetch_revenue_trends, start.isoformat(), end.isoformat())
+    return [revenue_total_row(start, end, sum(row["revenue"] for row in rows))] if total else rows
+
+async def payments_trend_panel(params):
+    return await cached_query("payments-trend", params, fetch_payments_trend)
+
+async def watch_history_genre_panel(params):
+    reject_approx(params)
+    return await cached_query("watch-history-genre", params, fetch_watch_history_genre)
+
+# The watch and payment histories are fetched concurrently on two connections
+async def user_stats_panel(params):
+    history = params.get("history")
+    if history and history not in USER_STATS_SECTIONS:
+        raise ValueError(f"history must be one of {', '.join(USER_STATS_SECTIONS)}")
+    user_id, limit = params["user_id"], page_limit(params.get("limit"))
+    pages = {}
+    if history in (None, "watch"):
+        pages["watch"] = run_query(fetch_user_watch_page, user_id, limit, params.get("watch_cursor"))
+    if history in (None, "payment"):
+        pages["payment"] = run_query(fetch_user_payment_page, user_id, limit, params.get("payment_cursor"))
+    result = {"user_id": user_id}
+    for section, (rows, next_cursor) in zip(pages, await asyncio.gather(*pages.values())):
+        result[f"{section}_history"], result[f"next_{section}_cursor"] = rows, next_cursor
+    return result
+
+async def recommendations_panel(params):
+    limit = params.get("limit", "10")
+    if not str(limit).isdigit():
+        raise ValueError("limit must be a positive integer")
+    return await run_query(fetch_recommendations, params["user_id"], int(limit))
+
+async def popular_content_trend_page(params):
+    return await run_query(fetch_popular_content_trend, page_limit(params.get("limit")), params.get("cursor"))
+
+async def popular_content_top_panel(params):
+    n = params.get("n", "10")
+    if not str(n).isdigit():
+        raise ValueError("n must be a positive integer")
+    reject_approx(params)
+    return await cached_query("popular-content-top", {key: params[key] for key in TOP_N_PARAMS if key in params},
+                              fetch_popular_content_top, int(n), params.get("granularity", "month"),
+                              params.get("month"))
+
+async def popular_content_trend_panel(params):
+    if "n" in params:
+        return await popular_content_top_panel(params)
+    return (await popular_content_trend_page(params))[0]
+
+async def payment_method_distribution_panel(params):
+    return await cached_query("payment-method-distribution", params, fetch_payment_method_distribution)
+
+DASHBOARD_PANELS = {
+    "revenue-trends": (revenue_trends_panel, ("start_date", "end_date", "total")),
+    "subscriptions": (subscriptions_panel, ()),
+    "top-content": (top_content_panel, ()),
+    "payments-trend": (payments_trend_panel, ()),
+    "watch-history-genre": (watch_history_genre_panel, ("approx",)),
+    "popular-content-trend": (popular_content_trend_panel, TOP_N_PARAMS),
+    "payment-method-distribution": (payment_method_distribution_panel, ()),
+    "user-stats": (user_stats_panel, ("user_id",)),
+}
+
+# Serialize like Flask's JSON provider so both servers return identical bodies
+def _default(value):
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(data):
+    return json.dumps(data, default=_default, separators=(",", ":"), sort_keys=True)
+
+def json_response(data, status_code=200, media_type=JSON_MIMETYPE, headers=None):
+    return Response(dumps(data) + "\n", status_code=status_code, media_type=media_type, headers=headers)
+
+def server_error(request, e):
+    logger.exception("Request to %s failed", request.url.path)
+    return json_response({"error": str(e)}, 500)
+
+# Encode a list of rows as negotiated by ?format= / Accept (see encoding.py)
+def respond(request, rows, headers=None):
+    try:
+        encoding = negotiate(request.query_params,
+                             parse_accept_header(request.headers.get("accept"), MIMEAccept))
+        if encoding == "arrow":
+            return Response(to_arrow(rows), media_type=ARROW_MIMETYPE, headers=headers)
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    except NotAcceptable as e:
+        return json_response({"error": str(e)}, 406)
+    if encoding == "columns":
+        return json_response(to_columns(rows), media_type=COLUMNS_MIMETYPE, headers=headers)
+    return json_response(rows, headers=headers)
+
+# ?format=ndjson: rows from server-side cursors, sent as they arrive
+def stream_ndjson(statements):
+    async def generate():
+        async with pool.connection() as connection:
+            # Named cursors only exist inside a transaction
+            async with connection.transaction():
+                for query, params, shape in statements:
+                    async with connection.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+                        cursor.itersize = STREAM_FETCH_SIZE
+                        await cursor.execute(query, params)
+                        async for row in cursor:
+                            yield dumps(shape(row)) + "\n"
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+def list_endpoint(panel):
+    async def endpoint(request):
+        try:
+            return respond(request, await panel(request.query_params))
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
+        except Exception as e:
+            return server_error(request, e)
+    return endpoint
+
+async def get_user_stats(request):
+    user_id = request.path_params["user_id"]
+    try:
+        if request.query_params.get("format") == "ndjson":
+            return stream_ndjson(user_stats_statements(user_id))
+        return json_response(await user_stats_panel(dict(request.query_params, user_id=user_id)))
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    except Exception as e:
+        return server_error(request, e)
+
+async def get_recommendations(request):
+    try:
+        params = dict(request.query_params, user_id=request.path_params["user_id"])
+        return respond(request, await recommendations_panel(params))
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    except Exception as e:
+        return server_error(request, e)
+
+async def get_popular_content_trend(request):
+    params = request.query_params
+    try:
+        if params.get("format") == "ndjson":
+            return stream_ndjson(popular_content_trend_statements())
+        if "n" in params:
+            return respond(request, await popular_content_top_panel(params))
+        rows, next_cursor = await popular_content_trend_page(params)
+        return respond(request, rows, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    except Exception as e:
+        return server_error(request, e)
+
+async def timed_panel(panel, params):
+    started = time.perf_counter()
+    try:
+        data = await panel(params)
+    except Exception as e:
+        data = {"error": str(e)}
+    return data, round((time.perf_counter() - started) * 1000, 2)
+
+# Dashboard bundle, as in app.py: all panels queried concurrently
+async def get_dashboard(request):
+    args = request.query_params
+    requested = args.get("panels")
+    if requested:
+        names = [name.strip() for name in requested.split(",") if name.strip()]
+        unknown = [name for name in names if name not in DASHBOARD_PANELS]
+        if unknown:
+            return json_response({"error": f"Unknown panels: {', '.join(unknown)}"}, 400)
+    else:
+        names = [name for name in DASHBOARD_PANELS if name != "user-stats" or "user_id" in args]
+
+    started = time.perf_counter()
+    panels, timings, pending = {}, {}, {}
+    for name in names:
+        panel, param_names = DASHBOARD_PANELS[name]
+        params = {key: args[key] for key in param_names if key in args}
+        if name == "user-stats" and "user_id" not in params:
+            panels[name], timings[name] = {"error": "user_id is required for user-stats"}, 0.0
+            continue
+        pending[name] = timed_panel(panel, params)
+    for name, (data, elapsed) in zip(pending, await asyncio.gather(*pending.values())):
+        panels[name], timings[name] = data, elapsed
+    return json_response({
+        "panels": {name: panels[name] for name in names},
+        "timings_ms": {name: timings[name] for name in names},
+        "total_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
+
+async def invalidate_cache(request):
+    # Refused unless a token is configured, so anyone who can reach the API
+    # cannot flush the caches
+    if not CACHE_INVALIDATE_TOKEN:
+        return json_response({"error": "Cache invalidation is disabled; set CACHE_INVALIDATE_TOKEN"}, 403)
+    if request.headers.get("X-Invalidate-Token") != CACHE_INVALIDATE_TOKEN:
+        return json_response({"error": "Forbidden"}, 403)
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = {}
+    tables = payload.get("tables") if isinstance(payload, dict) else None
+    dropped = result_cache.invalidate(tables)
+    if tables is None or set(tables) & set(CACHED_ENDPOINTS["revenue-trends"][0]):
+        dropped += revenue_cache.invalidate()
+    logger.info("Cache invalidated for %s (%d entries dropped)", tables or "all tables", dropped)
+    return json_response({"invalidated": dropped, "cache": result_cache.snapshot()})
+
+@asynccontextmanager
+async def lifespan(app):
+    await pool.open()
+    try:
+        yield
+    finally:
+        await pool.close()
+
+middleware = [Middleware(CORSMiddleware, allow_origins=["*"], expose_headers=["X-Next-Cursor"])]
+if COMPRESSION_ENABLED:
+    middleware.append(Middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES))
+
+app = Starlette(
+    routes=[
+        Route("/api/subscriptions", list_endpoint(subscriptions_panel)),
+        Route("/api/top-content", list_endpoint(top_content_panel)),
+        Route("/api/revenue-trends", list_endpoint(revenue_trends_panel)),
+        Route("/api/payments-trend", list_endpoint(payments_trend_panel)),
+        Route("/api/watch-history-genre", list_endpoint(watch_history_genre_panel)),
+        Route("/api/user-stats/{user_id}", get_user_stats),
+        Route("/api/recommendations/{user_id}", get_recommendations),
+        Route("/api/popular-content-trend", get_popular_content_trend),
+        Route("/api/payment-method-distribution", list_endpoint(payment_method_distribution_panel)),
+        Route("/api/dashboard", get_dashboard),
+        Route("/api/cache/invalidate", invalidate_cache, methods=["POST"]),
+    ],
+    middleware=middleware,
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "8000")))
@@ -1,7 +1,187 @@
 import psycopg2
 import os
+import threading
+import time
+from contextlib import contextmanager
 
-def get_connection():
+# Pool configuration (override through environment variables)
+POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX", "5"))
+POOL_WAIT_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+# Connections idle for longer than this are pinged with SELECT 1 before reuse
+POOL_HEALTHCHECK_IDLE = float(os.environ.get("DB_POOL_HEALTHCHECK_IDLE", "30"))
+
+def connection_url():
     db_url = os.environ["DATABASE_URL"]
     ssl_cert_path = os.environ["SSL_CERT_PATH"]
-    return psycopg2.connect(f"{db_url}&sslrootcert={ssl_cert_path}")
\ No newline at end of file
+    return f"{db_url}&sslrootcert={ssl_cert_path}"
+
+def get_connection():
+    return psycopg2.connect(connection_url())
+
+class PoolTimeout(Exception):
+    pass
+
+# Process-wide pool shared by every request served from this process
+# (warm Lambda invocations and the local app.run server alike)
+class ConnectionPool:
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_WAIT_TIMEOUT):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._last_used = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self.stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "connections_discarded": 0,
+            "healthcheck_failures": 0,
+        }
+
+    def _open(self):
+        connection = get_connection()
+        # The API only reads, so skip the BEGIN/ROLLBACK round trips
+        connection.autocommit = True
+        with self._lock:
+            self.stats["connections_opened"] += 1
+        return connection
+
+    def prefill(self):
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._open()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                raise
+            self.release(connection)
+
+    def _is_healthy(self, connection):
+        if connection.closed:
+            return False
+        idle_for = time.monotonic() - self._last_used.get(id(connection), 0)
+        if idle_for < POOL_HEALTHCHECK_IDLE:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            with self._lock:
+                self.stats["healthcheck_failures"] += 1
+            return False
+
+    def acquire(self):
+        started = time.monotonic()
+        waited = False
+        with self._lock:
+            while not self._idle and self._size >= self.max_size:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.stats["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._available.wait(remaining)
+            if self._idle:
+                connection = self._idle.pop()
+            else:
+                connection = None
+                self._size += 1
+            self.stats["checkouts"] += 1
+            if waited:
+                wait_time = time.monotonic() - started
+                self.stats["waits"] += 1
+                self.stats["wait_seconds_total"] += wait_time
+                self.stats["wait_seconds_max"] = max(self.stats["wait_seconds_max"], wait_time)
+
+        # Health check (or open) outside the lock so other threads are not blocked
+        if connection is not None and not self._is_healthy(connection):
+            self._close(connection)
+            connection = None
+        if connection is None:
+            try:
+                connection = self._open()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._available.notify()
+                raise
+        return connection
+
+    def release(self, connection, broken=False):
+        if broken or connection.closed:
+            self.discard(connection)
+            return
+        with self._lock:
+            self._last_used[id(connection)] = time.monotonic()
+            self._idle.append(connection)
+            self._available.notify()
+
+    def _close(self, connection):
+        with self._lock:
+            self._last_used.pop(id(connection), None)
+            self.stats["connections_discarded"] += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    # Drop a broken connection; the next checkout opens a fresh one
+    def discard(self, connection):
+        self._close(connection)
+        with self._lock:
+            self._size -= 1
+            self._available.notify()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=self._size, idle=len(self._idle),
+                        in_use=self._size - len(self._idle), max_size=self.max_size)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+# Check a connection out of the process-wide pool for the duration of a block.
+# Connections that fail with a connection-level error are recycled instead of returned.
+@contextmanager
+def pooled_connection():
+    connection_pool = get_pool()
+    connection = connection_pool.acquire()
+    broken = False
+    try:
+        yield connection
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        connection_pool.release(connection, broken=broken or connection.closed)
+
+def pool_stats():
+    return get_pool().snapshot()
+
+if __name__ == "__main__":
+    get_pool().prefill()
+    with pooled_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT now()")
+            print("Connection successful. Current time:", cursor.fetchone())
+    print("Pool stats:", pool_stats())
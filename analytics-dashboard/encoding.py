@@ -0,0 +1,74 @@
+import os
+import gzip
+
+# Response encodings for the endpoints that return a list of rows. Rows are
+# JSON objects by default; clients can instead ask for one array per column
+# (the key names are sent once instead of on every row) or for an Apache
+# Arrow IPC stream, either with ?format=json|columns|arrow or with the Accept
+# header. Pyarrow and brotli are optional: without pyarrow Arrow requests get
+# 406, without brotli responses fall back to gzip.
+JSON_MIMETYPE = "application/json"
+COLUMNS_MIMETYPE = "application/vnd.streaming.columns+json"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+FORMATS = {"json": JSON_MIMETYPE, "columns": COLUMNS_MIMETYPE, "arrow": ARROW_MIMETYPE}
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+COMPRESSION_ENABLED = os.environ.get("RESPONSE_COMPRESSION", "1") != "0"
+
+class NotAcceptable(Exception):
+    pass
+
+# Pick the row encoding from ?format= or, failing that, the Accept header.
+# Plain JSON wins ties (e.g. "Accept: */*").
+def negotiate(args, accept_mimetypes):
+    name = args.get("format")
+    if name:
+        if name not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        return name
+    best = accept_mimetypes.best_match(list(FORMATS.values()), default=JSON_MIMETYPE)
+    return next(name for name, mimetype in FORMATS.items() if mimetype == best)
+
+# [{"a": 1, "b": 2}, {"a": 3, "b": 4}] -> {"a": [1, 3], "b": [2, 4]}
+def to_columns(rows):
+    if not rows:
+        return {}
+    return {key: [row[key] for row in rows] for key in rows[0]}
+
+def to_arrow(rows):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise NotAcceptable("Arrow output needs pyarrow installed on the server")
+    table = pa.Table.from_pylist(rows)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+# Compress a finished response in place with br or gzip, whichever the client
+# accepts (br preferred). Streamed responses (NDJSON) are left alone.
+def compress_response(response, accept_encodings):
+    if (not COMPRESSION_ENABLED or response.is_streamed or response.direct_passthrough
+            or response.status_code != 200 or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    brotli = _brotli()
+    if brotli and accept_encodings["br"]:
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers["Content-Encoding"] = "br"
+    elif accept_encodings["gzip"]:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
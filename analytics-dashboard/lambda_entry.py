@@ -0,0 +1,82 @@
+import time
+
+INIT_STARTED = time.perf_counter()
+
+import os
+import json
+import logging
+from urllib.parse import urlencode
+import awsgi
+from db_connection import get_pool
+from app import app
+from encoding import ARROW_MIMETYPE
+
+# AWS Lambda entry point (handler: lambda_entry.handler). Everything below runs
+# once per container during the init phase: the Flask app is imported and the
+# first database connection is opened, so warm invocations only pay for the
+# request itself. app.lambda_handler forwards here for older deployments.
+#
+# Flask, flask_cors, awsgi and the app are imported eagerly on purpose: every
+# invocation needs them, and Lambda runs the init phase before the first
+# request is routed (with full CPU, and ahead of time under provisioned
+# concurrency), so deferring them would only move their cost into the first
+# request's latency. What only some requests need stays lazy in the app
+# itself: numpy and the sketches for approx=true, the memory backend,
+# pyarrow and brotli for the response encodings, and the live-feed thread.
+
+# Arrow and compressed bodies are binary, so they go back to API Gateway
+# base64-encoded; plain JSON is returned as text
+class StartResponse(awsgi.StartResponse_GW):
+    def use_binary_response(self, headers, body):
+        return "Content-Encoding" in headers or super().use_binary_response(headers, body)
+
+logger = logging.getLogger("lambda_entry")
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO"))
+
+def _log(**fields):
+    logger.info(json.dumps(fields))
+
+# Open the pool's first connection(s) now; a database outage must not fail the
+# init phase, the pool retries on the first request instead
+prefill_started = time.perf_counter()
+try:
+    get_pool().prefill()
+except Exception as e:
+    logger.warning("Connection prefill failed: %s", e)
+PREFILL_MS = round((time.perf_counter() - prefill_started) * 1000, 2)
+INIT_MS = round((time.perf_counter() - INIT_STARTED) * 1000, 2)
+_log(phase="init", init_ms=INIT_MS, prefill_ms=PREFILL_MS)
+
+_cold_start = True
+
+def _bad_request(message):
+    return {"statusCode": 400, "body": json.dumps({"error": message})}
+
+def handler(event, context):
+    global _cold_start
+    started = time.perf_counter()
+    cold_start, _cold_start = _cold_start, False
+
+    request_context = event.get("requestContext") or {}
+    if "http" in request_context:  # HTTP API (v2)
+        event["httpMethod"] = request_context["http"]["method"]
+        event["path"] = event["rawPath"]
+        # rawQueryString is already URL-encoded: hand it to Flask untouched
+        # instead of splitting and re-encoding it
+        query_string = event.get("rawQueryString") or ""
+    elif "httpMethod" in event:  # REST API (v1)
+        query_string = urlencode(event.get("multiValueQueryStringParameters")
+                                 or event.get("queryStringParameters") or {}, doseq=True)
+    else:
+        return _bad_request("Unsupported event: expected an API Gateway HTTP or REST request")
+    event.setdefault("queryStringParameters", None)
+
+    environ = awsgi.environ(event, context)
+    environ["QUERY_STRING"] = query_string
+    start_response = StartResponse(base64_content_types={ARROW_MIMETYPE})
+    result = start_response.response(app(environ, start_response))
+
+    _log(phase="invoke", cold_start=cold_start, method=event["httpMethod"], path=event["path"],
+         status=start_response.status, handler_ms=round((time.perf_counter() - started) * 1000, 2),
+         init_ms=INIT_MS if cold_start else None)
+    return result
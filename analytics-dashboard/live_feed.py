@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import queue
+import threading
+import logging
+import itertools
+
+# Server-Sent Events feed behind /api/stream. One background thread per
+# process reads data_versions every LIVE_POLL_SECONDS; when a table a channel
+# depends on has a new version, the channel's aggregate is read again (from
+# the rollups, a few hundred rows) and only the keys whose values changed are
+# pushed to every connected client. The database sees one tiny query per
+# poll however many dashboards are connected.
+LIVE_POLL_SECONDS = float(os.environ.get("LIVE_POLL_SECONDS", "1"))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get("LIVE_HEARTBEAT_SECONDS", "15"))
+# Events buffered per client; a client that falls further behind is dropped
+# and resynchronizes when it reconnects
+LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", "256"))
+
+logger = logging.getLogger(__name__)
+
+def _format(event_id, event, data, dumps):
+    return f"id: {event_id}\nevent: {event}\ndata: {dumps(data)}\n\n"
+
+class LiveFeed:
+    # read_versions() -> {table: version}; channels: {event: (tables, read,
+    # value_column)} where read() -> {key: row or [rows]}. With a
+    # value_column, changed rows carry "delta", the change of that column
+    # since the previous push.
+    def __init__(self, read_versions, channels, dumps=json.dumps):
+        self.read_versions = read_versions
+        self.channels = channels
+        self.dumps = dumps
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._versions = None
+        self._state = {}
+        self._ids = itertools.count(1)
+
+    def _changes(self, name):
+        tables, read, value_column = self.channels[name]
+        current = read()
+        previous = self._state.get(name, {})
+        self._state[name] = current
+        changed = []
+        for key, value in current.items():
+            if previous.get(key) == value:
+                continue
+            if isinstance(value, list):
+                changed.extend(value)
+            else:
+                row = dict(value)
+                if value_column:
+                    old = previous.get(key, {}).get(value_column, 0)
+                    row["delta"] = round(row[value_column] - old, 2)
+                changed.append(row)
+        removed = [key for key in previous if key not in current]
+        return {"changed": changed, "removed": removed} if changed or removed else None
+
+    def poll(self):
+        versions = self.read_versions()
+        if self._versions is None:
+            # First poll: remember the current aggregates without pushing them
+            for name in self.channels:
+                self._changes(name)
+        else:
+            updated = {table for table, version in versions.items() if self._versions.get(table) != version}
+            for name, (tables, _, _) in self.channels.items():
+                if updated & set(tables):
+                    changes = self._changes(name)
+                    if changes:
+                        self._publish(name, changes)
+        self._versions = versions
+
+    def _publish(self, event, data):
+        message = _format(next(self._ids), event, data, self.dumps)
+        with self._lock:
+            for subscriber in list(self._subscribers):
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    self._subscribers.discard(subscriber)
+                    with subscriber.mutex:
+                        subscriber.queue.clear()
+                    subscriber.put_nowait(None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody listening: stop, and start from a fresh baseline
+                    # when the next client connects
+                    self._thread, self._versions, self._state = None, None, {}
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Live feed poll failed: %s", e)
+            time.sleep(LIVE_POLL_SECONDS)
+
+    # Generator of SSE messages for one client, until it disconnects
+    def stream(self):
+        subscriber = queue.Queue(maxsize=LIVE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+                self._thread.start()
+        try:
+            yield f"retry: {int(LIVE_POLL_SECONDS * 1000)}\n\n"
+            yield _format(0, "ready", {"channels": list(self.channels)}, self.dumps)
+            while True:
+                try:
+                    message = subscriber.get(timeout=LIVE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "running": self._thread is not None}
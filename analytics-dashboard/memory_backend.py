@@ -0,0 +1,432 @@
+import os
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+import numpy as np
+from db_connection import pooled_connection
+from queries import encode_cursor, decode_cursor, PAGE_SIZE, USER_STATS_SECTIONS, TREND_GRANULARITIES, MAX_TOP_N
+
+# In-process analytics backend (ANALYTICS_BACKEND=memory). The six base tables
+# are loaded once into NumPy column arrays; string columns with few distinct
+# values (plan name, title, genre, method) are stored as integer codes into a
+# list of categories. Every aggregate the API serves is then a vectorized
+# group-by over those arrays instead of a round trip to the database.
+#
+# New rows are picked up incrementally: each table remembers the highest id it
+# has loaded and a refresh only reads rows above it. Updates and deletes of
+# existing rows are not seen until the process restarts, which matches how the
+# ingestion scripts use the tables (append only). On CockroachDB, ids from
+# unique_rowid() are only roughly ordered across nodes, so a row committed late
+# with a lower id than one already loaded is skipped as well.
+
+REFRESH_SECONDS = float(os.environ.get("ANALYTICS_REFRESH_SECONDS", "5"))
+LOAD_BATCH_SIZE = int(os.environ.get("ANALYTICS_LOAD_BATCH_SIZE", "50000"))
+
+# table -> {column: kind}; the first column is the id used as the watermark
+TABLES = {
+    "subscriptions": {"subscription_id": "int", "name": "category", "price": "float"},
+    "users": {"user_id": "int", "subscription_id": "int"},
+    "content": {"content_id": "int", "title": "category", "genre": "category", "rating": "float"},
+    "watchhistory": {"watch_id": "int", "user_id": "int", "content_id": "int", "watched_on": "time",
+                     "progress": "float"},
+    "reviews": {"review_id": "int", "user_id": "int", "content_id": "int", "rating": "float"},
+    "paymenthistory": {"payment_id": "int", "user_id": "int", "amount": "float", "payment_date": "time",
+                       "method": "category"},
+}
+
+# Append-only dictionary for one categorical column: codes handed out stay
+# valid in every snapshot
+class Categories:
+    def __init__(self):
+        self.values = []
+        self._index = {}
+
+    def encode(self, values):
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            code = self._index.get(value)
+            if code is None:
+                code = self._index[value] = len(self.values)
+                self.values.append(value)
+            codes[i] = code
+        return codes
+
+    def decode(self, codes):
+        return np.array(self.values, dtype=object)[codes]
+
+    # Position of each category in sorted order, for ORDER BY title tie-breaks
+    def sort_rank(self):
+        values = np.array(["" if value is None else value for value in self.values], dtype=object)
+        rank = np.empty(len(values), dtype=np.int64)
+        rank[np.argsort(values, kind="stable")] = np.arange(len(values))
+        return rank
+
+def _to_array(values, kind, categories):
+    if kind == "int":
+        return np.fromiter((-1 if value is None else value for value in values), dtype=np.int64,
+                           count=len(values))
+    if kind == "float":
+        return np.array(values, dtype=np.float64)  # None -> nan
+    if kind == "time":
+        return np.array(values, dtype="datetime64[us]")  # None -> NaT
+    return categories.encode(values) if values else np.empty(0, dtype=np.int32)
+
+def _datetimes(values):
+    return values.astype("datetime64[us]").tolist()
+
+# DATE_TRUNC('week', ...): 1970-01-01 was a Thursday, so Mondays are 3 days off
+def _week_start(times):
+    days = times.astype("datetime64[D]").astype(np.int64)
+    return (days - (days + 3) % 7).astype("datetime64[D]")
+
+def _bucket(times, granularity):
+    if granularity == "day":
+        return times.astype("datetime64[D]")
+    if granularity == "week":
+        return _week_start(times)
+    return times.astype("datetime64[M]")
+
+# Group rows by one integer key: (distinct keys, count or sum per key)
+def _group(keys, weights=None):
+    distinct, inverse = np.unique(keys, return_inverse=True)
+    return distinct, np.bincount(inverse, weights=weights, minlength=len(distinct))
+
+# Count rows per (bucket, title code) and sort like
+# ORDER BY bucket, watch_count DESC, title
+def _bucket_title_counts(buckets, titles, title_rank, title_count):
+    bucket_ids = buckets.astype(np.int64)
+    keys, counts = _group(bucket_ids * title_count + titles)
+    bucket_ids, titles = keys // title_count, keys % title_count
+    order = np.lexsort((title_rank[titles], -counts, bucket_ids))
+    return bucket_ids[order], titles[order], counts[order]
+
+# Rows up to and including the current one within each bucket, 1-based
+def _rank_within(bucket_ids):
+    starts = np.r_[0, np.flatnonzero(bucket_ids[1:] != bucket_ids[:-1]) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(bucket_ids)]))
+    return np.arange(len(bucket_ids)) - group_start + 1
+
+# One immutable generation of the column arrays. Derived arrays (the content
+# row of each watch, monthly title counts...) are computed on first use and
+# kept for the lifetime of the snapshot.
+class Snapshot:
+    def __init__(self, columns, categories, watermarks):
+        self.columns = columns
+        self.categories = categories
+        self.watermarks = watermarks
+        self.loaded_at = time.time()
+        self._derived = {}
+        # Reentrant: a derived array may be computed from another one
+        self._lock = threading.RLock()
+
+    def table(self, name):
+        return self.columns[name]
+
+    def derived(self, key, compute):
+        value = self._derived.get(key)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = self._derived[key] = compute()
+        return value
+
+    # Row of `ids` in the table keyed by `id_column` (ids are loaded in
+    # ascending order); -1 where there is no such row
+    def lookup(self, table, id_column, ids):
+        table_ids = self.columns[table][id_column]
+        if len(table_ids) == 0:
+            return np.full(len(ids), -1)
+        positions = np.minimum(np.searchsorted(table_ids, ids), len(table_ids) - 1)
+        return np.where(table_ids[positions] == ids, positions, -1)
+
+    def rows(self):
+        return {name: len(next(iter(columns.values()))) for name, columns in self.columns.items()}
+
+class MemoryBackend:
+    def __init__(self, refresh_seconds=REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.categories = {(table, column): Categories()
+                           for table, columns in TABLES.items()
+                           for column, kind in columns.items() if kind == "category"}
+        self.snapshot = None
+        self._refreshed_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+    # Read the rows above each table's watermark through a server-side cursor
+    def _load(self, connection, table, watermark):
+        columns = TABLES[table]
+        id_column = next(iter(columns))
+        arrays = {column: [] for column in columns}
+        with connection.cursor(name=f"load_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = LOAD_BATCH_SIZE
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {id_column} > %s "
+                           f"ORDER BY {id_column}", (watermark,))
+            while True:
+                rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+                if not rows:
+                    break
+                for column, values in zip(columns, zip(*rows)):
+                    arrays[column].append(_to_array(values, columns[column],
+                                                     self.categories.get((table, column))))
+        return {column: np.concatenate(chunks) if chunks else _to_array((), columns[column], None)
+                for column, chunks in arrays.items()}
+
+    def _refresh(self):
+        previous = self.snapshot
+        columns, watermarks, loaded = {}, {}, 0
+        with pooled_connection() as connection:
+            # Named cursors only exist inside a transaction
+            connection.autocommit = False
+            try:
+                for table, table_columns in TABLES.items():
+                    id_column = next(iter(table_columns))
+                    watermark = previous.watermarks[table] if previous else -1
+                    new = self._load(connection, table, watermark)
+                    loaded += len(new[id_column])
+                    if previous is None:
+                        columns[table] = new
+                    elif len(new[id_column]) == 0:
+                        columns[table] = previous.columns[table]
+                    else:
+                        columns[table] = {column: np.concatenate((previous.columns[table][column], new[column]))
+                                          for column in table_columns}
+                    ids = columns[table][id_column]
+                    watermarks[table] = int(ids[-1]) if len(ids) else watermark
+            finally:
+                connection.rollback()
+                connection.autocommit = True
+        # Without new rows the current snapshot (and its derived arrays) stays
+        if previous is None or loaded:
+            self.snapshot = Snapshot(columns, self.categories, watermarks)
+        self._refreshed_at = time.monotonic()
+        return loaded
+
+    # Load the rows added since the last refresh; returns how many there were
+    def refresh(self):
+        with self._refresh_lock:
+            return self._refresh()
+
+    # The first load blocks every request; after that the snapshot is
+    # refreshed once it is older than refresh_seconds, by whichever request
+    # notices first, while concurrent requests keep reading the current one
+    def current(self):
+        if self.snapshot is None:
+            with self._refresh_lock:
+                if self.snapshot is None:
+                    self._refresh()
+        elif time.monotonic() - self._refreshed_at >= self.refresh_seconds and \
+                self._refresh_lock.acquire(blocking=False):
+            try:
+                self._refresh()
+            finally:
+                self._refresh_lock.release()
+        return self.snapshot
+
+    # Stand-in for queries.fetch_* and stream_*: same name, same arguments
+    # minus the cursor or connection
+    def query(self, name, *args):
+        return getattr(self, name)(self.current(), *args)
+
+    # Content row of every watch and its title code
+    def _watch_titles(self, snapshot):
+        def compute():
+            watches = snapshot.table("watchhistory")
+            positions = snapshot.lookup("content", "content_id", watches["content_id"])
+            return np.where(positions >= 0, snapshot.table("content")["title"][positions], -1)
+        return snapshot.derived("watch_titles", compute)
+
+    def fetch_subscriptions(self, snapshot):
+        users, plans = snapshot.table("users"), snapshot.table("subscriptions")
+        positions = snapshot.lookup("subscriptions", "subscription_id", users["subscription_id"])
+        names = self.categories[("subscriptions", "name")]
+        counts = np.bincount(plans["name"][positions[positions >= 0]], minlength=len(names.values))
+        return [{"subscription": names.values[code], "user_count": int(counts[code])}
+                for code in np.flatnonzero(counts)]
+
+    def fetch_top_content(self, snapshot):
+        content = snapshot.table("content")
+        ratings = content["rating"]
+        # NaN ratings sort last
+        top = np.argsort(np.where(np.isnan(ratings), np.inf, -ratings), kind="stable")[:10]
+        titles = self.categories[("content", "title")].decode(content["title"][top])
+        genres = self.categories[("content", "genre")].decode(content["genre"][top])
+        return [{"title": title, "genre": genre,
+                 "rating": None if np.isnan(rating) else Decimal(f"{rating:.1f}")}
+                for title, genre, rating in zip(titles, genres, ratings[top])]
+
+    def fetch_revenue_trends(self, snapshot, start_date, end_date):
+        payments = snapshot.table("paymenthistory")
+        days = payments["payment_date"].astype("datetime64[D]")
+        mask = (days >= np.datetime64(start_date, "D")) & (days <= np.datetime64(end_date, "D"))
+        distinct, revenue = _group(days[mask].astype(np.int64), payments["amount"][mask])
+        return [{"date": str(day), "revenue": round(float(total), 2)}
+                for day, total in zip(distinct.astype("datetime64[D]"), revenue)]
+
+    def fetch_payments_trend(self, snapshot):
+        payments = snapshot.table("paymenthistory")
+        valid = ~np.isnat(payments["payment_date"])
+        weeks, revenue = _group(_week_start(payments["payment_date"][valid]).astype(np.int64),
+                                payments["amount"][valid])
+        return [{"week": week, "total_revenue": round(float(total), 2)}
+                for week, total in zip(_datetimes(weeks.astype("datetime64[D]")), revenue)]
+
+    def fetch_watch_history_genre(self, snapshot):
+        watches = snapshot.table("watchhistory")
+        positions = snapshot.lookup("content", "content_id", watches["content_id"])
+        genres = self.categories[("content", "genre")]
+        counts = np.bincount(snapshot.table("content")["genre"][positions[positions >= 0]],
+                             minlength=len(genres.values))
+        order = np.argsort(-counts, kind="stable")
+        return [{"genre": genres.values[code], "watch_count": int(counts[code])}
+                for code in order if counts[code]]
+
+    # Rows of one user, newest first, after an optional (time, id) keyset cursor
+    def _user_rows(self, table, time_column, id_column, user_id, after):
+        rows = np.flatnonzero(table["user_id"] == int(user_id))
+        times, ids = table[time_column][rows], table[id_column][rows]
+        if after:
+            after_time, after_id = decode_cursor(after, 2)
+            if after_time is None:
+                keep = np.isnat(times) & (ids < int(after_id))
+            else:
+                after_time = np.datetime64(after_time, "us")
+                keep = (times < after_time) | ((times == after_time) & (ids < int(after_id))) | np.isnat(times)
+            rows, times, ids = rows[keep], times[keep], ids[keep]
+        # Rows without a time last, as in the SQL queries (DESC NULLS LAST)
+        return rows[np.lexsort((-ids, -times.astype(np.int64), np.isnat(times)))]
+
+    def _user_page(self, table, time_column, id_column, user_id, limit, after, shape):
+        rows = self._user_rows(table, time_column, id_column, user_id, after)
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(_datetimes(table[time_column][last]), int(table[id_column][last]))
+        return shape(page), next_cursor
+
+    def _watch_rows(self, snapshot, rows):
+        watches = snapshot.table("watchhistory")
+        titles = self.categories[("content", "title")].decode(self._watch_titles(snapshot)[rows])
+        return [{"title": title, "progress": float(progress), "watched_on": watched_on}
+                for title, progress, watched_on in zip(titles, watches["progress"][rows],
+                                                       _datetimes(watches["watched_on"][rows]))]
+
+    def _payment_rows(self, snapshot, rows):
+        payments = snapshot.table("paymenthistory")
+        methods = self.categories[("paymenthistory", "method")].decode(payments["method"][rows])
+        return [{"amount": float(amount), "method": method, "payment_date": payment_date}
+                for amount, method, payment_date in zip(payments["amount"][rows], methods,
+                                                        _datetimes(payments["payment_date"][rows]))]
+
+    def fetch_user_watch_page(self, snapshot, user_id, limit=PAGE_SIZE, after=None):
+        return self._user_page(snapshot.table("watchhistory"), "watched_on", "watch_id", user_id, limit, after,
+                               lambda rows: self._watch_rows(snapshot, rows))
+
+    def fetch_user_payment_page(self, snapshot, user_id, limit=PAGE_SIZE, after=None):
+        return self._user_page(snapshot.table("paymenthistory"), "payment_date", "payment_id", user_id, limit,
+                               after, lambda rows: self._payment_rows(snapshot, rows))
+
+    def fetch_user_stats(self, snapshot, user_id, limit=PAGE_SIZE, watch_cursor=None, payment_cursor=None,
+                         sections=USER_STATS_SECTIONS):
+        result = {"user_id": user_id}
+        if "watch" in sections:
+            result["watch_history"], result["next_watch_cursor"] = self.fetch_user_watch_page(
+                snapshot, user_id, limit, watch_cursor)
+        if "payment" in sections:
+            result["payment_history"], result["next_payment_cursor"] = self.fetch_user_payment_page(
+                snapshot, user_id, limit, payment_cursor)
+        return result
+
+    def stream_user_stats(self, snapshot, user_id):
+        watch_rows = self._user_rows(snapshot.table("watchhistory"), "watched_on", "watch_id", user_id, None)
+        for row in self._watch_rows(snapshot, watch_rows):
+            yield dict(row, type="watch")
+        payment_rows = self._user_rows(snapshot.table("paymenthistory"), "payment_date", "payment_id", user_id,
+                                       None)
+        for row in self._payment_rows(snapshot, payment_rows):
+            yield dict(row, type="payment")
+
+    # (bucket ids, title codes, counts) per bucket and title, in trend order
+    def _title_counts(self, snapshot, granularity, month_range=None):
+        def compute():
+            watched_on = snapshot.table("watchhistory")["watched_on"]
+            titles = self._watch_titles(snapshot)
+            valid = ~np.isnat(watched_on) & (titles >= 0)
+            if month_range:
+                valid &= (watched_on >= month_range[0]) & (watched_on < month_range[1])
+            title_categories = self.categories[("content", "title")]
+            return _bucket_title_counts(_bucket(watched_on[valid], granularity), titles[valid],
+                                        title_categories.sort_rank(), max(len(title_categories.values), 1))
+        return snapshot.derived(("title_counts", granularity, month_range), compute)
+
+    def _trend_rows(self, snapshot, rows):
+        months, titles, counts = self._title_counts(snapshot, "month")
+        names = self.categories[("content", "title")].decode(titles[rows])
+        return [{"month": month, "title": title, "watch_count": int(count)}
+                for month, title, count in zip(_datetimes(months[rows].astype("datetime64[M]")), names,
+                                               counts[rows])]
+
+    def fetch_popular_content_trend(self, snapshot, limit=PAGE_SIZE, after=None):
+        months, titles, counts = self._title_counts(snapshot, "month")
+        rows = np.arange(len(months))
+        if after:
+            month, watch_count, title = decode_cursor(after, 3)
+            month = np.datetime64(month, "M").astype(np.int64)
+            names = self.categories[("content", "title")].decode(titles)
+            keep = (months > month) | ((months == month) & ((counts < watch_count) |
+                                                            ((counts == watch_count) & (names > title))))
+            rows = rows[keep]
+        rows = rows[:limit + 1]
+        next_cursor = None
+        if len(rows) > limit:
+            last = self._trend_rows(snapshot, rows[limit - 1:limit])[0]
+            next_cursor = encode_cursor(last["month"], last["watch_count"], last["title"])
+        return self._trend_rows(snapshot, rows[:limit]), next_cursor
+
+    def stream_popular_content_trend(self, snapshot):
+        months = self._title_counts(snapshot, "month")[0]
+        for start in range(0, len(months), LOAD_BATCH_SIZE):
+            yield from self._trend_rows(snapshot, np.arange(start, min(start + LOAD_BATCH_SIZE, len(months))))
+
+    def fetch_popular_content_top(self, snapshot, n=10, granularity="month", month=None):
+        if granularity not in TREND_GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(TREND_GRANULARITIES)}")
+        if not 1 <= n <= MAX_TOP_N:
+            raise ValueError(f"n must be between 1 and {MAX_TOP_N}")
+        month_range = None
+        if month:
+            try:
+                month_start = datetime.strptime(month, "%Y-%m")
+            except ValueError:
+                raise ValueError("month must be formatted as YYYY-MM")
+            month_end = (month_start + timedelta(days=32)).replace(day=1)
+            month_range = (np.datetime64(month_start, "us"), np.datetime64(month_end, "us"))
+        buckets, titles, counts = self._title_counts(snapshot, granularity, month_range)
+        ranks = _rank_within(buckets)
+        keep = ranks <= n
+        unit = {"day": "datetime64[D]", "week": "datetime64[D]", "month": "datetime64[M]"}[granularity]
+        names = self.categories[("content", "title")].decode(titles[keep])
+        return [{granularity: bucket, "title": title, "watch_count": int(count), "rank": int(rank)}
+                for bucket, title, count, rank in zip(_datetimes(buckets[keep].astype(unit)), names,
+                                                      counts[keep], ranks[keep])]
+
+    # ETags follow what this process has loaded rather than data_versions, so
+    # they only change once a refresh has picked the new rows up
+    def fetch_data_versions(self, snapshot):
+        return dict(snapshot.watermarks)
+
+    def fetch_payment_method_distribution(self, snapshot):
+        methods = self.categories[("paymenthistory", "method")]
+        counts = np.bincount(snapshot.table("paymenthistory")["method"], minlength=len(methods.values))
+        order = np.argsort(-counts, kind="stable")
+        return [{"method": methods.values[code], "count": int(counts[code])} for code in order if counts[code]]
+
+    def stats(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return {"loaded": False}
+        return {"loaded": True, "rows": snapshot.rows(), "watermarks": snapshot.watermarks,
+                "loaded_at": snapshot.loaded_at}
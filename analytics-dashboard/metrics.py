@@ -0,0 +1,194 @@
+import threading
+import time
+
+# In-process metrics for the API, rendered in the Prometheus text format by
+# /api/metrics. Counters and histograms are keyed by label values; a
+# per-request accumulator (thread-local) collects the numbers written to the
+# structured log line of each request.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+ROWS_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, label_values)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> [bucket counts..., count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, ('le', bound))} {count}")
+                labels = _labels(self.label_names, label_values)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, ('le', '+Inf'))} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-2]}")
+                lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+        return lines
+
+request_duration = Histogram("api_request_duration_seconds", "Time to build a response, per route.",
+                             ("route", "method", "status"))
+response_bytes = Histogram("api_response_bytes", "Response body size as sent (after compression), per route.",
+                           ("route",), BYTES_BUCKETS)
+query_duration = Histogram("db_query_duration_seconds", "SQL execute and fetch time, per query.",
+                           ("query", "phase"))
+query_rows = Histogram("db_query_rows", "Rows returned, per query.", ("query",), ROWS_BUCKETS)
+cache_requests = Counter("api_cache_requests_total", "Result cache lookups, per endpoint and outcome.",
+                         ("endpoint", "result"))
+pool_acquire = Histogram("db_pool_acquire_seconds", "Time spent waiting for a pooled connection.")
+
+REGISTRY = [request_duration, response_bytes, query_duration, query_rows, cache_requests, pool_acquire]
+
+# Per-request accumulator for the structured log line
+_local = threading.local()
+
+def begin_request():
+    _local.current = {"queries": 0, "db_ms": 0.0, "rows": 0, "cache_hits": 0, "cache_misses": 0,
+                      "pool_wait_ms": 0.0}
+    return _local.current
+
+def current_request():
+    return getattr(_local, "current", None)
+
+def end_request():
+    current, _local.current = current_request(), None
+    return current
+
+# Run fn on a worker thread while recording into the calling request's accumulator
+def run_in_request(accumulator, fn, *args):
+    _local.current = accumulator
+    try:
+        return fn(*args)
+    finally:
+        _local.current = None
+
+_accumulator_lock = threading.Lock()
+
+def _add(**amounts):
+    current = current_request()
+    if current is not None:
+        # Panels of one request may record from several threads at once
+        with _accumulator_lock:
+            for key, amount in amounts.items():
+                current[key] += amount
+
+def record_query(name, phase, seconds, rows=None):
+    query_duration.observe(seconds, name, phase)
+    if rows is not None:
+        query_rows.observe(rows, name)
+        _add(rows=rows)
+    _add(db_ms=seconds * 1000, queries=1 if phase == "execute" else 0)
+
+def record_cache(endpoint, hit):
+    cache_requests.inc(endpoint, "hit" if hit else "miss")
+    _add(cache_hits=1 if hit else 0, cache_misses=0 if hit else 1)
+
+def record_pool_acquire(seconds):
+    pool_acquire.observe(seconds)
+    _add(pool_wait_ms=seconds * 1000)
+
+# Cursor wrapper timing execute() and the fetch calls of one named query
+class TimedCursor:
+    def __init__(self, cursor, name):
+        self.cursor = cursor
+        self.name = name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def __getattr__(self, attribute):
+        return getattr(self.cursor, attribute)
+
+    def execute(self, query, params=None):
+        started = time.perf_counter()
+        try:
+            return self.cursor.execute(query, params)
+        finally:
+            record_query(self.name, "execute", time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self.cursor.fetchall()
+        record_query(self.name, "fetch", time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self.cursor.fetchone()
+        record_query(self.name, "fetch", time.perf_counter() - started, 0 if row is None else 1)
+        return row
+
+# Counters owned by the result cache and the connection pool, read at scrape time
+def _snapshot_lines(prefix, snapshot, counters, gauges):
+    lines = []
+    for key in counters:
+        lines += [f"# TYPE {prefix}_{key}_total counter", f"{prefix}_{key}_total {snapshot[key]}"]
+    for key in gauges:
+        lines += [f"# TYPE {prefix}_{key} gauge", f"{prefix}_{key} {snapshot[key]}"]
+    return lines
+
+def render(cache_snapshot, pool_snapshot):
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lookups = cache_snapshot["hits"] + cache_snapshot["misses"]
+    cache_snapshot = dict(cache_snapshot, hit_ratio=cache_snapshot["hits"] / lookups if lookups else 0.0)
+    lines += _snapshot_lines("api_cache", cache_snapshot, ("hits", "misses", "evictions", "invalidations"),
+                             ("entries", "hit_ratio"))
+    lines += _snapshot_lines("db_pool", pool_snapshot,
+                             ("checkouts", "waits", "timeouts", "connections_opened", "connections_discarded",
+                              "healthcheck_failures"),
+                             ("size", "idle", "in_use", "max_size", "wait_seconds_max"))
+    lines += ["# TYPE db_pool_wait_seconds_total counter",
+              f"db_pool_wait_seconds_total {pool_snapshot['wait_seconds_total']:.6f}"]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,352 @@
+# SQL behind each API endpoint. Every fetch_* function runs its query on the
+# given cursor and returns the rows shaped the way the endpoint serves them.
+# Aggregates read the rollup tables maintained by ingestion/rollups.py.
+import os
+import json
+import uuid
+import base64
+from datetime import date, datetime, timedelta
+from shared.scoring import INTERACTION_SCORE
+
+# Base tables each endpoint reads
+ENDPOINT_TABLES = {
+    "subscriptions": ("users", "subscriptions"),
+    "top-content": ("content",),
+    "revenue-trends": ("paymenthistory",),
+    "payments-trend": ("paymenthistory",),
+    "watch-history-genre": ("watchhistory", "content"),
+    "user-stats": ("watchhistory", "paymenthistory", "content"),
+    # content_neighbors is bumped by ingestion/recommendations.py when it
+    # updates the index
+    "recommendations": ("watchhistory", "reviews", "content", "content_neighbors"),
+    "popular-content-trend": ("watchhistory", "content"),
+    "payment-method-distribution": ("paymenthistory",),
+}
+DATA_TABLES = ("subscriptions", "users", "content", "watchhistory", "reviews", "paymenthistory")
+# Seconds the API reuses data_versions before reading it again
+DATA_VERSION_TTL = float(os.environ.get("DATA_VERSION_TTL", "1"))
+
+# Endpoints whose results the API caches: endpoint -> (tables read, TTL seconds)
+CACHED_ENDPOINTS = {
+    "subscriptions": (ENDPOINT_TABLES["subscriptions"], 600),
+    "top-content": (ENDPOINT_TABLES["top-content"], 600),
+    "watch-history-genre": (ENDPOINT_TABLES["watch-history-genre"], 300),
+    "payment-method-distribution": (ENDPOINT_TABLES["payment-method-distribution"], 300),
+    "payments-trend": (ENDPOINT_TABLES["payments-trend"], 300),
+    # Cached per day rather than per query string (result_cache.DayRangeCache)
+    "revenue-trends": (ENDPOINT_TABLES["revenue-trends"], 300),
+    "popular-content-top": (ENDPOINT_TABLES["popular-content-trend"], 300),
+    "data-versions": (DATA_TABLES, DATA_VERSION_TTL),
+}
+
+# Per-table version counters, bumped by ingestion in the transaction that
+# writes the table (ingestion/versions.py); the API derives ETags from them
+def fetch_data_versions(cursor):
+    cursor.execute("SELECT table_name, version FROM data_versions;")
+    return dict(cursor.fetchall())
+
+# Subscription Metrics
+def fetch_subscriptions(cursor):
+    query = """
+        SELECT plan_name, user_count
+        FROM plan_user_counts
+        WHERE user_count > 0;
+    """
+    cursor.execute(query)
+    return [{"subscription": row[0], "user_count": row[1]} for row in cursor.fetchall()]
+
+# Top Content
+def fetch_top_content(cursor):
+    query = "SELECT title, genre, rating FROM content ORDER BY rating DESC LIMIT 10;"
+    cursor.execute(query)
+    return [{"title": row[0], "genre": row[1], "rating": row[2]} for row in cursor.fetchall()]
+
+# Revenue Trends
+def fetch_revenue_trends(cursor, start_date, end_date):
+    query = """
+        SELECT day AS date, revenue
+        FROM revenue_daily
+        WHERE day BETWEEN %s AND %s
+        ORDER BY day;
+    """
+    cursor.execute(query, (start_date, end_date))
+    return [{"date": str(row[0]), "revenue": float(row[1])} for row in cursor.fetchall()]
+
+DEFAULT_REVENUE_RANGE = ("2024-09-01", "2024-09-30")
+
+# ?start_date= / ?end_date= as dates, both inclusive
+def revenue_range(params):
+    days = []
+    for name, default in zip(("start_date", "end_date"), DEFAULT_REVENUE_RANGE):
+        try:
+            days.append(date.fromisoformat(params.get(name, default)))
+        except ValueError:
+            raise ValueError(f"{name} must be formatted as YYYY-MM-DD")
+    return tuple(days)
+
+def revenue_by_day(rows):
+    return {date.fromisoformat(row["date"]): row["revenue"] for row in rows}
+
+# ?total=true: the range's revenue as a single row
+def revenue_total_row(start, end, total):
+    return {"start_date": str(start), "end_date": str(end), "revenue": round(total, 2)}
+
+# Payments Trend (weekly)
+def fetch_payments_trend(cursor):
+    query = """
+        SELECT week, revenue AS total_revenue
+        FROM revenue_weekly
+        ORDER BY week;
+    """
+    cursor.execute(query)
+    return [{"week": row[0], "total_revenue": float(row[1])} for row in cursor.fetchall()]
+
+# Watch History by Genre ('' is the rollup's key for content without a genre)
+def fetch_watch_history_genre(cursor):
+    query = """
+        SELECT NULLIF(genre, ''), watch_count
+        FROM watch_genre_counts
+        ORDER BY watch_count DESC;
+    """
+    cursor.execute(query)
+    return [{"genre": row[0], "watch_count": row[1]} for row in cursor.fetchall()]
+
+# Keyset pagination: a page is LIMIT n rows after the last row of the previous
+# page, identified by an opaque cursor encoding that row's sort key
+PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", "500"))
+MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", "5000"))
+# Rows fetched per round trip when streaming from a server-side cursor
+STREAM_FETCH_SIZE = int(os.environ.get("API_STREAM_FETCH_SIZE", "1000"))
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+def decode_cursor(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def page_limit(value):
+    if value is None:
+        return PAGE_SIZE
+    if not str(value).isdigit() or not 1 <= int(value) <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return int(value)
+
+# Fetch limit + 1 rows to learn whether another page follows
+def _page(cursor, query, params, limit, shape, sort_key):
+    cursor.execute(query, params + (limit + 1,))
+    rows = cursor.fetchall()
+    next_cursor = encode_cursor(*sort_key(rows[limit - 1])) if len(rows) > limit else None
+    return [shape(row) for row in rows[:limit]], next_cursor
+
+# Iterate a query through a server-side (named) cursor, STREAM_FETCH_SIZE rows
+# at a time, so rows can be sent as they arrive instead of materialized first
+def _stream(connection, query, params, shape):
+    with connection.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+        cursor.itersize = STREAM_FETCH_SIZE
+        cursor.execute(query, params)
+        for row in cursor:
+            yield shape(row)
+
+# User-Specific Stats (newest first, keyset on (watched_on, watch_id) and (payment_date, payment_id)).
+# Rows without a time come last on both PostgreSQL and CockroachDB.
+WATCH_HISTORY_QUERY = """
+    SELECT c.title, w.progress, w.watched_on, w.watch_id
+    FROM watchhistory w
+    JOIN content c ON w.content_id = c.content_id
+    WHERE w.user_id = %s {after}
+    ORDER BY w.watched_on DESC NULLS LAST, w.watch_id DESC
+"""
+PAYMENT_HISTORY_QUERY = """
+    SELECT amount, method, payment_date, payment_id
+    FROM paymenthistory
+    WHERE user_id = %s {after}
+    ORDER BY payment_date DESC NULLS LAST, payment_id DESC
+"""
+USER_STATS_SECTIONS = ("watch", "payment")
+
+def _watch_row(row):
+    return {"title": row[0], "progress": float(row[1]), "watched_on": row[2]}
+
+def _payment_row(row):
+    return {"amount": float(row[0]), "method": row[1], "payment_date": row[2]}
+
+# Rows after a (time, id) cursor in "time DESC NULLS LAST, id DESC" order. A
+# row comparison alone would never match the rows without a time.
+def _after_recent(time_column, id_column, after):
+    after_time, after_id = decode_cursor(after, 2)
+    if after_time is None:
+        return f"AND {time_column} IS NULL AND {id_column} < %s", (after_id,)
+    return (f"AND (({time_column}, {id_column}) < (%s, %s) OR {time_column} IS NULL)",
+            (after_time, after_id))
+
+def fetch_user_watch_page(cursor, user_id, limit=PAGE_SIZE, after=None):
+    params = (user_id,)
+    condition = ""
+    if after:
+        condition, after_params = _after_recent("w.watched_on", "w.watch_id", after)
+        params += after_params
+    query = WATCH_HISTORY_QUERY.format(after=condition) + " LIMIT %s"
+    return _page(cursor, query, params, limit, _watch_row, lambda row: (row[2], row[3]))
+
+def fetch_user_payment_page(cursor, user_id, limit=PAGE_SIZE, after=None):
+    params = (user_id,)
+    condition = ""
+    if after:
+        condition, after_params = _after_recent("payment_date", "payment_id", after)
+        params += after_params
+    query = PAYMENT_HISTORY_QUERY.format(after=condition) + " LIMIT %s"
+    return _page(cursor, query, params, limit, _payment_row, lambda row: (row[2], row[3]))
+
+def fetch_user_stats(cursor, user_id, limit=PAGE_SIZE, watch_cursor=None, payment_cursor=None,
+                     sections=USER_STATS_SECTIONS):
+    result = {"user_id": user_id}
+    if "watch" in sections:
+        result["watch_history"], result["next_watch_cursor"] = fetch_user_watch_page(
+            cursor, user_id, limit, watch_cursor)
+    if "payment" in sections:
+        result["payment_history"], result["next_payment_cursor"] = fetch_user_payment_page(
+            cursor, user_id, limit, payment_cursor)
+    return result
+
+# Streamed responses are described as (query, params, shape) statements so
+# the Flask app and the async app (asgi_app.py) can run them on their own drivers
+def user_stats_statements(user_id):
+    return [
+        (WATCH_HISTORY_QUERY.format(after=""), (user_id,), lambda row: dict(_watch_row(row), type="watch")),
+        (PAYMENT_HISTORY_QUERY.format(after=""), (user_id,), lambda row: dict(_payment_row(row), type="payment")),
+    ]
+
+def stream_user_stats(connection, user_id):
+    for query, params, shape in user_stats_statements(user_id):
+        yield from _stream(connection, query, params, shape)
+
+# Recommendations: item-item collaborative filtering over the
+# content_neighbors index built by ingestion/recommendations.py. Each content
+# the user watched or rated adds its neighbors' similarities weighted by the
+# user's interaction score (shared/scoring.py); content the user already has
+# is left out.
+MAX_RECOMMENDATIONS = 100
+
+def fetch_recommendations(cursor, user_id, limit=10):
+    if not str(user_id).isdigit():
+        raise ValueError("user_id must be a positive integer")
+    if not 1 <= limit <= MAX_RECOMMENDATIONS:
+        raise ValueError(f"limit must be between 1 and {MAX_RECOMMENDATIONS}")
+    query = f"""
+        SELECT n.neighbor_id, c.title, c.genre, SUM(n.similarity * {INTERACTION_SCORE.format(t="s")}) AS score
+        FROM user_content_scores s
+        JOIN content_neighbors n ON n.content_id = s.content_id
+        JOIN content c ON c.content_id = n.neighbor_id
+        WHERE s.user_id = %s
+          AND NOT EXISTS (
+              SELECT 1 FROM user_content_scores seen
+              WHERE seen.user_id = s.user_id AND seen.content_id = n.neighbor_id
+          )
+        GROUP BY n.neighbor_id, c.title, c.genre
+        ORDER BY score DESC, n.neighbor_id
+        LIMIT %s;
+    """
+    cursor.execute(query, (int(user_id), limit))
+    return [{"content_id": row[0], "title": row[1], "genre": row[2], "score": round(row[3], 4)}
+            for row in cursor.fetchall()]
+
+# Popular Content Over Time (keyset on (month, watch_count DESC, title))
+POPULAR_CONTENT_TREND_QUERY = """
+    SELECT month, title, watch_count
+    FROM watch_monthly_title
+    {after}
+    ORDER BY month, watch_count DESC, title
+"""
+
+def _trend_row(row):
+    return {"month": row[0], "title": row[1], "watch_count": row[2]}
+
+def fetch_popular_content_trend(cursor, limit=PAGE_SIZE, after=None):
+    params = ()
+    condition = ""
+    if after:
+        # month and title are NOT NULL in the rollup (watches without a date
+        # have no month), so plain comparisons cover every row
+        month, watch_count, title = decode_cursor(after, 3)
+        params = (month, month, watch_count, watch_count, title)
+        condition = """
+            WHERE month > %s
+               OR (month = %s AND (watch_count < %s OR (watch_count = %s AND title > %s)))
+        """
+    query = POPULAR_CONTENT_TREND_QUERY.format(after=condition) + " LIMIT %s"
+    return _page(cursor, query, params, limit, _trend_row, lambda row: (row[0], row[2], row[1]))
+
+def popular_content_trend_statements():
+    return [(POPULAR_CONTENT_TREND_QUERY.format(after=""), (), _trend_row)]
+
+def stream_popular_content_trend(connection):
+    for query, params, shape in popular_content_trend_statements():
+        yield from _stream(connection, query, params, shape)
+
+# Top N titles per day/week/month, ranked in the database so only the rows
+# that get plotted leave it. Months come from the watch_monthly_title rollup;
+# days and weeks are aggregated from watchhistory (bounded by ?month= when given).
+TREND_GRANULARITIES = ("day", "week", "month")
+MAX_TOP_N = 100
+# Query parameters of the top-N variant of /api/popular-content-trend
+TOP_N_PARAMS = ("n", "granularity", "month", "approx")
+
+def fetch_popular_content_top(cursor, n=10, granularity="month", month=None):
+    if granularity not in TREND_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(TREND_GRANULARITIES)}")
+    if not 1 <= n <= MAX_TOP_N:
+        raise ValueError(f"n must be between 1 and {MAX_TOP_N}")
+    params = ()
+    if month:
+        try:
+            month_start = datetime.strptime(month, "%Y-%m")
+        except ValueError:
+            raise ValueError("month must be formatted as YYYY-MM")
+        month_end = (month_start + timedelta(days=32)).replace(day=1)
+        params = (month_start, month_end)
+
+    if granularity == "month":
+        query = f"""
+            SELECT bucket, title, watch_count, rank FROM (
+                SELECT month AS bucket, title, watch_count,
+                       ROW_NUMBER() OVER (PARTITION BY month ORDER BY watch_count DESC, title) AS rank
+                FROM watch_monthly_title
+                {"WHERE month >= %s AND month < %s" if month else ""}
+            ) ranked
+            WHERE rank <= %s
+            ORDER BY bucket, rank;
+        """
+    else:
+        query = f"""
+            SELECT bucket, title, watch_count, rank FROM (
+                SELECT DATE_TRUNC('{granularity}', w.watched_on) AS bucket, c.title, COUNT(*) AS watch_count,
+                       ROW_NUMBER() OVER (PARTITION BY DATE_TRUNC('{granularity}', w.watched_on)
+                                          ORDER BY COUNT(*) DESC, c.title) AS rank
+                FROM watchhistory w
+                JOIN content c ON w.content_id = c.content_id
+                WHERE w.watched_on IS NOT NULL {"AND w.watched_on >= %s AND w.watched_on < %s" if month else ""}
+                GROUP BY DATE_TRUNC('{granularity}', w.watched_on), c.title
+            ) ranked
+            WHERE rank <= %s
+            ORDER BY bucket, rank;
+        """
+    cursor.execute(query, params + (n,))
+    return [{granularity: row[0], "title": row[1], "watch_count": row[2], "rank": row[3]}
+            for row in cursor.fetchall()]
+
+# Payment Method Distribution
+def fetch_payment_method_distribution(cursor):
+    query = """
+        SELECT method, COUNT(*) AS count
+        FROM paymenthistory
+        GROUP BY method
+        ORDER BY count DESC;
+    """
+    cursor.execute(query)
+    return [{"method": row[0], "count": row[1]} for row in cursor.fetchall()]
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import timedelta
+
+DEFAULT_TTL = float(os.environ.get("CACHE_DEFAULT_TTL", "300"))
+MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "256"))
+
+# In-process result cache keyed by endpoint, query parameters and the data
+# versions of the tables the endpoint reads, so a write seen through
+# data_versions makes every process miss without being told. Entries expire
+# after a per-endpoint TTL, the least recently used entry is evicted once the
+# cache is full, and invalidate() drops every entry whose endpoint reads one
+# of the tables that changed.
+class ResultCache:
+    def __init__(self, max_entries=MAX_ENTRIES, default_ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    # Declare which tables an endpoint reads and how long its results stay fresh
+    def register(self, endpoint, tables, ttl=None):
+        self._endpoints[endpoint] = (frozenset(tables), ttl if ttl is not None else self.default_ttl)
+
+    @staticmethod
+    def make_key(endpoint, params=None, versions=()):
+        return (endpoint, tuple(sorted((params or {}).items())), tuple(versions))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats["misses"] += 1
+                return None, False
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1], True
+
+    def put(self, key, value):
+        _, ttl = self._endpoints.get(key[0], ((), self.default_ttl))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    # Drop cached results that depend on any of the given tables (all of them if None)
+    def invalidate(self, tables=None):
+        with self._lock:
+            if tables is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+            else:
+                changed = set(tables)
+                stale = [key for key in self._entries
+                         if key[0] not in self._endpoints or self._endpoints[key[0]][0] & changed]
+                for key in stale:
+                    del self._entries[key]
+                dropped = len(stale)
+            self.stats["invalidations"] += dropped
+            return dropped
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), max_entries=self.max_entries)
+
+# Cache of one value per day (revenue per day) for endpoints queried by date
+# range. Days are stored once per covered segment: a request only fetches the
+# parts of its range that no earlier request covered, and totals over any
+# range come from prefix sums over the cached days. Callers drive the
+# fetching (so the sync and async apps share it): missing() names the gaps,
+# fill() stores the rows fetched for one gap. fill() ignores rows fetched
+# before an invalidate(), an expiry or a new data version, which start a new
+# generation.
+class DayRangeCache:
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "days_fetched": 0, "invalidations": 0}
+        self.generation = 0
+        self.version = None
+        self._reset()
+
+    def _reset(self):
+        self.generation += 1
+        self._expires = time.monotonic() + self.ttl
+        self._segments = []  # sorted, disjoint (first day, last day) ranges
+        self._values = {}
+        self._days, self._prefix = [], [0.0]
+
+    def _expire(self):
+        if self._expires < time.monotonic():
+            self._reset()
+
+    # (generation, [(first day, last day), ...]) for the parts of the range
+    # not cached yet; cached days belong to one data version, so asking with
+    # another starts over
+    def missing(self, start, end, version=None):
+        with self._lock:
+            self._expire()
+            if version != self.version:
+                self._reset()
+                self.version = version
+            gaps, cursor = [], start
+            for first, last in self._segments:
+                if last < cursor or first > end:
+                    continue
+                if first > cursor:
+                    gaps.append((cursor, first - timedelta(days=1)))
+                cursor = max(cursor, last + timedelta(days=1))
+            if cursor <= end:
+                gaps.append((cursor, end))
+            self.stats["misses" if gaps else "hits"] += 1
+            return self.generation, gaps
+
+    # values: {day: value} for the days of the gap that have one
+    def fill(self, generation, start, end, values):
+        with self._lock:
+            if generation != self.generation:
+                return False
+            self._values.update(values)
+            self.stats["days_fetched"] += (end - start).days + 1
+            segments = sorted(self._segments + [(start, end)])
+            merged = [segments[0]]
+            for first, last in segments[1:]:
+                if first <= merged[-1][1] + timedelta(days=1):
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+                else:
+                    merged.append((first, last))
+            self._segments = merged
+            self._days = sorted(self._values)
+            self._prefix = [0.0]
+            for day in self._days:
+                self._prefix.append(self._prefix[-1] + self._values[day])
+            return True
+
+    def covers(self, start, end):
+        return any(first <= start and end <= last for first, last in self._segments)
+
+    # [(day, value), ...] in the range, or None when it is not fully cached
+    def values(self, start, end):
+        with self._lock:
+            if not self.covers(start, end):
+                return None
+            lo, hi = bisect_left(self._days, start), bisect_right(self._days, end)
+            return [(day, self._values[day]) for day in self._days[lo:hi]]
+
+    # Sum over the range from the prefix sums, or None when it is not fully cached
+    def total(self, start, end):
+        with self._lock:
+            if not self.covers(start, end):
+                return None
+            lo, hi = bisect_left(self._days, start), bisect_right(self._days, end)
+            return self._prefix[hi] - self._prefix[lo]
+
+    def invalidate(self):
+        with self._lock:
+            dropped = len(self._values)
+            self._reset()
+            self.stats["invalidations"] += dropped
+            return dropped
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, days=len(self._values), segments=len(self._segments))
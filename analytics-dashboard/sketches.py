@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+import numpy as np
+from queries import TREND_GRANULARITIES, MAX_TOP_N
+from shared.sketch_format import HyperLogLog, HeavyHitters, HLL_RELATIVE_ERROR, CMS_EPSILON
+
+# approx=true variants of the endpoints, answered from the watchhistory
+# sketches that ingestion/sketch_rollups.py maintains (format, constants and
+# error bounds in shared/sketch_format.py)
+
+def _month_range(month):
+    try:
+        month_start = datetime.strptime(month, "%Y-%m")
+    except ValueError:
+        raise ValueError("month must be formatted as YYYY-MM")
+    return month_start, (month_start + timedelta(days=32)).replace(day=1)
+
+# Start of the day/week/month bucket of a date, as DATE_TRUNC computes it
+def _bucket(day, granularity):
+    if granularity == "week":
+        day -= timedelta(days=day.weekday())
+    elif granularity == "month":
+        day = day.replace(day=1)
+    return datetime(day.year, day.month, day.day)
+
+# Watches and distinct viewers per genre. watch_count is exact (from the
+# watch_genre_counts rollup); distinct viewers merge every month's sketch.
+def fetch_watch_history_genre_approx(cursor):
+    cursor.execute("SELECT NULLIF(genre, ''), watch_count FROM watch_genre_counts ORDER BY watch_count DESC;")
+    counts = cursor.fetchall()
+    cursor.execute("SELECT NULLIF(name, ''), sketch FROM viewer_sketches WHERE dimension = 'genre';")
+    viewers = {}
+    for genre, data in cursor.fetchall():
+        sketch = HyperLogLog.from_bytes(data)
+        if genre in viewers:
+            viewers[genre].merge(sketch)
+        else:
+            viewers[genre] = sketch
+    rows = []
+    for genre, watch_count in counts:
+        distinct_viewers = viewers[genre].estimate() if genre in viewers else 0
+        rows.append({"genre": genre, "watch_count": watch_count, "distinct_viewers": distinct_viewers,
+                     "distinct_viewers_error": int(round(distinct_viewers * HLL_RELATIVE_ERROR))})
+    return rows
+
+# Top N titles per day/week/month from the per-day count-min sketches, with
+# the same rows as fetch_popular_content_top plus watch_count_error, the
+# bound on the overcount. Month buckets also carry the distinct viewers of
+# each title, merged from its contents' monthly sketches.
+def fetch_popular_content_top_approx(cursor, n=10, granularity="month", month=None):
+    if granularity not in TREND_GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(TREND_GRANULARITIES)}")
+    if not 1 <= n <= MAX_TOP_N:
+        raise ValueError(f"n must be between 1 and {MAX_TOP_N}")
+    params = ()
+    if month:
+        params = _month_range(month)
+    cursor.execute(f"""
+        SELECT day, sketch FROM title_count_sketches
+        {"WHERE day >= %s AND day < %s" if month else ""}
+        ORDER BY day;
+    """, params)
+    buckets = {}
+    for day, data in cursor.fetchall():
+        bucket = _bucket(day, granularity)
+        sketch = HeavyHitters.from_bytes(data)
+        if bucket in buckets:
+            buckets[bucket].merge(sketch)
+        else:
+            buckets[bucket] = sketch
+
+    candidates = sorted({key for sketch in buckets.values() for key in sketch.candidates.tolist()})
+    titles = {}
+    if candidates:
+        cursor.execute("SELECT content_id, title FROM content WHERE content_id = ANY(%s);", (candidates,))
+        titles = dict(cursor.fetchall())
+
+    rows = []
+    for bucket, sketch in sorted(buckets.items()):
+        # Contents sharing a title are counted together, as GROUP BY title does
+        counts, contents = {}, {}
+        for content_id, estimate in sketch.top():
+            title = titles.get(content_id)
+            if title is None:
+                continue
+            counts[title] = counts.get(title, 0) + estimate
+            contents.setdefault(title, []).append(content_id)
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:n]
+        error = int(np.ceil(CMS_EPSILON * sketch.total))
+        for rank, (title, watch_count) in enumerate(ranked, start=1):
+            rows.append({granularity: bucket, "title": title, "watch_count": watch_count, "rank": rank,
+                         "watch_count_error": error, "contents": contents[title]})
+
+    if granularity == "month":
+        _add_distinct_viewers(cursor, rows)
+    for row in rows:
+        del row["contents"]
+    return rows
+
+def _add_distinct_viewers(cursor, rows):
+    for bucket in sorted({row["month"] for row in rows}):
+        bucket_rows = [row for row in rows if row["month"] == bucket]
+        names = sorted({str(content_id) for row in bucket_rows for content_id in row["contents"]})
+        cursor.execute("""
+            SELECT name, sketch FROM viewer_sketches
+            WHERE dimension = 'content' AND month = %s AND name = ANY(%s);
+        """, (bucket, names))
+        sketches = {name: HyperLogLog.from_bytes(data) for name, data in cursor.fetchall()}
+        for row in bucket_rows:
+            viewers = HyperLogLog()
+            for content_id in row["contents"]:
+                if str(content_id) in sketches:
+                    viewers.merge(sketches[str(content_id)])
+            row["distinct_viewers"] = viewers.estimate()
+            row["distinct_viewers_error"] = int(round(row["distinct_viewers"] * HLL_RELATIVE_ERROR))
@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import pandas as pd
+from requests.adapters import HTTPAdapter
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Fetch layer for dashboard.py. Streamlit re-executes the dashboard script on
+# every widget interaction but keeps imported modules, so the HTTP session,
+# thread pool and response cache below survive across reruns.
+API_BASE_URL = os.environ.get("API_BASE_URL", "https://424vyr3g82.execute-api.us-east-1.amazonaws.com/api")
+REQUEST_TIMEOUT = float(os.environ.get("API_TIMEOUT", "30"))
+
+# Seconds a response stays fresh, per endpoint
+DEFAULT_TTL = 60
+CACHE_TTLS = {
+    "subscriptions": 300,
+    "top-content": 300,
+    "watch-history-genre": 120,
+    "payment-method-distribution": 120,
+    "payments-trend": 120,
+    "popular-content-trend": 120,
+    "revenue-trends": 60,
+    "user-stats": 30,
+}
+
+# Keep-alive session shared by all fetches (one TLS handshake per pooled connection)
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=16))
+_session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=16))
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="api-fetch")
+_cache = {}
+_cache_lock = threading.Lock()
+# Endpoints kept current by live.py's deltas: their cached responses do not
+# expire while the live stream is connected
+_pinned = set()
+
+# Ask list endpoints for Arrow (or column arrays without pyarrow) and decode
+# them straight into DataFrames; object responses such as user-stats and
+# errors still arrive as plain JSON
+COLUMNS_MIMETYPE = "application/vnd.streaming.columns+json"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+ACCEPT = f"{ARROW_MIMETYPE}, {COLUMNS_MIMETYPE};q=0.9, application/json;q=0.5" if pa else \
+    f"{COLUMNS_MIMETYPE}, application/json;q=0.5"
+_session.headers["Accept"] = ACCEPT
+
+def _decode(response):
+    content_type = response.headers.get("Content-Type", "").split(";")[0]
+    if content_type == ARROW_MIMETYPE:
+        return pa.ipc.open_stream(response.content).read_pandas()
+    if content_type == COLUMNS_MIMETYPE:
+        return pd.DataFrame(response.json())
+    return response.json()
+
+def _cache_key(endpoint, params):
+    return endpoint, tuple(sorted((key, str(value)) for key, value in (params or {}).items()))
+
+def _ttl(endpoint):
+    return CACHE_TTLS.get(endpoint.split("/")[0], DEFAULT_TTL)
+
+# Fetch one endpoint, serving it from the cache while its TTL has not expired.
+# An expired entry is revalidated with its ETag: when the API answers 304 the
+# data has not changed and the cached copy is reused without a download.
+# Raises requests.exceptions.RequestException on failure.
+def fetch(endpoint, params=None):
+    key = _cache_key(endpoint, params)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and (entry[0] > time.monotonic() or endpoint in _pinned):
+            return entry[1]
+
+    url = f"{API_BASE_URL}/{endpoint}"
+    headers = {"If-None-Match": entry[2]} if entry and entry[2] else None
+    response = _session.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304:
+        with _cache_lock:
+            _cache[key] = (time.monotonic() + _ttl(endpoint), entry[1], entry[2])
+        return entry[1]
+    response.raise_for_status()
+    etag = response.headers.get("ETag")
+    data = _decode(response)
+
+    # List endpoints are keyset-paginated; follow X-Next-Cursor to the last page
+    next_cursor = response.headers.get("X-Next-Cursor")
+    pages = [data]
+    while next_cursor:
+        response = _session.get(url, params=dict(params or {}, cursor=next_cursor), timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        pages.append(_decode(response))
+        next_cursor = response.headers.get("X-Next-Cursor")
+    if len(pages) > 1:
+        data = pd.concat(pages, ignore_index=True)
+
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + _ttl(endpoint), data, etag)
+    return data
+
+def _fetch_result(endpoint, params):
+    try:
+        return fetch(endpoint, params), None
+    except requests.exceptions.RequestException as e:
+        return None, e
+
+# Fetch several panels concurrently: {name: (endpoint, params)} ->
+# {name: (data, error)}. Panels whose inputs did not change come from the cache.
+def fetch_all(panels):
+    futures = {name: _executor.submit(_fetch_result, endpoint, params)
+               for name, (endpoint, params) in panels.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+def clear_cache(endpoints=None):
+    with _cache_lock:
+        if endpoints is None:
+            _cache.clear()
+        else:
+            for key in [key for key in _cache if key[0] in endpoints]:
+                del _cache[key]
+
+def pin(endpoints):
+    with _cache_lock:
+        _pinned.update(endpoints)
+
+def unpin(endpoints):
+    with _cache_lock:
+        _pinned.difference_update(endpoints)
@@ -1,7 +1,8 @@
 import streamlit as st
-import requests
 import pandas as pd
 import plotly.express as px
+from api_client import fetch_all
+from live import live_updates, LIVE_REFRESH_SECONDS
 
 st.title("Streaming Service Advanced Analytics Dashboard")
 
@@ -10,196 +11,198 @@ st.sidebar.header("Revenue Timeline Filter (Aug 19 - Nov 28th) data")
 start_date = st.sidebar.date_input("Start Date")
 end_date = st.sidebar.date_input("End Date")
 
-# Function to fetch data from API
-def fetch_data(endpoint, params=None):
-    try:
-        response = requests.get(f"https://424vyr3g82.execute-api.us-east-1.amazonaws.com/api/{endpoint}", params=params)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error fetching data from {endpoint}: {e}")
+# The user ID box sits at the bottom of the page; its value from this rerun is
+# already in session state, so its panel can be fetched with all the others
+user_id_input = st.session_state.get("user_id_input", "")
+
+# Fetch every panel concurrently over one keep-alive session; panels whose
+# inputs did not change since the last rerun are served from the local cache
+panel_requests = {
+    "revenue": ("revenue-trends", {"start_date": start_date, "end_date": end_date}),
+    "subscriptions": ("subscriptions", None),
+    "top_content": ("top-content", None),
+    "payments": ("payments-trend", None),
+    "genres": ("watch-history-genre", None),
+    "popular_content": ("popular-content-trend", {"n": 10}),
+    "payment_methods": ("payment-method-distribution", None),
+}
+if user_id_input.isdigit():
+    panel_requests["user_stats"] = (f"user-stats/{int(user_id_input)}", None)
+    panel_requests["recommendations"] = (f"recommendations/{int(user_id_input)}", None)
+results = fetch_all(panel_requests)
+
+# With LIVE_UPDATES=1 the revenue, genre and popular content panels re-render
+# every LIVE_REFRESH_SECONDS from their cached response plus the rows pushed
+# by the API's event stream (see live.py), without fetching them again
+live = live_updates()
+if live is not None:
+    st.sidebar.caption("Live updates: " + ("connected" if live.connected else "reconnecting..."))
+live_fragment = st.fragment(run_every=LIVE_REFRESH_SECONDS if live is not None else None)
+
+# Function to get a panel's data, reporting fetch errors in place. List
+# panels arrive as DataFrames, user-stats as a dict.
+def panel_data(name):
+    data, error = results[name]
+    if error is None and isinstance(data, dict) and "error" in data:
+        error = data["error"]
+    if error is not None:
+        st.error(f"Error fetching data from {panel_requests[name][0]}: {error}")
         return []
+    return data
+
+# A live panel's DataFrame: the response is fetched again only when the local
+# cache no longer holds it (after a reconnect), then the pushed rows are applied
+def live_panel_frame(name, event, bounds=None):
+    if live is None:
+        return pd.DataFrame(panel_data(name))
+    results[name] = fetch_all({name: panel_requests[name]})[name]
+    return live.apply(event, pd.DataFrame(panel_data(name)), bounds)
 
 # Revenue Trends
-st.header("Revenue Trends Over Time")
-revenue_data = fetch_data("revenue-trends", {"start_date": start_date, "end_date": end_date})
-if revenue_data:
-    revenue_df = pd.DataFrame(revenue_data)
-    fig = px.line(
-        revenue_df,
-        x="date",
-        y="revenue",
-        title="Revenue Trends",
-        labels={"date": "Date", "revenue": "Revenue (USD)"},
-        template="plotly_dark"
-    )
-    st.plotly_chart(fig, use_container_width=True)
-else:
-    st.info("No revenue data available for the selected date range.")
+@live_fragment
+def revenue_section():
+    st.header("Revenue Trends Over Time")
+    revenue_df = live_panel_frame("revenue", "revenue", (str(start_date), str(end_date)))
+    if not revenue_df.empty:
+        fig = px.line(
+            revenue_df,
+            x="date",
+            y="revenue",
+            title="Revenue Trends",
+            labels={"date": "Date", "revenue": "Revenue (USD)"},
+            template="plotly_dark"
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No revenue data available for the selected date range.")
+
+revenue_section()
 
 
 # Subscription Metrics
 st.header("Subscription Metrics")
-try:
-    response = requests.get("https://424vyr3g82.execute-api.us-east-1.amazonaws.com/api/subscriptions")
-    if response.status_code == 200:
-        subscriptions = response.json()
-        df = pd.DataFrame(subscriptions)
-        if not df.empty:
-            # Plot subscription metrics
-            fig = px.bar(
-                df,
-                x="subscription",
-                y="user_count",
-                title="Subscription Metrics",
-                labels={"subscription": "Subscription Plan", "user_count": "Number of Users"},
-                template="plotly_dark"
-            )
-            st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.error("Failed to fetch subscription metrics.")
-except requests.exceptions.RequestException as e:
-    st.error(f"Error connecting to the API: {e}")
+subscriptions = panel_data("subscriptions")
+df = pd.DataFrame(subscriptions)
+if not df.empty:
+    # Plot subscription metrics
+    fig = px.bar(
+        df,
+        x="subscription",
+        y="user_count",
+        title="Subscription Metrics",
+        labels={"subscription": "Subscription Plan", "user_count": "Number of Users"},
+        template="plotly_dark"
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 # Top Content
 st.header("Top-Rated Content")
-try:
-    response = requests.get("https://424vyr3g82.execute-api.us-east-1.amazonaws.com/api/top-content")
-    if response.status_code == 200:
-        top_content = response.json()
-        df_content = pd.DataFrame(top_content)
-        if not df_content.empty:
-            # Add a rank column starting from 1
-            df_content["Rank"] = range(1, len(df_content) + 1)
-
-            # Display the table view with rankings
-            st.write("Table View of Top Content (Ranked)")
-            st.table(df_content[["Rank", "title", "rating", "genre"]])  # Customize columns as needed
-
-            # Plot content ratings
-            fig = px.bar(
-                df_content,
-                x="title",
-                y="rating",
-                title="Top Content Ratings",
-                labels={"title": "Title", "rating": "Rating"},
-                template="plotly_dark"
-            )
-            st.plotly_chart(fig, use_container_width=True)
-            
-except requests.exceptions.RequestException as e:
-    st.error(f"Error connecting to the API: {e}")
+top_content = panel_data("top_content")
+df_content = pd.DataFrame(top_content)
+if not df_content.empty:
+    # Add a rank column starting from 1
+    df_content["Rank"] = range(1, len(df_content) + 1)
+
+    # Display the table view with rankings
+    st.write("Table View of Top Content (Ranked)")
+    st.table(df_content[["Rank", "title", "rating", "genre"]])  # Customize columns as needed
+
+    # Plot content ratings
+    fig = px.bar(
+        df_content,
+        x="title",
+        y="rating",
+        title="Top Content Ratings",
+        labels={"title": "Title", "rating": "Rating"},
+        template="plotly_dark"
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 # ---------------------------------------
 # Payment Trend Visualization
 # ---------------------------------------
 st.header("Revenue Trends Over Time")
-try:
-    response = requests.get("https://424vyr3g82.execute-api.us-east-1.amazonaws.com/api/payments-trend")
-    if response.status_code == 200:
-        payments = response.json()
-        df_payments = pd.DataFrame(payments)
-        if not df_payments.empty:
-            fig = px.line(
-                df_payments,
-                x="week",
-                y="total_revenue",
-                title="Weekly Revenue Trends",
-                labels={"week": "Week", "total_revenue": "Total Revenue ($)"},
-                template="plotly_dark"
-            )
-            st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.error("Failed to fetch payment trends.")
-except requests.exceptions.RequestException as e:
-    st.error(f"Error connecting to the API: {e}")
+payments = panel_data("payments")
+df_payments = pd.DataFrame(payments)
+if not df_payments.empty:
+    fig = px.line(
+        df_payments,
+        x="week",
+        y="total_revenue",
+        title="Weekly Revenue Trends",
+        labels={"week": "Week", "total_revenue": "Total Revenue ($)"},
+        template="plotly_dark"
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 # ---------------------------------------
 # Watch History by Genre Visualization
 # ---------------------------------------
-st.header("Watch History by Genre")
-try:
-    response = requests.get("https://424vyr3g82.execute-api.us-east-1.amazonaws.com/api/watch-history-genre")
-    if response.status_code == 200:
-        genres = response.json()
-        df_genres = pd.DataFrame(genres)
-        if not df_genres.empty:
-            fig = px.pie(
-                df_genres,
-                names="genre",
-                values="watch_count",
-                title="Watch History Distribution by Genre",
-                template="plotly_dark"
-            )
-            st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.error("Failed to fetch watch history by genre.")
-except requests.exceptions.RequestException as e:
-    st.error(f"Error connecting to the API: {e}")
+@live_fragment
+def genres_section():
+    st.header("Watch History by Genre")
+    df_genres = live_panel_frame("genres", "genres")
+    if not df_genres.empty:
+        fig = px.pie(
+            df_genres,
+            names="genre",
+            values="watch_count",
+            title="Watch History Distribution by Genre",
+            template="plotly_dark"
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+genres_section()
 
 # ---------------------------------------
 # Popular Content Over Time Visualization
 # ---------------------------------------
-st.header("Popular Content Trends Over Time")
-try:
-    response = requests.get("https://424vyr3g82.execute-api.us-east-1.amazonaws.com/api/popular-content-trend")
-    if response.status_code == 200:
-        popular_content = response.json()
-        df_popular = pd.DataFrame(popular_content)
-        if not df_popular.empty:
-            # Convert month format to human-readable (e.g., "August")
-            df_popular["month"] = pd.to_datetime(df_popular["month"]).dt.strftime("%B")
-
-            # Add a simplified month filter
-            st.write("Select a Month")
-            month_filter = st.selectbox("Month", options=df_popular["month"].unique())
-            filtered_content = df_popular[df_popular["month"] == month_filter]
-
-            if not filtered_content.empty:
-                # Sort by watch count and select the top 10
-                top_10_content = filtered_content.nlargest(10, "watch_count")
-
-                # Plot graph for top 10 popular content
-                fig = px.bar(
-                    top_10_content,
-                    x="title",
-                    y="watch_count",
-                    title=f"Top 10 Popular Content in {month_filter}",
-                    labels={"title": "Title", "watch_count": "Watch Count"},
-                    template="plotly",
-                    text="watch_count"
-                )
-                fig.update_traces(textposition="outside")  # Display values above bars
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.write(f"No content data available for {month_filter}.")
-    else:
-        st.error("Failed to fetch popular content trends.")
-except requests.exceptions.RequestException as e:
-    st.error(f"Error connecting to the API: {e}")
+@live_fragment
+def popular_content_section():
+    st.header("Popular Content Trends Over Time")
+    df_popular = live_panel_frame("popular_content", "top-content")
+    if not df_popular.empty:
+        # Convert month format to human-readable (e.g., "August")
+        df_popular["month"] = pd.to_datetime(df_popular["month"]).dt.strftime("%B")
+
+        # Add a simplified month filter
+        st.write("Select a Month")
+        month_filter = st.selectbox("Month", options=df_popular["month"].unique())
+        filtered_content = df_popular[df_popular["month"] == month_filter]
+
+        if not filtered_content.empty:
+            # The API already ranked the top 10 titles of each month
+            fig = px.bar(
+                filtered_content,
+                x="title",
+                y="watch_count",
+                title=f"Top 10 Popular Content in {month_filter}",
+                labels={"title": "Title", "watch_count": "Watch Count"},
+                template="plotly",
+                text="watch_count"
+            )
+            fig.update_traces(textposition="outside")  # Display values above bars
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.write(f"No content data available for {month_filter}.")
+
+popular_content_section()
 
 # ---------------------------------------
 # Payment Method Distribution Visualization
 # ---------------------------------------
 st.header("Payment Method Distribution")
-try:
-    response = requests.get("https://424vyr3g82.execute-api.us-east-1.amazonaws.com/api/payment-method-distribution")
-    if response.status_code == 200:
-        payment_methods = response.json()
-        df_methods = pd.DataFrame(payment_methods)
-        if not df_methods.empty:
-            fig = px.pie(
-                df_methods,
-                names="method",
-                values="count",
-                title="Payment Method Distribution",
-                template="plotly_dark"
-            )
-            st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.error("Failed to fetch payment method distribution.")
-except requests.exceptions.RequestException as e:
-    st.error(f"Error connecting to the API: {e}")
+payment_methods = panel_data("payment_methods")
+df_methods = pd.DataFrame(payment_methods)
+if not df_methods.empty:
+    fig = px.pie(
+        df_methods,
+        names="method",
+        values="count",
+        title="Payment Method Distribution",
+        template="plotly_dark"
+    )
+    st.plotly_chart(fig, use_container_width=True)
 
 # ---------------------------------------
 # User-Specific Stats Visualization
@@ -207,35 +210,35 @@ except requests.exceptions.RequestException as e:
 st.header("User-Specific Stats")
 
 # Use text input to handle large user IDs
-user_id_input = st.text_input("Enter User ID (e.g., 1024380905186918401)")
+st.text_input("Enter User ID (e.g., 1024380905186918401)", key="user_id_input")
 
 if user_id_input:
-    try:
-        # Validate that the input is a valid integer
-        if not user_id_input.isdigit():
-            st.error("Invalid User ID. Please enter a numeric value.")
-        else:
-            user_id = int(user_id_input)  # Convert to integer for API call
-            response = requests.get(f"https://424vyr3g82.execute-api.us-east-1.amazonaws.com/api/user-stats/{user_id}")
-            if response.status_code == 200:
-                user_stats = response.json()
-
-                # Display Watch History
-                st.subheader("Watch History")
-                if user_stats.get("watch_history"):
-                    df_watch_history = pd.DataFrame(user_stats["watch_history"])
-                    st.table(df_watch_history)
-                else:
-                    st.write("No watch history found for this user.")
-
-                # Display Payment History
-                st.subheader("Payment History")
-                if user_stats.get("payment_history"):
-                    df_payment_history = pd.DataFrame(user_stats["payment_history"])
-                    st.table(df_payment_history)
-                else:
-                    st.write("No payment history found for this user.")
+    # Validate that the input is a valid integer
+    if not user_id_input.isdigit():
+        st.error("Invalid User ID. Please enter a numeric value.")
+    else:
+        user_stats = panel_data("user_stats")
+        if user_stats:
+            # Display Watch History
+            st.subheader("Watch History")
+            if user_stats.get("watch_history"):
+                df_watch_history = pd.DataFrame(user_stats["watch_history"])
+                st.table(df_watch_history)
+            else:
+                st.write("No watch history found for this user.")
+
+            # Display Payment History
+            st.subheader("Payment History")
+            if user_stats.get("payment_history"):
+                df_payment_history = pd.DataFrame(user_stats["payment_history"])
+                st.table(df_payment_history)
             else:
-                st.error(f"Failed to fetch stats for User ID {user_id}.")
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error connecting to the API: {e}")
\ No newline at end of file
+                st.write("No payment history found for this user.")
+
+        # Display Recommendations
+        st.subheader("Recommended for This User")
+        df_recommendations = pd.DataFrame(panel_data("recommendations"))
+        if not df_recommendations.empty:
+            st.table(df_recommendations[["title", "genre", "score"]])
+        else:
+            st.write("No recommendations yet for this user.")
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import threading
+import requests
+import pandas as pd
+from api_client import API_BASE_URL, clear_cache, pin, unpin
+
+# Live updates for dashboard.py (LIVE_UPDATES=1, against an API served by
+# app.py locally rather than Lambda). A background thread reads the API's
+# Server-Sent Events stream (/api/stream) and keeps the latest rows it pushed
+# per panel. The dashboard fetches each panel once, then applies these rows
+# to its DataFrames on every refresh instead of fetching the panel again.
+LIVE_UPDATES = os.environ.get("LIVE_UPDATES") == "1"
+LIVE_REFRESH_SECONDS = float(os.environ.get("LIVE_REFRESH_SECONDS", "2"))
+RECONNECT_SECONDS = 5
+# The API sends a keep-alive comment every 15 seconds
+READ_TIMEOUT = 45
+
+# Event -> (endpoint it updates, column identifying a row or, for
+# top-content, the month whose rows are replaced together, row order as
+# served by the endpoint)
+EVENTS = {
+    "revenue": ("revenue-trends", "date", {"by": ["date"]}),
+    "genres": ("watch-history-genre", "genre", {"by": ["watch_count"], "ascending": False}),
+    "top-content": ("popular-content-trend", "month", {"by": ["month", "rank"]}),
+}
+ENDPOINTS = [endpoint for endpoint, _, _ in EVENTS.values()]
+
+def _months(values):
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True)).tz_convert(None)
+
+class LiveUpdates:
+    def __init__(self, url):
+        self.url = url
+        self.connected = False
+        # event -> {key: row (top-content: list of rows), None once removed}
+        self._rows = {event: {} for event in EVENTS}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="live-updates", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                with requests.get(self.url, stream=True, timeout=(10, READ_TIMEOUT)) as response:
+                    response.raise_for_status()
+                    event = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("event:"):
+                            event = line[len("event:"):].strip()
+                        elif line.startswith("data:"):
+                            self._apply(event, json.loads(line[len("data:"):]))
+                        elif not line:
+                            event = None
+            except (requests.exceptions.RequestException, ValueError):
+                pass
+            self._disconnected()
+            time.sleep(RECONNECT_SECONDS)
+
+    def _disconnected(self):
+        self.connected = False
+        unpin(ENDPOINTS)
+
+    def _apply(self, event, data):
+        if event == "ready":
+            # Deltas sent while disconnected are lost: refetch the panels once
+            # and apply what arrives from now on
+            with self._lock:
+                for rows in self._rows.values():
+                    rows.clear()
+            clear_cache(ENDPOINTS)
+            pin(ENDPOINTS)
+            self.connected = True
+            return
+        if event not in EVENTS:
+            return
+        key_column = EVENTS[event][1]
+        with self._lock:
+            rows = self._rows[event]
+            if event == "top-content":
+                months = {}
+                for row in data["changed"]:
+                    months.setdefault(_months([row["month"]])[0], []).append(row)
+                rows.update(months)
+                rows.update({_months([key])[0]: None for key in data["removed"]})
+            else:
+                rows.update({row[key_column]: row for row in data["changed"]})
+                rows.update({key: None for key in data["removed"]})
+
+    # The panel's DataFrame with the pushed rows applied: rows with a pushed
+    # key are replaced, new keys added (within bounds=(first, last) if given)
+    def apply(self, event, df, bounds=None):
+        _, key_column, order = EVENTS[event]
+        with self._lock:
+            pushed = dict(self._rows[event])
+        if bounds:
+            pushed = {key: value for key, value in pushed.items() if bounds[0] <= key <= bounds[1]}
+        if not pushed:
+            return df
+        if event == "top-content":
+            if not df.empty:
+                df = df.assign(month=_months(df["month"]))
+            new_rows = [row for rows in pushed.values() if rows for row in rows]
+            update = pd.DataFrame(new_rows).drop(columns=["delta"], errors="ignore")
+            if not update.empty:
+                update["month"] = _months(update["month"])
+        else:
+            update = pd.DataFrame([row for row in pushed.values() if row]).drop(columns=["delta"], errors="ignore")
+        if not df.empty:
+            df = df[~df[key_column].isin(list(pushed))]
+        df = pd.concat([df, update], ignore_index=True) if not update.empty else df
+        return df.sort_values(**order, ignore_index=True) if not df.empty else df
+
+# One consumer per Streamlit process (the module outlives reruns)
+_live = None
+_live_lock = threading.Lock()
+
+def live_updates():
+    global _live
+    if not LIVE_UPDATES:
+        return None
+    with _live_lock:
+        if _live is None:
+            _live = LiveUpdates(f"{API_BASE_URL}/stream")
+    return _live
@@ -0,0 +1 @@
+# Benchmark harness: python -m benchmarks.run --help
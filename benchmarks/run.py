@@ -0,0 +1,337 @@
+import os, sys, json, time, logging, argparse, platform, resource, tempfile, threading, subprocess
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Benchmark harness for the API and the ingestion paths, run against a local
+# PostgreSQL or single-node CockroachDB given by DATABASE_URL:
+#
+#     python -m benchmarks.run --seed --scale small
+#     python -m benchmarks.run --concurrency 1,16 --modes http --save-baseline
+#
+# --seed drops and recreates every table, then loads generated data at the
+# chosen scale. Each /api/* route is driven through the Flask test client and
+# over HTTP at each concurrency level; --ingestion also times the
+# insert-data.py, ingestion.parallel and upload_data.py loads. Results go to
+# a JSON file and are compared with the baseline file when it exists.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_DIR = os.path.join(ROOT, "analytics-dashboard")
+sys.path.insert(0, API_DIR)
+
+from ingestion.db import get_connection
+from ingestion.generate import SyntheticData, load_database, write_json
+from ingestion.rollups import ROLLUP_TABLES
+from ingestion.parallel import load_parallel
+from db.migrate import migrate
+
+SCALES = {
+    "small": {"users": 1000, "content": 200, "watch_events": 50000, "reviews": 5000, "payments": 10000},
+    "medium": {"users": 20000, "content": 2000, "watch_events": 1000000, "reviews": 50000, "payments": 200000},
+    "large": {"users": 200000, "content": 10000, "watch_events": 10000000, "reviews": 500000, "payments": 2000000},
+}
+# Rows per table for the ingestion timings, as a fraction of the seeded scale
+INGEST_FRACTION = 0.1
+
+# Route name -> path; {user_id} is filled in with a seeded user
+ROUTES = {
+    "subscriptions": "/api/subscriptions",
+    "top-content": "/api/top-content",
+    "revenue-trends": "/api/revenue-trends?start_date=2024-09-01&end_date=2024-09-30",
+    "payments-trend": "/api/payments-trend",
+    "watch-history-genre": "/api/watch-history-genre",
+    "user-stats": "/api/user-stats/{user_id}",
+    "user-stats-ndjson": "/api/user-stats/{user_id}?format=ndjson",
+    "popular-content-trend": "/api/popular-content-trend",
+    "popular-content-trend-ndjson": "/api/popular-content-trend?format=ndjson",
+    "popular-content-top": "/api/popular-content-trend?n=10",
+    "payment-method-distribution": "/api/payment-method-distribution",
+    "dashboard": "/api/dashboard",
+}
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+# Metrics compared with the baseline and whether higher values are better
+COMPARED_METRICS = {"p95_ms": False, "throughput_rps": True, "rows_per_sec": True}
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+def memory():
+    current = rss_mb()
+    return {"rss_mb": round(current, 1) if current is not None else None, "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+def _load_script(relative_path, module_name):
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# ------------------------------------ Seeding ------------------------------------
+def reset_schema(connection):
+    with connection.cursor() as cursor:
+        for table_name in ROLLUP_TABLES + ["reviews", "watchhistory", "paymenthistory", "users",
+                                           "content", "subscriptions", "data_versions", "ingest_checkpoints",
+                                           "schema_migrations"]:
+            cursor.execute(f"DROP TABLE IF EXISTS {table_name} CASCADE")
+    connection.commit()
+    migrate(connection)
+
+def seed(scale, seed_value):
+    connection = get_connection()
+    try:
+        reset_schema(connection)
+    finally:
+        connection.close()
+    data = SyntheticData(**scale, seed=seed_value)
+    started = time.perf_counter()
+    load_database(data)
+    elapsed = time.perf_counter() - started
+    rows = sum(data.counts.values())
+    return {"rows": rows, "seconds": round(elapsed, 3), "rows_per_sec": round(rows / elapsed, 1), **memory()}
+
+# ---------------------------------- Ingestion -----------------------------------
+def timed_load(load, rows):
+    started = time.perf_counter()
+    load()
+    elapsed = time.perf_counter() - started
+    return {"rows": rows, "seconds": round(elapsed, 3), "rows_per_sec": round(rows / elapsed, 1), **memory()}
+
+def bench_ingestion(scale, seed_value):
+    sizes = {key: max(1, int(value * INGEST_FRACTION)) for key, value in scale.items()}
+    data = SyntheticData(**sizes, seed=seed_value + 1)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        dataset = os.path.join(workdir, "dataset.json")
+        # Loads are checkpointed per file, so the parallel loader gets its own
+        # copy instead of skipping everything insert-data.py just loaded
+        parallel_dataset = os.path.join(workdir, "parallel_dataset.json")
+        watch_file = os.path.join(workdir, "watchhistory_mock_data.json")
+        write_json(data, dataset)
+        write_json(data, parallel_dataset)
+        write_json(data, watch_file, tables=("watchhistory",))
+        rows = sum(data.counts.values())
+
+        insert_data = _load_script("insert-data.py", "insert_data")
+        results["insert-data"] = timed_load(lambda: insert_data.load_data_from_json(dataset), rows)
+        results["ingestion.parallel"] = timed_load(lambda: load_parallel(parallel_dataset), rows)
+        upload_data = _load_script(os.path.join("mock_data", "upload_data.py"), "upload_data")
+        results["upload_data.watchhistory"] = timed_load(lambda: upload_data.upload_watchhistory(watch_file),
+                                                         data.counts["watchhistory"])
+    return results
+
+# ------------------------------------- API --------------------------------------
+def latency_stats(latencies, errors, wall):
+    values = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "max_ms": round(float(values.max()), 3),
+        "throughput_rps": round(len(latencies) / wall, 1),
+    }
+
+# Send `requests` requests for one path from `concurrency` threads, each with
+# its own client from make_client(); a client maps a path to a status code
+def drive(make_client, path, requests, concurrency, warmup):
+    local = threading.local()
+
+    def send(_):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = make_client()
+        started = time.perf_counter()
+        status = client(path)
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(warmup)))
+        started = time.perf_counter()
+        results = list(pool.map(send, range(requests)))
+        wall = time.perf_counter() - started
+    errors = sum(1 for _, status in results if status >= 400)
+    return latency_stats([latency for latency, _ in results], errors, wall)
+
+def test_client_factory(app):
+    def make_client():
+        client = app.test_client()
+        return lambda path: _consume(client.get(path))
+    return make_client
+
+def _consume(response):
+    response.get_data()
+    return response.status_code
+
+def http_factory(base_url):
+    import requests
+
+    def make_client():
+        session = requests.Session()
+
+        def get(path):
+            response = session.get(base_url + path, timeout=120)
+            response.content
+            return response.status_code
+        return get
+    return make_client
+
+def start_http_server(app):
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def sample_user_id():
+    connection = get_connection()
+    try:
+        with connection.cursor() as cursor:
+            # The busiest viewer exercises the largest user-stats pages
+            cursor.execute("""
+                SELECT user_id FROM watchhistory GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1
+            """)
+            row = cursor.fetchone()
+        return row[0] if row else 1
+    finally:
+        connection.close()
+
+def bench_api(modes, routes, concurrency_levels, requests, warmup, url=None):
+    # Per-request log lines would dominate the timings
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    from app import app
+    paths = {name: ROUTES[name].format(user_id=sample_user_id()) for name in routes}
+    results = {}
+    server = None
+    try:
+        for mode in modes:
+            if mode == "test_client":
+                make_client = test_client_factory(app)
+            else:
+                if url is None and server is None:
+                    server, url = start_http_server(app)
+                make_client = http_factory(url.rstrip("/"))
+            results[mode] = {}
+            for name, path in paths.items():
+                results[mode][name] = {}
+                for concurrency in concurrency_levels:
+                    stats = drive(make_client, path, requests, concurrency, warmup)
+                    stats.update(memory())
+                    results[mode][name][str(concurrency)] = stats
+                    print(f"{mode:<12} {name:<30} c={concurrency:<3} p50 {stats['p50_ms']:9.2f}ms  "
+                          f"p95 {stats['p95_ms']:9.2f}ms  p99 {stats['p99_ms']:9.2f}ms  "
+                          f"{stats['throughput_rps']:9.1f} req/s  errors {stats['errors']}")
+    finally:
+        if server is not None:
+            server.shutdown()
+    return results
+
+# ---------------------------------- Baseline ------------------------------------
+def _flatten(results, prefix=()):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, prefix + (key,))
+        elif key in COMPARED_METRICS and isinstance(value, (int, float)):
+            yield "/".join(prefix + (key,)), value
+
+# Metrics that got worse than the baseline by more than `threshold` (0.2 = 20%)
+def compare(results, baseline, threshold):
+    previous = dict(_flatten({key: baseline.get(key, {}) for key in ("seed", "ingestion", "api")}))
+    regressions = []
+    for name, value in _flatten({key: results.get(key, {}) for key in ("seed", "ingestion", "api")}):
+        if name not in previous or not previous[name]:
+            continue
+        change = (value - previous[name]) / previous[name]
+        higher_is_better = COMPARED_METRICS[name.rsplit("/", 1)[1]]
+        if (-change if higher_is_better else change) > threshold:
+            regressions.append({"metric": name, "baseline": previous[name], "current": value,
+                                "change_pct": round(change * 100, 1)})
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the API routes and ingestion paths")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--seed", action="store_true", help="drop all tables and load generated data first")
+    parser.add_argument("--seed-value", type=int, default=42, help="random seed of the generated data")
+    parser.add_argument("--ingestion", action="store_true", help="also time the JSON loaders (appends rows)")
+    parser.add_argument("--modes", default="test_client,http", help="test_client and/or http")
+    parser.add_argument("--url", help="benchmark an already running server instead of an in-process one")
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--no-cache", action="store_true", help="disable the API result cache")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    routes = [name.strip() for name in args.routes.split(",") if name.strip()]
+    unknown = [name for name in routes if name not in ROUTES]
+    if unknown:
+        sys.exit(f"Unknown routes: {', '.join(unknown)}")
+    if args.no_cache:
+        os.environ["CACHE_MAX_ENTRIES"] = "0"
+    scale = SCALES[args.scale]
+
+    results = {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "scale_rows": scale,
+            "requests": args.requests,
+            "result_cache": not args.no_cache,
+        },
+    }
+    if args.seed:
+        print(f"Seeding the {args.scale} dataset...")
+        results["seed"] = seed(scale, args.seed_value)
+    results["api"] = bench_api([mode.strip() for mode in args.modes.split(",") if mode.strip()], routes,
+                               [int(level) for level in args.concurrency.split(",")],
+                               args.requests, args.warmup, args.url)
+    if args.ingestion:
+        results["ingestion"] = bench_ingestion(scale, args.seed_value)
+    results["memory"] = memory()
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        results["regressions"] = regressions
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression['metric']:<70} {regression['baseline']:>12} -> "
+                      f"{regression['current']:>12} ({regression['change_pct']:+.1f}%)")
+        else:
+            print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%}).")
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1 @@
+# Schema migrations (python -m db.migrate) and query-plan checks (python -m db.check_plans)
@@ -0,0 +1,154 @@
+import os, re, sys
+from datetime import datetime
+
+# Query-plan regression check: runs EXPLAIN for the SQL behind every API
+# endpoint (taken from the fetch_* functions themselves) and fails when a plan
+# reads a whole table that is not on the allowlist below:
+#
+#     python -m db.check_plans            # exit status 1 on full scans
+#     python -m db.check_plans --verbose  # print every plan
+#
+# On PostgreSQL sequential scans are disabled for the session first, so a Seq
+# Scan in the plan means no index can serve the query at all (small test
+# tables would otherwise be scanned regardless of indexes). On CockroachDB a
+# "FULL SCAN" span is reported.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "analytics-dashboard"))
+
+from ingestion.db import get_connection
+from queries import (
+    fetch_subscriptions, fetch_top_content, fetch_revenue_trends, fetch_payments_trend,
+    fetch_watch_history_genre, fetch_user_stats, fetch_popular_content_trend, fetch_popular_content_top,
+    fetch_payment_method_distribution, fetch_recommendations, user_stats_statements, popular_content_trend_statements,
+    encode_cursor, PAGE_SIZE,
+)
+from sketches import fetch_watch_history_genre_approx, fetch_popular_content_top_approx
+
+# Rollups and dimension tables small enough to read in full by design
+SMALL_TABLES = {"plan_user_counts", "watch_genre_counts", "revenue_weekly", "watch_monthly_title", "subscriptions",
+                "title_count_sketches"}
+
+# Check name -> {table: reason} for full scans that are inherent to the query
+ALLOWED_FULL_SCANS = {
+    "popular-content-top week, all months": {
+        "watchhistory": "ranks every watch ever recorded; pass month= to bound it",
+        "content": "joined to every watch",
+    },
+    "payment-method-distribution": {
+        "paymenthistory": "counts every payment (from the paymenthistory_method index)",
+    },
+}
+
+# Cursor stand-in that records the statements a fetch_* function executes
+class CaptureCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append((query, params or ()))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+def captured(fetch, *args):
+    cursor = CaptureCursor()
+    fetch(cursor, *args)
+    return cursor.statements
+
+def sample_values(cursor):
+    cursor.execute("SELECT user_id FROM watchhistory LIMIT 1")
+    row = cursor.fetchone()
+    user_id = row[0] if row else 1
+    cursor.execute("SELECT MAX(month) FROM watch_monthly_title")
+    month = cursor.fetchone()[0] or datetime(2024, 9, 1)
+    return user_id, month
+
+# Check name -> [(query, params), ...] for every endpoint, including the
+# keyset conditions of follow-up pages and the streamed (ndjson) variants
+def endpoint_statements(user_id, month):
+    history_cursor = encode_cursor(datetime(2024, 9, 1), 1)
+    month_param = month.strftime("%Y-%m")
+    return {
+        "subscriptions": captured(fetch_subscriptions),
+        "top-content": captured(fetch_top_content),
+        "revenue-trends": captured(fetch_revenue_trends, "2024-09-01", "2024-09-30"),
+        "payments-trend": captured(fetch_payments_trend),
+        "watch-history-genre": captured(fetch_watch_history_genre),
+        "user-stats": captured(fetch_user_stats, user_id),
+        "user-stats next page": captured(fetch_user_stats, user_id, PAGE_SIZE, history_cursor, history_cursor),
+        "user-stats ndjson": [(query, params) for query, params, _ in user_stats_statements(user_id)],
+        "popular-content-trend": captured(fetch_popular_content_trend),
+        "popular-content-trend next page": captured(fetch_popular_content_trend, PAGE_SIZE,
+                                                    encode_cursor(month, 1, "")),
+        "popular-content-trend ndjson": [(query, params) for query, params, _ in popular_content_trend_statements()],
+        "popular-content-top month": captured(fetch_popular_content_top, 10, "month"),
+        "popular-content-top month, one month": captured(fetch_popular_content_top, 10, "month", month_param),
+        "popular-content-top week, one month": captured(fetch_popular_content_top, 10, "week", month_param),
+        "popular-content-top day, one month": captured(fetch_popular_content_top, 10, "day", month_param),
+        "popular-content-top week, all months": captured(fetch_popular_content_top, 10, "week"),
+        "payment-method-distribution": captured(fetch_payment_method_distribution),
+        "recommendations": captured(fetch_recommendations, user_id),
+        "watch-history-genre approx": captured(fetch_watch_history_genre_approx),
+        "popular-content-top approx week, one month": captured(fetch_popular_content_top_approx, 10, "week",
+                                                               month_param),
+    }
+
+def is_cockroach(cursor):
+    cursor.execute("SELECT version()")
+    return "CockroachDB" in cursor.fetchone()[0]
+
+def explain(cursor, query, params):
+    cursor.execute("EXPLAIN " + query.strip().rstrip(";"), params)
+    return "\n".join(row[0] for row in cursor.fetchall())
+
+# Tables a plan reads in full
+def full_scans(plan, cockroach):
+    if not cockroach:
+        return set(re.findall(r"Seq Scan on (\w+)", plan))
+    tables, table = set(), None
+    for line in plan.splitlines():
+        match = re.search(r"table: (\w+)@", line)
+        if match:
+            table = match.group(1)
+        elif "FULL SCAN" in line and table:
+            tables.add(table)
+    return tables
+
+def check(connection, verbose=False):
+    failures = []
+    with connection.cursor() as cursor:
+        cockroach = is_cockroach(cursor)
+        if not cockroach:
+            cursor.execute("SET enable_seqscan = off")
+        checks = endpoint_statements(*sample_values(cursor))
+        for name, statements in checks.items():
+            allowed = ALLOWED_FULL_SCANS.get(name, {})
+            problems = set()
+            for query, params in statements:
+                plan = explain(cursor, query, params)
+                if verbose:
+                    print(f"--- {name}\n{plan}")
+                problems |= full_scans(plan, cockroach) - SMALL_TABLES - set(allowed)
+            notes = "; ".join(f"{table}: {reason}" for table, reason in allowed.items())
+            if problems:
+                failures.append(name)
+                print(f"FAIL {name}: full scan of {', '.join(sorted(problems))}")
+            else:
+                print(f"ok   {name}" + (f" (allowed full scans: {notes})" if notes else ""))
+    connection.rollback()
+    return failures
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in ([], ["--verbose"]):
+        sys.exit("Usage: python -m db.check_plans [--verbose]")
+    connection = get_connection()
+    try:
+        failures = check(connection, verbose=sys.argv[1:] == ["--verbose"])
+    finally:
+        connection.close()
+    if failures:
+        sys.exit(f"{len(failures)} endpoint queries fall back to full scans")
+    print("Every endpoint query is served by an index.")
@@ -0,0 +1,70 @@
+import os, re, sys
+from ingestion.db import get_connection
+
+# Versioned schema: db/migrations/NNNN_name.sql files, applied in order, each
+# in its own transaction together with its row in schema_migrations:
+#
+#     python -m db.migrate            # apply pending migrations
+#     python -m db.migrate status     # list applied and pending ones
+#
+# Applied files must not be edited; change the schema with a new file.
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+def migration_files():
+    migrations = []
+    for file_name in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, file_name)))
+    return migrations
+
+def applied_versions(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cursor.fetchall()}
+    connection.commit()
+    return versions
+
+# Apply every migration not yet recorded; returns the versions applied
+def migrate(connection):
+    applied = applied_versions(connection)
+    done = []
+    for version, name, path in migration_files():
+        if version in applied:
+            continue
+        with open(path) as migration:
+            statements = migration.read()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(statements)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        print(f"Applied migration {version:04d}_{name}")
+        done.append(version)
+    return done
+
+if __name__ == "__main__":
+    if sys.argv[1:] not in ([], ["status"]):
+        sys.exit("Usage: python -m db.migrate [status]")
+    connection = get_connection()
+    try:
+        if sys.argv[1:] == ["status"]:
+            applied = applied_versions(connection)
+            for version, name, _ in migration_files():
+                print(f"{version:04d}_{name}: {'applied' if version in applied else 'pending'}")
+        else:
+            done = migrate(connection)
+            print(f"{len(done)} migration(s) applied." if done else "Schema is up to date.")
+    finally:
+        connection.close()
@@ -0,0 +1,50 @@
+-- Base tables loaded by insert-data.py, mock_data/upload_data.py and the
+-- ingestion package. Runs on PostgreSQL and CockroachDB. IF NOT EXISTS lets
+-- databases created before the migrations existed adopt them.
+CREATE TABLE IF NOT EXISTS subscriptions (
+    subscription_id BIGSERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    price DECIMAL(10, 2) NOT NULL,
+    features TEXT
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id BIGSERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    password VARCHAR(255),
+    subscription_id BIGINT REFERENCES subscriptions (subscription_id)
+);
+
+CREATE TABLE IF NOT EXISTS content (
+    content_id BIGSERIAL PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    genre VARCHAR(255),
+    release_year INT,
+    content_type VARCHAR(50),
+    rating DECIMAL(3, 1)
+);
+
+CREATE TABLE IF NOT EXISTS watchhistory (
+    watch_id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (user_id),
+    content_id BIGINT NOT NULL REFERENCES content (content_id),
+    watched_on TIMESTAMP DEFAULT now(),
+    progress DECIMAL(5, 2)
+);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    review_id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (user_id),
+    content_id BIGINT NOT NULL REFERENCES content (content_id),
+    rating DECIMAL(3, 1),
+    review_text TEXT
+);
+
+CREATE TABLE IF NOT EXISTS paymenthistory (
+    payment_id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL REFERENCES users (user_id),
+    amount DECIMAL(10, 2) NOT NULL,
+    payment_date TIMESTAMP DEFAULT now(),
+    method VARCHAR(50)
+);
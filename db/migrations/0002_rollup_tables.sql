@@ -0,0 +1,31 @@
+-- Rollup tables read by the aggregate endpoints (see ingestion/rollups.py,
+-- which keeps them current and holds the same definitions for
+-- `python -m ingestion.rollups create`).
+CREATE TABLE IF NOT EXISTS revenue_daily (
+    day DATE PRIMARY KEY,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    payment_count BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS revenue_weekly (
+    week TIMESTAMP PRIMARY KEY,
+    revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    payment_count BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS watch_genre_counts (
+    genre VARCHAR(255) PRIMARY KEY,
+    watch_count BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS watch_monthly_title (
+    month TIMESTAMP NOT NULL,
+    title VARCHAR(255) NOT NULL,
+    watch_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, title)
+);
+
+CREATE TABLE IF NOT EXISTS plan_user_counts (
+    plan_name VARCHAR(255) PRIMARY KEY,
+    user_count BIGINT NOT NULL DEFAULT 0
+);
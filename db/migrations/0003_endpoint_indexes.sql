@@ -0,0 +1,37 @@
+-- Indexes behind the API's queries (analytics-dashboard/queries.py). Each one
+-- matches a query's filter and sort order and stores the selected columns, so
+-- the query is answered from the index alone; `python -m db.check_plans`
+-- verifies the plans. INCLUDE is spelled STORING on CockroachDB, which
+-- accepts both.
+
+-- /api/user-stats watch history: WHERE user_id = ? ORDER BY watched_on DESC,
+-- watch_id DESC, keyset on (watched_on, watch_id)
+CREATE INDEX IF NOT EXISTS watchhistory_user_recent
+    ON watchhistory (user_id, watched_on DESC, watch_id DESC) INCLUDE (content_id, progress);
+
+-- /api/user-stats payment history: WHERE user_id = ? ORDER BY payment_date
+-- DESC, payment_id DESC, keyset on (payment_date, payment_id)
+CREATE INDEX IF NOT EXISTS paymenthistory_user_recent
+    ON paymenthistory (user_id, payment_date DESC, payment_id DESC) INCLUDE (amount, method);
+
+-- Payments in a date range (revenue per day or week, rollup backfills)
+CREATE INDEX IF NOT EXISTS paymenthistory_payment_date
+    ON paymenthistory (payment_date) INCLUDE (amount);
+
+-- /api/payment-method-distribution: GROUP BY method reads this index in
+-- method order instead of the table
+CREATE INDEX IF NOT EXISTS paymenthistory_method
+    ON paymenthistory (method);
+
+-- /api/popular-content-trend?n=&granularity=day|week&month=: watches in a
+-- time range, joined to content by content_id
+CREATE INDEX IF NOT EXISTS watchhistory_watched_on
+    ON watchhistory (watched_on) INCLUDE (content_id);
+
+-- Joins and lookups from content to its watches
+CREATE INDEX IF NOT EXISTS watchhistory_content
+    ON watchhistory (content_id);
+
+-- /api/top-content: ORDER BY rating DESC LIMIT 10
+CREATE INDEX IF NOT EXISTS content_rating
+    ON content (rating DESC) INCLUDE (title, genre);
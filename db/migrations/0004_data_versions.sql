@@ -0,0 +1,12 @@
+-- One version counter per base table. The loaders bump a table's version in
+-- the same transaction as the rows they write (ingestion/versions.py), and
+-- the API derives its ETags from the versions of the tables an endpoint reads.
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+INSERT INTO data_versions (table_name)
+VALUES ('subscriptions'), ('users'), ('content'), ('watchhistory'), ('reviews'), ('paymenthistory')
+ON CONFLICT (table_name) DO NOTHING;
@@ -0,0 +1,30 @@
+-- Resumable loads (ingestion/checkpoints.py). Every committed batch of a
+-- source file is recorded in the same transaction as its rows, so a rerun
+-- skips it. Batches of the dimension tables also keep their generated ids,
+-- which lets the loaders rebuild their mock id -> database id maps without
+-- scanning the tables.
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source VARCHAR(512) NOT NULL,
+    table_name VARCHAR(64) NOT NULL,
+    first_row BIGINT NOT NULL,
+    row_count INT NOT NULL,
+    ids BIGINT[],
+    committed_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (source, table_name, first_row)
+);
+
+-- Natural keys for ON CONFLICT: loading the same plans or users again
+-- resolves to the existing rows instead of adding duplicates. Plans added
+-- twice by earlier loads are merged into the oldest row first; duplicate
+-- user emails have to be resolved by hand before this migration can run.
+UPDATE users SET subscription_id = keep.subscription_id
+FROM subscriptions s
+JOIN (SELECT name, MIN(subscription_id) AS subscription_id FROM subscriptions GROUP BY name) keep
+    ON keep.name = s.name
+WHERE users.subscription_id = s.subscription_id AND s.subscription_id <> keep.subscription_id;
+
+DELETE FROM subscriptions
+WHERE subscription_id NOT IN (SELECT MIN(subscription_id) FROM subscriptions GROUP BY name);
+
+CREATE UNIQUE INDEX IF NOT EXISTS subscriptions_name_key ON subscriptions (name);
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_key ON users (email);
@@ -0,0 +1,17 @@
+-- Sketches behind the approx=true endpoints (see ingestion/sketch_rollups.py,
+-- which keeps them current, and analytics-dashboard/sketches.py for their
+-- format and error bounds): a HyperLogLog of viewers per content and per
+-- genre each month, and a count-min sketch of watches per content each day.
+-- Existing watches are added with `python -m ingestion.rollups rebuild`.
+CREATE TABLE IF NOT EXISTS viewer_sketches (
+    dimension VARCHAR(16) NOT NULL,
+    month TIMESTAMP NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    sketch BYTEA NOT NULL,
+    PRIMARY KEY (dimension, month, name)
+);
+
+CREATE TABLE IF NOT EXISTS title_count_sketches (
+    day DATE PRIMARY KEY,
+    sketch BYTEA NOT NULL
+);
@@ -0,0 +1,35 @@
+-- Item-item recommendation index behind /api/recommendations/<user_id> (see
+-- ingestion/recommendations.py). user_content_scores is the sparse user x
+-- content interaction matrix (furthest watch progress and latest review
+-- rating), kept current by the loaders like the rollups; content_neighbors
+-- holds the most similar contents of each content, and content_neighbor_state
+-- each content's vector norm and the changes not yet reflected in the index.
+-- Existing data is indexed with `python -m ingestion.rollups rebuild`.
+CREATE TABLE IF NOT EXISTS user_content_scores (
+    user_id BIGINT NOT NULL,
+    content_id BIGINT NOT NULL,
+    progress DECIMAL(5, 2),
+    rating DECIMAL(3, 1),
+    PRIMARY KEY (user_id, content_id)
+);
+
+CREATE TABLE IF NOT EXISTS content_neighbors (
+    content_id BIGINT NOT NULL,
+    neighbor_id BIGINT NOT NULL,
+    similarity DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (content_id, neighbor_id)
+);
+
+CREATE TABLE IF NOT EXISTS content_neighbor_state (
+    content_id BIGINT PRIMARY KEY,
+    norm DOUBLE PRECISION NOT NULL DEFAULT 0,
+    pending_changes BIGINT NOT NULL DEFAULT 0
+);
+
+-- Refresh: every interaction with the changed contents
+CREATE INDEX IF NOT EXISTS user_content_scores_content
+    ON user_content_scores (content_id) INCLUDE (progress, rating);
+
+-- Refresh: the neighbor lists that mention a changed content
+CREATE INDEX IF NOT EXISTS content_neighbors_neighbor
+    ON content_neighbors (neighbor_id);
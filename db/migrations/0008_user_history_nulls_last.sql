@@ -0,0 +1,13 @@
+-- /api/user-stats pages newest first with rows that have no watched_on /
+-- payment_date last (ORDER BY ... DESC NULLS LAST, the order CockroachDB uses
+-- by default), so the keyset cursor sees them on both databases. These
+-- replace the *_user_recent indexes from 0003, whose DESC order puts NULLs
+-- first on PostgreSQL.
+CREATE INDEX IF NOT EXISTS watchhistory_user_history
+    ON watchhistory (user_id, watched_on DESC NULLS LAST, watch_id DESC) INCLUDE (content_id, progress);
+
+CREATE INDEX IF NOT EXISTS paymenthistory_user_history
+    ON paymenthistory (user_id, payment_date DESC NULLS LAST, payment_id DESC) INCLUDE (amount, method);
+
+DROP INDEX IF EXISTS watchhistory_user_recent;
+DROP INDEX IF EXISTS paymenthistory_user_recent;
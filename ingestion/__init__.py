@@ -0,0 +1 @@
+# Shared helpers for the ingestion scripts (insert-data.py, mock_data/upload_data.py)
@@ -0,0 +1,106 @@
+import os, io, time
+from itertools import islice
+from psycopg2.extras import execute_values
+from ingestion.rollups import apply_rollups, ROLLUP_STATEMENTS
+from ingestion.versions import bump_data_version
+from ingestion.pipeline import NATURAL_KEYS
+
+# Rows per multi-row INSERT and how many batches go into one transaction
+BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "1000"))
+COMMIT_EVERY = int(os.environ.get("INGEST_COMMIT_EVERY", "10"))
+
+def batched(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# Insert rows (tuples ordered like `columns`) with one multi-row
+# INSERT ... VALUES per batch instead of one round trip per row.
+#
+# When returning_column is given the generated keys are returned in input
+# order (a single-statement VALUES insert returns rows in the order they
+# were supplied, on both PostgreSQL and CockroachDB), so callers can keep
+# remapping mock foreign keys by position. Tables with a natural key
+# (plans, users) are upserted: rows that already exist resolve to their
+# current ids. Rollups are applied per batch before each commit, which
+# happens every `commit_every` batches, and the table's data version is
+# bumped in every transaction that added rows.
+def bulk_insert(connection, table_name, columns, rows, returning_column=None,
+                batch_size=BATCH_SIZE, commit_every=COMMIT_EVERY, keep_ids=True, report=True):
+    if table_name in ROLLUP_STATEMENTS and not returning_column:
+        raise ValueError(f"{table_name} feeds rollups, so its generated keys must be returned")
+    key_column = NATURAL_KEYS.get(table_name) if returning_column else None
+    query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES %s"
+    if returning_column:
+        query += f" RETURNING {returning_column}"
+    template = f"({', '.join(['%s'] * len(columns))})"
+
+    ids = []
+    row_count = 0
+    uncommitted = False
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        for batch_number, batch in enumerate(batched(rows, batch_size), start=1):
+            if key_column:
+                batch_ids, inserted_ids = upsert_batch(cursor, table_name, columns, batch, returning_column,
+                                                       key_column)
+            else:
+                result = execute_values(cursor, query, batch, template=template,
+                                        page_size=len(batch), fetch=bool(returning_column))
+            if returning_column and not key_column:
+                if len(result) != len(batch):
+                    raise RuntimeError(f"{table_name}: inserted {len(batch)} rows but got {len(result)} ids back")
+                batch_ids = inserted_ids = [row[0] for row in result]
+            if returning_column:
+                apply_rollups(cursor, table_name, inserted_ids)
+                if keep_ids:
+                    ids.extend(batch_ids)
+            row_count += len(batch)
+            uncommitted = True
+            if batch_number % commit_every == 0:
+                bump_data_version(cursor, table_name)
+                connection.commit()
+                uncommitted = False
+        if uncommitted:
+            bump_data_version(cursor, table_name)
+        connection.commit()
+
+    if report:
+        report_rate(table_name, row_count, time.perf_counter() - started)
+    return ids
+
+# Insert one batch, skipping rows whose natural key (a unique column such as
+# users.email) already exists. Returns (id of every row in input order, ids
+# of the rows actually inserted); existing rows are resolved through the
+# key's unique index.
+def upsert_batch(cursor, table_name, columns, batch, returning_column, key_column):
+    key_index = list(columns).index(key_column)
+    inserted = dict(execute_values(
+        cursor,
+        f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES %s "
+        f"ON CONFLICT ({key_column}) DO NOTHING RETURNING {key_column}, {returning_column}",
+        batch, page_size=len(batch), fetch=True,
+    ))
+    missing = list({row[key_index] for row in batch if row[key_index] not in inserted})
+    existing = {}
+    if missing:
+        cursor.execute(f"SELECT {key_column}, {returning_column} FROM {table_name} WHERE {key_column} = ANY(%s)",
+                       (missing,))
+        existing = dict(cursor.fetchall())
+    ids = [inserted.get(row[key_index]) or existing[row[key_index]] for row in batch]
+    return ids, list(inserted.values())
+
+def report_rate(table_name, row_count, elapsed):
+    rate = row_count / elapsed if elapsed > 0 else float("inf")
+    print(f"{table_name}: {row_count} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+
+# Stream CSV text into a table with COPY; used for fact tables whose
+# generated keys are not needed
+def copy_csv(connection, table_name, columns, csv_text):
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH CSV", io.StringIO(csv_text))
+        bump_data_version(cursor, table_name)
+    connection.commit()
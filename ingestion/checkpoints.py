@@ -0,0 +1,153 @@
+import os, time
+import numpy as np
+from psycopg2.extras import execute_values
+from ingestion.bulk import upsert_batch, report_rate, BATCH_SIZE
+from ingestion.rollups import apply_rollups
+from ingestion.versions import bump_data_version
+from ingestion.pipeline import RETURNING_COLUMNS, DIMENSION_TABLES, NATURAL_KEYS
+
+# Resumable, idempotent loads for insert-data.py, ingestion/parallel.py and
+# mock_data/upload_data.py. Each batch commits on its own together with its
+# rollup updates, its data version bump and a row in ingest_checkpoints naming
+# the source file and the range of records it covered. A rerun of the same file skips every committed
+# range, so a load that failed halfway continues where it stopped. Mock
+# foreign keys are resolved through the id maps in ingestion/idmap.py.
+
+# Mock foreign key columns and the parent table whose id map resolves them
+FOREIGN_KEYS = {
+    "users": {"subscription_id": "subscriptions"},
+    "watchhistory": {"user_id": "users", "content_id": "content"},
+    "reviews": {"user_id": "users", "content_id": "content"},
+    "paymenthistory": {"user_id": "users"},
+}
+
+# A source is one version of one file: editing or regenerating the file
+# starts a new load
+def source_key(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def committed_ranges(cursor, source, table_name):
+    cursor.execute("""
+        SELECT first_row, row_count, ids FROM ingest_checkpoints
+        WHERE source = %s AND table_name = %s
+        ORDER BY first_row
+    """, (source, table_name))
+    return cursor.fetchall()
+
+def record_checkpoint(cursor, source, table_name, first_row, row_count, ids=None):
+    cursor.execute("""
+        INSERT INTO ingest_checkpoints (source, table_name, first_row, row_count, ids)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (source, table_name, first_row, row_count, ids))
+
+# Group the records not covered by a committed range into batches of
+# consecutive records: yields (position of the first record, records)
+def pending_batches(records, committed, batch_size):
+    ranges = iter(committed)
+    current = next(ranges, None)
+    batch, first_row = [], 0
+    for position, record in enumerate(records):
+        while current and position >= current[0] + current[1]:
+            current = next(ranges, None)
+        if current and position >= current[0]:
+            if batch:
+                yield first_row, batch
+                batch = []
+            continue
+        if not batch:
+            first_row = position
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield first_row, batch
+            batch = []
+    if batch:
+        yield first_row, batch
+
+# Replace mock keys (1-based positions in the parent table) with database ids.
+# Users without a plan (the original mock files have no subscription_id)
+# take the plan at their position modulo the number of plans.
+def resolve_keys(table_name, columns, rows, first_row, id_maps):
+    if table_name == "users":
+        plan_count = len(id_maps.parent("subscriptions"))
+        if not plan_count:
+            raise KeyError("users: no subscriptions loaded yet")
+        if "subscription_id" not in columns:
+            columns.append("subscription_id")
+            for row in rows:
+                row.append(None)
+        index = columns.index("subscription_id")
+        for position, row in enumerate(rows, start=first_row):
+            if row[index] is None:
+                row[index] = position % plan_count + 1
+    for column, parent in FOREIGN_KEYS.get(table_name, {}).items():
+        index = columns.index(column)
+        mock_ids = np.array([row[index] for row in rows], dtype=np.int64)
+        ids = id_maps.parent(parent).get(mock_ids - 1)
+        if not ids.all():
+            raise KeyError(f"{table_name}: {column} {mock_ids[ids == 0][0]} is not in the {parent} id map; "
+                           f"load the dataset with insert-data.py first")
+        for row, parent_id in zip(rows, ids.tolist()):
+            row[index] = parent_id
+
+# Insert one batch of consecutive records (the first at position first_row)
+# in its own transaction, together with its rollups, checkpoint and data
+# version bump; returns the number of rows
+def load_batch(connection, source, table_name, first_row, batch, id_maps):
+    id_map = id_maps.loading(table_name) if table_name in DIMENSION_TABLES else None
+    key_column = NATURAL_KEYS.get(table_name)
+    returning_column = RETURNING_COLUMNS[table_name]
+    columns = list(batch[0])
+    rows = [[record[column] for column in columns] for record in batch]
+    resolve_keys(table_name, columns, rows, first_row, id_maps)
+    rows = [tuple(row) for row in rows]
+    try:
+        with connection.cursor() as cursor:
+            if key_column:
+                ids, inserted_ids = upsert_batch(cursor, table_name, columns, rows, returning_column, key_column)
+            else:
+                ids = [row[0] for row in execute_values(
+                    cursor, f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES %s RETURNING {returning_column}",
+                    rows, page_size=len(rows), fetch=True)]
+                inserted_ids = ids
+            apply_rollups(cursor, table_name, inserted_ids)
+            record_checkpoint(cursor, source, table_name, first_row, len(rows),
+                              ids if id_map is not None else None)
+            bump_data_version(cursor, table_name)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    if id_map is not None:
+        id_map.put(first_row, ids)
+    return len(rows)
+
+# Ranges of a table already committed from a source. Ids of committed
+# dimension batches come back from the checkpoints when the map was lost or
+# discarded.
+def prepare_table(connection, source, table_name, id_maps):
+    with connection.cursor() as cursor:
+        committed = committed_ranges(cursor, source, table_name)
+    connection.rollback()
+    id_map = id_maps.loading(table_name) if table_name in DIMENSION_TABLES else None
+    if id_map is not None:
+        for first_row, count, ids in committed:
+            if not id_map.covers(first_row, first_row + count):
+                id_map.put(first_row, ids)
+    return committed
+
+def report_skipped(table_name, committed):
+    skipped = sum(count for _, count, _ in committed)
+    if skipped:
+        print(f"{table_name}: skipped {skipped} rows committed by an earlier run")
+
+# Load one table from a stream of record dicts; returns the rows inserted
+def load_table(connection, source, table_name, records, id_maps, batch_size=BATCH_SIZE):
+    started = time.perf_counter()
+    committed = prepare_table(connection, source, table_name, id_maps)
+    row_count = 0
+    for first_row, batch in pending_batches(records, committed, batch_size):
+        row_count += load_batch(connection, source, table_name, first_row, batch, id_maps)
+    report_rate(table_name, row_count, time.perf_counter() - started)
+    report_skipped(table_name, committed)
+    return row_count
@@ -0,0 +1,6 @@
+import os
+import psycopg2
+
+# Function to connect to the database
+def get_connection():
+    return psycopg2.connect(os.environ["DATABASE_URL"])
@@ -0,0 +1,293 @@
+import os, json, time, argparse
+import numpy as np
+
+# Seeded, vectorized generator for the six tables at arbitrary scale.
+# Every table is produced as a stream of column chunks (dict of NumPy arrays),
+# which are either written to CSV files ready for COPY or loaded straight
+# into the database; no per-row Python dicts are ever built.
+#
+#     python -m ingestion.generate --users 1000000 --watch 100000000 --csv-dir out/
+#     python -m ingestion.generate --users 100000 --watch 10000000 --load
+
+PLANS = [
+    ("Basic", 9.99, "Access to standard content"),
+    ("Premium", 14.99, "Access to HD content"),
+    ("Family", 19.99, "Multiple screens"),
+    ("Student", 4.99, "Discounted access for students"),
+]
+PLAN_WEIGHTS = [0.35, 0.30, 0.20, 0.15]
+GENRES = ["Action", "Comedy", "Drama", "Horror", "Romance", "Sci-Fi", "Thriller", "Documentary", "Animation", "Fantasy"]
+CONTENT_TYPES = ["Movie", "Series", "Documentary"]
+CONTENT_TYPE_WEIGHTS = [0.55, 0.35, 0.10]
+PAYMENT_METHODS = ["Credit Card", "Debit Card", "PayPal", "Gift Card"]
+PAYMENT_METHOD_WEIGHTS = [0.45, 0.30, 0.20, 0.05]
+TITLE_WORDS = np.array(["Midnight", "Lost", "Silent", "Golden", "Broken", "Final", "Hidden", "Wild",
+                        "Crimson", "Frozen", "Electric", "Forgotten", "Iron", "Paper", "Velvet", "Distant"])
+TITLE_NOUNS = np.array(["City", "Empire", "Harbor", "Garden", "Signal", "Kingdom", "Frontier", "Echo",
+                        "Voyage", "Legacy", "Horizon", "Mirror", "Storm", "Circuit", "Orchard", "Code"])
+REVIEW_TEXTS = np.array([
+    "Not worth the time. The plot lacked depth.",
+    "Had a few good moments but dragged overall.",
+    "Solid entertainment with a decent story.",
+    "Really enjoyed it. Great characters and pacing.",
+    "An absolute masterpiece. Would watch again.",
+])
+
+# Share of viewing per hour of day (evening peak) and per weekday (Mon..Sun)
+DIURNAL_WEIGHTS = np.array([2.0, 1.2, 0.7, 0.4, 0.3, 0.3, 0.5, 1.0, 1.4, 1.6, 1.8, 2.0,
+                            2.4, 2.4, 2.3, 2.5, 3.0, 3.8, 5.0, 6.4, 7.2, 7.0, 5.5, 3.6])
+WEEKDAY_WEIGHTS = np.array([0.85, 0.85, 0.9, 0.95, 1.15, 1.4, 1.3])
+
+CHUNK_SIZE = int(os.environ.get("GENERATE_CHUNK_SIZE", "1000000"))
+TABLE_SEEDS = {"subscriptions": 0, "users": 1, "content": 2, "watchhistory": 3, "reviews": 4, "paymenthistory": 5}
+
+def _normalized(weights):
+    weights = np.asarray(weights, dtype=np.float64)
+    return weights / weights.sum()
+
+# Draw n indices from a discrete distribution given by its CDF
+def _sample(rng, cdf, n):
+    return np.searchsorted(cdf, rng.random(n), side="right").clip(max=len(cdf) - 1)
+
+class SyntheticData:
+    def __init__(self, users=100, content=100, watch_events=1000, reviews=100, payments=100,
+                 seed=42, zipf_exponent=1.1, user_activity_exponent=0.8,
+                 start_date="2024-08-19", end_date="2024-11-28", chunk_size=CHUNK_SIZE):
+        self.counts = {
+            "subscriptions": len(PLANS),
+            "users": users,
+            "content": content,
+            "watchhistory": watch_events,
+            "reviews": reviews,
+            "paymenthistory": payments,
+        }
+        self.seed = seed
+        self.chunk_size = chunk_size
+        rng = np.random.default_rng([seed, 99])
+
+        # Plan of every user (0-based plan index), needed for plan-consistent payments
+        self.user_plans = _sample(rng, np.cumsum(_normalized(PLAN_WEIGHTS)), users).astype(np.int8)
+        self.plan_prices = np.array([price for _, price, _ in PLANS])
+
+        # Zipf popularity over a shuffled catalog: a few titles take most views
+        ranks = np.arange(1, content + 1, dtype=np.float64)
+        popularity = np.empty(content)
+        popularity[rng.permutation(content)] = ranks ** -zipf_exponent
+        self.content_cdf = np.cumsum(_normalized(popularity))
+        self.content_base_rating = np.round(rng.normal(6.5, 1.5, content).clip(1, 10), 1)
+
+        # Heavy users: activity also follows a power law over a shuffled user base
+        user_ranks = np.arange(1, users + 1, dtype=np.float64)
+        activity = np.empty(users)
+        activity[rng.permutation(users)] = user_ranks ** -user_activity_exponent
+        self.user_cdf = np.cumsum(_normalized(activity))
+
+        # Calendar: weekday-weighted day choice plus an hour-of-day profile
+        self.start = np.datetime64(start_date, "D")
+        days = np.arange(self.start, np.datetime64(end_date, "D") + 1)
+        weekdays = (days.astype("datetime64[D]").view("int64") - 4) % 7  # 1970-01-01 was a Thursday
+        self.day_cdf = np.cumsum(_normalized(WEEKDAY_WEIGHTS[weekdays]))
+        self.hour_cdf = np.cumsum(_normalized(DIURNAL_WEIGHTS))
+
+    def _rng(self, table_name, chunk_index):
+        return np.random.default_rng([self.seed, TABLE_SEEDS[table_name], chunk_index])
+
+    def _timestamps(self, rng, n):
+        day = _sample(rng, self.day_cdf, n)
+        hour = _sample(rng, self.hour_cdf, n)
+        seconds = day * 86400 + hour * 3600 + rng.integers(0, 3600, n)
+        return self.start.astype("datetime64[s]") + seconds.astype("timedelta64[s]")
+
+    def _chunk_bounds(self, table_name):
+        total = self.counts[table_name]
+        for chunk_index, offset in enumerate(range(0, total, self.chunk_size)):
+            yield chunk_index, offset, min(self.chunk_size, total - offset)
+
+    def subscriptions(self, chunk_index, offset, n):
+        return {
+            "name": np.array([name for name, _, _ in PLANS]),
+            "price": self.plan_prices,
+            "features": np.array([features for _, _, features in PLANS]),
+        }
+
+    def users(self, chunk_index, offset, n):
+        mock_ids = np.arange(offset + 1, offset + n + 1).astype(str)
+        rng = self._rng("users", chunk_index)
+        return {
+            "name": np.char.add("User ", mock_ids),
+            "email": np.char.add(np.char.add("user", mock_ids), "@example.com"),
+            "password": np.char.mod("%012x", rng.integers(0, 2 ** 48, n)),
+            # Mock subscription ids are 1-based plan positions
+            "subscription_id": self.user_plans[offset:offset + n].astype(np.int64) + 1,
+        }
+
+    def content(self, chunk_index, offset, n):
+        rng = self._rng("content", chunk_index)
+        titles = np.char.add(np.char.add(TITLE_WORDS[rng.integers(0, len(TITLE_WORDS), n)], " "),
+                             TITLE_NOUNS[rng.integers(0, len(TITLE_NOUNS), n)])
+        return {
+            "title": np.char.add(np.char.add(titles, " "), np.arange(offset + 1, offset + n + 1).astype(str)),
+            "genre": np.array(GENRES)[rng.integers(0, len(GENRES), n)],
+            "release_year": rng.integers(1970, 2025, n),
+            "content_type": np.array(CONTENT_TYPES)[_sample(rng, np.cumsum(_normalized(CONTENT_TYPE_WEIGHTS)), n)],
+            "rating": self.content_base_rating[offset:offset + n],
+        }
+
+    def watchhistory(self, chunk_index, offset, n):
+        rng = self._rng("watchhistory", chunk_index)
+        return {
+            "user_id": _sample(rng, self.user_cdf, n) + 1,
+            "content_id": _sample(rng, self.content_cdf, n) + 1,
+            "watched_on": self._timestamps(rng, n),
+            # Many sessions are abandoned early, many are finished
+            "progress": np.round(rng.beta(0.7, 0.5, n) * 100).astype(np.int64),
+        }
+
+    def reviews(self, chunk_index, offset, n):
+        rng = self._rng("reviews", chunk_index)
+        content_ids = _sample(rng, self.content_cdf, n)
+        ratings = np.round((self.content_base_rating[content_ids] + rng.normal(0, 1.2, n)).clip(0, 10), 1)
+        return {
+            "user_id": _sample(rng, self.user_cdf, n) + 1,
+            "content_id": content_ids + 1,
+            "rating": ratings,
+            "review_text": REVIEW_TEXTS[np.minimum((ratings // 2).astype(np.int64), len(REVIEW_TEXTS) - 1)],
+        }
+
+    def paymenthistory(self, chunk_index, offset, n):
+        rng = self._rng("paymenthistory", chunk_index)
+        user_index = rng.integers(0, self.counts["users"], n)
+        return {
+            "user_id": user_index + 1,
+            # Every payment charges the price of the payer's plan
+            "amount": self.plan_prices[self.user_plans[user_index]],
+            "payment_date": self._timestamps(rng, n),
+            "method": np.array(PAYMENT_METHODS)[_sample(rng, np.cumsum(_normalized(PAYMENT_METHOD_WEIGHTS)), n)],
+        }
+
+    # Yield the table as column chunks of at most chunk_size rows
+    def chunks(self, table_name):
+        generate = getattr(self, table_name)
+        for chunk_index, offset, n in self._chunk_bounds(table_name):
+            yield generate(chunk_index, offset, n)
+
+# Render a column chunk as CSV text (for files or COPY ... FROM STDIN)
+def chunk_to_csv(columns):
+    rendered = []
+    for values in columns.values():
+        if np.issubdtype(values.dtype, np.datetime64):
+            rendered.append(np.datetime_as_string(values, unit="s"))
+        elif np.issubdtype(values.dtype, np.floating):
+            rendered.append(np.char.mod("%.2f", values))
+        elif np.issubdtype(values.dtype, np.integer):
+            rendered.append(values.astype(str))
+        else:
+            rendered.append(np.char.add(np.char.add('"', np.char.replace(values.astype(str), '"', '""')), '"'))
+    lines = rendered[0]
+    for column in rendered[1:]:
+        lines = np.char.add(np.char.add(lines, ","), column)
+    return "\n".join(lines.tolist()) + "\n"
+
+def write_csv(data, csv_dir):
+    os.makedirs(csv_dir, exist_ok=True)
+    for table_name in TABLE_SEEDS:
+        started = time.perf_counter()
+        rows = 0
+        path = os.path.join(csv_dir, f"{table_name}.csv")
+        with open(path, "w") as file:
+            for index, chunk in enumerate(data.chunks(table_name)):
+                if index == 0:
+                    file.write(",".join(chunk) + "\n")
+                file.write(chunk_to_csv(chunk))
+                rows += len(next(iter(chunk.values())))
+        elapsed = time.perf_counter() - started
+        print(f"{path}: {rows} rows in {elapsed:.2f}s")
+
+# Write the tables in the {"table": [records...]} layout of dataset.json,
+# readable by insert-data.py and ingestion.parallel. Mock foreign keys stay
+# 1-based positions; the file is written one chunk at a time.
+def write_json(data, json_file, tables=tuple(TABLE_SEEDS)):
+    with open(json_file, "w") as file:
+        file.write("{")
+        for table_index, table_name in enumerate(tables):
+            file.write(("," if table_index else "") + f"\n{json.dumps(table_name)}: [")
+            first = True
+            for chunk in data.chunks(table_name):
+                columns = {name: (np.datetime_as_string(values, unit="s") if np.issubdtype(values.dtype, np.datetime64)
+                                  else values).tolist()
+                           for name, values in chunk.items()}
+                for values in zip(*columns.values()):
+                    file.write(("" if first else ",") + "\n" + json.dumps(dict(zip(columns, values))))
+                    first = False
+            file.write("\n]")
+        file.write("\n}\n")
+    print(f"{json_file}: {', '.join(f'{data.counts[name]} {name}' for name in tables)}")
+
+# Load straight into the database: dimension tables through the batched
+# loader (their generated ids are needed), fact tables with COPY after
+# mapping mock ids to database ids with array indexing. COPY bypasses the
+# per-batch rollup updates, so the rollups are rebuilt at the end.
+def load_database(data):
+    from ingestion.db import get_connection
+    from ingestion.bulk import bulk_insert, copy_csv
+    from ingestion.pipeline import RETURNING_COLUMNS
+    from ingestion.rollups import rebuild_rollups
+    from ingestion.notify import notify_data_changed
+
+    connection = get_connection()
+    try:
+        db_ids = {}
+        for table_name in ("subscriptions", "users", "content"):
+            ids = []
+            for chunk in data.chunks(table_name):
+                if table_name == "users":
+                    chunk["subscription_id"] = db_ids["subscriptions"][chunk["subscription_id"] - 1]
+                ids.extend(bulk_insert(connection, table_name, list(chunk),
+                                       zip(*(values.tolist() for values in chunk.values())),
+                                       RETURNING_COLUMNS[table_name]))
+            db_ids[table_name] = np.array(ids, dtype=np.int64)
+
+        for table_name in ("watchhistory", "reviews", "paymenthistory"):
+            started = time.perf_counter()
+            rows = 0
+            for chunk in data.chunks(table_name):
+                chunk["user_id"] = db_ids["users"][chunk["user_id"] - 1]
+                if "content_id" in chunk:
+                    chunk["content_id"] = db_ids["content"][chunk["content_id"] - 1]
+                copy_csv(connection, table_name, list(chunk), chunk_to_csv(chunk))
+                rows += len(chunk["user_id"])
+            elapsed = time.perf_counter() - started
+            print(f"{table_name}: {rows} rows in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+        rebuild_rollups(connection)
+        print("Rollups rebuilt.")
+    finally:
+        connection.close()
+    notify_data_changed(list(TABLE_SEEDS))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic streaming-service data")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--content", type=int, default=100)
+    parser.add_argument("--watch", type=int, default=1000, help="watchhistory rows")
+    parser.add_argument("--reviews", type=int, default=100)
+    parser.add_argument("--payments", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--zipf", type=float, default=1.1, help="content popularity exponent")
+    parser.add_argument("--start-date", default="2024-08-19")
+    parser.add_argument("--end-date", default="2024-11-28")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--csv-dir", help="write one CSV per table for COPY")
+    output.add_argument("--json", help="write one JSON file in the dataset.json layout")
+    output.add_argument("--load", action="store_true", help="load into DATABASE_URL")
+    args = parser.parse_args()
+
+    data = SyntheticData(args.users, args.content, args.watch, args.reviews, args.payments,
+                         seed=args.seed, zipf_exponent=args.zipf,
+                         start_date=args.start_date, end_date=args.end_date)
+    if args.csv_dir:
+        write_csv(data, args.csv_dir)
+    elif args.json:
+        write_json(data, args.json)
+    else:
+        load_database(data)
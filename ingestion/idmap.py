@@ -0,0 +1,140 @@
+import os
+import hashlib
+import numpy as np
+
+# Persistent mock id -> database id maps shared by insert-data.py,
+# ingestion/parallel.py and mock_data/upload_data.py. Mock files reference
+# parent rows by 1-based position (user 1 is the first user of the dataset),
+# so each dimension table of each source file (keyed like ingest_checkpoints)
+# gets one memory-mapped int64 array indexed by position, holding the
+# generated key (0 = not loaded). Resolving the keys of a batch is one array
+# lookup; nothing is read back from the database.
+#
+# Foreign keys resolve through the map of the same source when that file
+# loaded the parent table, otherwise through the map of the source that
+# loaded it most recently (e.g. a watchhistory-only file for upload_data.py).
+#
+# Maps live under INGEST_STATE_DIR (default .ingest-state), one directory per
+# DATABASE_URL, and are written after each batch commits. A map whose last id
+# is not among the ids recorded by its source's checkpoints (e.g. the tables
+# were recreated and ids restarted) is discarded when opened, and a map that
+# is missing is rebuilt from the checkpoints.
+STATE_DIR = os.environ.get("INGEST_STATE_DIR", ".ingest-state")
+
+ID_COLUMNS = {"subscriptions": "subscription_id", "users": "user_id", "content": "content_id"}
+
+def state_dir():
+    database = hashlib.sha1(os.environ["DATABASE_URL"].encode()).hexdigest()[:12]
+    return os.path.join(STATE_DIR, database)
+
+class IdMap:
+    def __init__(self, path):
+        self.path = path
+        self._ids = np.zeros(0, dtype=np.int64)
+        self.length = 0
+        if os.path.exists(path) and os.path.getsize(path):
+            self._ids = np.memmap(path, dtype=np.int64, mode="r+")
+            filled = np.flatnonzero(self._ids)
+            self.length = int(filled[-1]) + 1 if len(filled) else 0
+
+    def __len__(self):
+        return self.length
+
+    # Database ids for 0-based positions; 0 where the position is not loaded
+    def get(self, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        ids = np.zeros(len(positions), dtype=np.int64)
+        known = (positions >= 0) & (positions < self.length)
+        ids[known] = self._ids[positions[known]]
+        return ids
+
+    def covers(self, start, stop):
+        return stop <= self.length and bool(np.all(self._ids[start:stop]))
+
+    # Grow the file geometrically so appending batch by batch stays cheap
+    def _reserve(self, size):
+        if size <= len(self._ids):
+            return
+        capacity = max(size, 2 * len(self._ids), 1024)
+        if isinstance(self._ids, np.memmap):
+            self._ids.flush()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as file:
+            file.truncate(capacity * 8)
+        self._ids = np.memmap(self.path, dtype=np.int64, mode="r+")
+
+    def put(self, start, ids):
+        self._reserve(start + len(ids))
+        self._ids[start:start + len(ids)] = ids
+        self.length = max(self.length, start + len(ids))
+        self._ids.flush()
+
+    def clear(self):
+        self._ids = np.zeros(0, dtype=np.int64)
+        self.length = 0
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def map_path(table_name, source):
+    return os.path.join(state_dir(), table_name, hashlib.sha1(source.encode()).hexdigest()[:16] + ".ids")
+
+# Open a source's map of one table, dropping it when it points at rows the
+# database no longer has or did not load from that source
+def _open_map(cursor, table_name, source):
+    id_map = IdMap(map_path(table_name, source))
+    if len(id_map):
+        last_id = int(id_map.get([len(id_map) - 1])[0])
+        cursor.execute(f"""
+            SELECT 1 FROM {table_name} WHERE {ID_COLUMNS[table_name]} = %s
+            AND EXISTS (SELECT 1 FROM ingest_checkpoints
+                        WHERE source = %s AND table_name = %s AND ids @> ARRAY[%s]::BIGINT[])
+        """, (last_id, source, table_name, last_id))
+        if cursor.fetchone() is None:
+            print(f"{table_name}: id map is stale (id {last_id} is gone), starting a new one")
+            id_map.clear()
+    return id_map
+
+class IdMaps:
+    def __init__(self, loading, latest):
+        self._loading = loading
+        self._latest = latest
+
+    # Map filled by the dimension table this source loads
+    def loading(self, table_name):
+        return self._loading[table_name]
+
+    # Map that resolves foreign keys into a parent table
+    def parent(self, table_name):
+        own = self._loading[table_name]
+        if len(own) or self._latest[table_name] is None:
+            return own
+        return self._latest[table_name]
+
+# Open the maps for loading a source: its own maps, plus the maps of the
+# sources that loaded each dimension table most recently, rebuilt from their
+# checkpoints where the map file is missing or incomplete
+def open_id_maps(connection, source):
+    loading, latest = {}, {}
+    with connection.cursor() as cursor:
+        for table_name in ID_COLUMNS:
+            loading[table_name] = _open_map(cursor, table_name, source)
+            cursor.execute("""
+                SELECT source FROM ingest_checkpoints
+                WHERE table_name = %s AND ids IS NOT NULL AND source <> %s
+                ORDER BY committed_at DESC LIMIT 1
+            """, (table_name, source))
+            row = cursor.fetchone()
+            if row is None:
+                latest[table_name] = None
+                continue
+            id_map = latest[table_name] = _open_map(cursor, table_name, row[0])
+            cursor.execute("""
+                SELECT first_row, ids FROM ingest_checkpoints
+                WHERE source = %s AND table_name = %s
+                ORDER BY first_row
+            """, (row[0], table_name))
+            for first_row, ids in cursor.fetchall():
+                if not id_map.covers(first_row, first_row + len(ids)):
+                    id_map.put(first_row, ids)
+    connection.rollback()
+    return IdMaps(loading, latest)
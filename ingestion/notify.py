@@ -0,0 +1,24 @@
+import os, json
+import urllib.request
+
+# Tell the API which tables just changed so it can drop cached aggregates.
+# Set API_URL (e.g. http://localhost:5000) and the API's CACHE_INVALIDATE_TOKEN
+# to enable; the API refuses the hook without the token.
+def notify_data_changed(tables):
+    api_url = os.environ.get("API_URL")
+    token = os.environ.get("CACHE_INVALIDATE_TOKEN")
+    if not api_url or not token:
+        return
+    request = urllib.request.Request(
+        f"{api_url.rstrip('/')}/api/cache/invalidate",
+        data=json.dumps({"tables": list(tables)}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    request.add_header("X-Invalidate-Token", token)
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            print(f"API cache invalidated for {', '.join(tables)}: {response.read().decode()}")
+    except Exception as e:
+        # The data is committed either way; stale entries still expire by TTL
+        print(f"Could not invalidate API cache: {e}")
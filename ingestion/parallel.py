@@ -0,0 +1,149 @@
+import os, sys, time, queue, threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from psycopg2 import errors
+from ingestion.db import get_connection
+from ingestion.bulk import BATCH_SIZE, report_rate
+from ingestion.pipeline import TABLE_DEPENDENCIES, DIMENSION_TABLES
+from ingestion.stream import iter_records
+from ingestion.idmap import open_id_maps
+from ingestion.checkpoints import load_table, load_batch, prepare_table, pending_batches, report_skipped, source_key
+from ingestion.notify import notify_data_changed
+
+# Worker connections per fact table and how many batches may wait for a worker
+SHARD_WORKERS = int(os.environ.get("INGEST_SHARD_WORKERS", "4"))
+SHARD_QUEUE_DEPTH = int(os.environ.get("INGEST_SHARD_QUEUE_DEPTH", "8"))
+SERIALIZATION_RETRIES = 5
+# Transaction conflicts between shards: serialization failures on
+# CockroachDB, deadlocks on PostgreSQL (both roll the whole batch back)
+RETRYABLE_ERRORS = (errors.SerializationFailure, errors.DeadlockDetected)
+
+# Loads go through ingestion/checkpoints.py like insert-data.py: every batch
+# commits with its checkpoint, so rerunning a file (or running it after
+# insert-data.py) only loads what is missing, and the dimension tables fill
+# the id maps that mock_data/upload_data.py resolves against.
+
+# Dimension tables are loaded by a single stream so their ids land in the id
+# maps in file order
+def load_dimension(json_file, table_name, id_maps):
+    connection = get_connection()
+    try:
+        return load_table(connection, source_key(json_file), table_name, iter_records(json_file, table_name),
+                          id_maps)
+    finally:
+        connection.close()
+
+# Shard worker: one connection, consumes (first_row, batch) pairs until it
+# receives None. Concurrent rollup upserts can conflict, so a batch is retried
+# on RETRYABLE_ERRORS (each batch is its own transaction and checkpoint).
+def _shard_worker(source, table_name, batches, id_maps):
+    connection = get_connection()
+    rows = 0
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                return rows
+            first_row, batch = item
+            for attempt in range(SERIALIZATION_RETRIES):
+                try:
+                    rows += load_batch(connection, source, table_name, first_row, batch, id_maps)
+                    break
+                except RETRYABLE_ERRORS:
+                    time.sleep(0.05 * 2 ** attempt)
+            else:
+                raise RuntimeError(f"{table_name}: batch kept failing with transaction conflicts")
+    finally:
+        connection.close()
+
+# Fact tables are split into batches that a pool of workers insert in
+# parallel, each over its own connection
+def load_fact_sharded(json_file, table_name, id_maps, workers=SHARD_WORKERS):
+    source = source_key(json_file)
+    started = time.perf_counter()
+    connection = get_connection()
+    try:
+        committed = prepare_table(connection, source, table_name, id_maps)
+    finally:
+        connection.close()
+    batches = queue.Queue(maxsize=SHARD_QUEUE_DEPTH)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{table_name}-shard") as pool:
+        futures = [pool.submit(_shard_worker, source, table_name, batches, id_maps) for _ in range(workers)]
+        try:
+            for item in pending_batches(iter_records(json_file, table_name), committed, BATCH_SIZE):
+                # Stop feeding as soon as a worker has died instead of blocking forever
+                while True:
+                    try:
+                        batches.put(item, timeout=1)
+                        break
+                    except queue.Full:
+                        failed = [future for future in futures if future.done() and future.exception()]
+                        if failed:
+                            raise failed[0].exception()
+        finally:
+            for _ in futures:
+                while not all(future.done() for future in futures):
+                    try:
+                        batches.put(None, timeout=1)
+                        break
+                    except queue.Full:
+                        pass
+        rows = sum(future.result() for future in futures)
+    report_rate(table_name, rows, time.perf_counter() - started)
+    report_skipped(table_name, committed)
+    return rows
+
+# Load all six tables from a JSON file, running every table whose parents are
+# loaded concurrently: subscriptions->users alongside content, then
+# watchhistory, reviews and paymenthistory together.
+def load_parallel(json_file, workers=SHARD_WORKERS):
+    connection = get_connection()
+    try:
+        id_maps = open_id_maps(connection, source_key(json_file))
+    finally:
+        connection.close()
+    loaded = set()
+    timings = {}
+    pending = dict(TABLE_DEPENDENCIES)
+    running = {}
+    started = time.perf_counter()
+    lock = threading.Lock()
+
+    def run(table_name):
+        table_started = time.perf_counter()
+        if table_name in DIMENSION_TABLES:
+            rows = load_dimension(json_file, table_name, id_maps)
+        else:
+            rows = load_fact_sharded(json_file, table_name, id_maps, workers)
+        timings[table_name] = (rows, time.perf_counter() - table_started)
+        with lock:
+            loaded.add(table_name)
+
+    with ThreadPoolExecutor(max_workers=len(TABLE_DEPENDENCIES)) as pool:
+        while pending or running:
+            with lock:
+                ready = [table_name for table_name, parents in pending.items()
+                         if all(parent in loaded for parent in parents)]
+            for table_name in ready:
+                del pending[table_name]
+                running[pool.submit(run, table_name)] = table_name
+            if not running:
+                raise RuntimeError(f"Unresolvable table dependencies: {pending}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                future.result()
+
+    print("Per-table load timings:")
+    for table_name in TABLE_DEPENDENCIES:
+        rows, elapsed = timings[table_name]
+        rate = rows / elapsed if elapsed > 0 else float("inf")
+        print(f"  {table_name:<15} {rows:>10} rows  {elapsed:8.2f}s  {rate:12,.0f} rows/sec")
+    print(f"  {'total':<15} {time.perf_counter() - started:30.2f}s")
+
+    notify_data_changed(list(TABLE_DEPENDENCIES))
+    return timings
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("Usage: python -m ingestion.parallel <json_file> [workers]")
+    load_parallel(sys.argv[1], int(sys.argv[2]) if len(sys.argv) == 3 else SHARD_WORKERS)
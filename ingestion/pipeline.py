@@ -0,0 +1,25 @@
+# Load order constraints between the six tables and the key each one returns
+TABLE_DEPENDENCIES = {
+    "subscriptions": (),
+    "users": ("subscriptions",),
+    "content": (),
+    "watchhistory": ("users", "content"),
+    "reviews": ("users", "content"),
+    "paymenthistory": ("users",),
+}
+
+RETURNING_COLUMNS = {
+    "subscriptions": "subscription_id",
+    "users": "user_id",
+    "content": "content_id",
+    "watchhistory": "watch_id",
+    "reviews": "review_id",
+    "paymenthistory": "payment_id",
+}
+
+# Only these tables' generated keys are referenced by later tables
+DIMENSION_TABLES = ("subscriptions", "users", "content")
+
+# Unique columns that identify a row across loads (db/migrations/0005): rows
+# loaded again resolve to the existing row instead of being duplicated
+NATURAL_KEYS = {"subscriptions": "name", "users": "email"}
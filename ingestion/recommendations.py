@@ -0,0 +1,248 @@
+import time, uuid, argparse
+import numpy as np
+from psycopg2.extras import execute_values
+from ingestion.db import get_connection
+from ingestion.versions import bump_data_version
+from ingestion.notify import notify_data_changed
+from shared.scoring import INTERACTION_SCORE, RECOMMENDATION_NEIGHBORS
+
+# Item-item recommendation index read by /api/recommendations/<user_id>:
+#
+#     python -m ingestion.recommendations refresh --interval 10   # keep it current
+#     python -m ingestion.recommendations rebuild                 # recompute it
+#
+# The loaders keep user_content_scores, the sparse user x content interaction
+# matrix, current in the same transaction as the rollups (ingestion/rollups.py),
+# and count each content's changes in content_neighbor_state. Two contents
+# are similar when the same users engaged with both: the cosine of their
+# columns of the matrix, weighted by INTERACTION_SCORE. content_neighbors
+# keeps the RECOMMENDATION_NEIGHBORS most similar contents of each content.
+#
+# A refresh recomputes the similarities of the contents changed since the
+# previous one, exactly, from the interactions of their users. It rewrites
+# their neighbor lists and, in the other contents' lists, their entries: an
+# entry is updated, added when it beats the list's weakest, or dropped. A
+# content that falls out of a list is not replaced by one that was cut
+# earlier, so between rebuilds a list can miss such a content. Run one
+# refresh job at a time.
+# Contents whose similarities are computed together, and the most
+# (interaction, co-interaction) products expanded at once
+BLOCK_SIZE = 256
+EXPAND_LIMIT = 4000000
+FETCH_SIZE = 50000
+INSERT_PAGE_SIZE = 5000
+
+# (user ids, content ids, scores) of every interaction, or of every
+# interaction of the users who interacted with content_ids
+def load_interactions(connection, content_ids=None):
+    condition, params = "TRUE", ()
+    if content_ids is not None:
+        condition = "s.user_id IN (SELECT user_id FROM user_content_scores WHERE content_id = ANY(%s))"
+        params = ([int(content_id) for content_id in content_ids],)
+    users, contents, scores = [], [], []
+    with connection.cursor(name=f"interactions_{uuid.uuid4().hex}") as source:
+        source.itersize = FETCH_SIZE
+        source.execute(f"""
+            SELECT s.user_id, s.content_id, {INTERACTION_SCORE.format(t="s")}
+            FROM user_content_scores s
+            WHERE {condition}
+        """, params)
+        while True:
+            rows = source.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            users.append(np.array(columns[0], dtype=np.int64))
+            contents.append(np.array(columns[1], dtype=np.int64))
+            scores.append(np.array(columns[2], dtype=np.float64))
+    if not users:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.concatenate(users), np.concatenate(contents), np.concatenate(scores)
+
+# Cosine similarities of the target items (dense indexes) to every item,
+# yielded BLOCK_SIZE targets at a time as (targets, targets x items array).
+# users/items/scores must hold every interaction of the targets' users.
+def similarity_blocks(users, items, scores, norms, targets):
+    item_count = len(norms)
+    # The interactions grouped by user: user u's are rows starts[u]:starts[u + 1]
+    order = np.argsort(users, kind="stable")
+    row_items, row_scores = items[order], scores[order]
+    starts = np.searchsorted(users[order], np.arange(users.max() + 2 if len(users) else 1))
+    for first in range(0, len(targets), BLOCK_SIZE):
+        block = targets[first:first + BLOCK_SIZE]
+        local = np.full(item_count, -1)
+        local[block] = np.arange(len(block))
+        # Each interaction with a target contributes score * score' to the
+        # target's dot product with every other item u interacted with
+        selected = local[items] >= 0
+        pair_users, pair_targets, pair_scores = users[selected], local[items[selected]], scores[selected]
+        counts = starts[pair_users + 1] - starts[pair_users]
+        ends = np.cumsum(counts)
+        dots = np.zeros(len(block) * item_count)
+        start = 0
+        while start < len(pair_users):
+            stop = max(int(np.searchsorted(ends, ends[start] - counts[start] + EXPAND_LIMIT, side="right")), start + 1)
+            chunk = counts[start:stop]
+            pair = np.repeat(np.arange(start, stop), chunk)
+            positions = np.repeat(starts[pair_users[start:stop]] - (np.cumsum(chunk) - chunk), chunk) \
+                + np.arange(int(chunk.sum()))
+            dots += np.bincount(pair_targets[pair] * item_count + row_items[positions],
+                                pair_scores[pair] * row_scores[positions], minlength=len(dots))
+            start = stop
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = dots.reshape(len(block), item_count) / np.outer(norms[block], norms)
+        similarity[~np.isfinite(similarity)] = 0
+        similarity[np.arange(len(block)), block] = 0
+        yield block, similarity
+
+# (row, column, value) of the RECOMMENDATION_NEIGHBORS largest positive
+# values of each row
+def top_neighbors(similarity):
+    k = min(RECOMMENDATION_NEIGHBORS, similarity.shape[1])
+    columns = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(similarity, columns, axis=1)
+    rows = np.repeat(np.arange(len(similarity)), k)
+    keep = values.ravel() > 0
+    return rows[keep], columns.ravel()[keep], values.ravel()[keep]
+
+# Keep the RECOMMENDATION_NEIGHBORS largest similarities of each content among
+# (content, neighbor, similarity) rows
+def trim_lists(contents, neighbors, similarities):
+    order = np.lexsort((-similarities, contents))
+    contents, neighbors, similarities = contents[order], neighbors[order], similarities[order]
+    first = np.searchsorted(contents, contents)
+    keep = np.arange(len(contents)) - first < RECOMMENDATION_NEIGHBORS
+    return contents[keep], neighbors[keep], similarities[keep]
+
+def write_lists(cursor, content_ids, contents, neighbors, similarities):
+    cursor.execute("DELETE FROM content_neighbors WHERE content_id = ANY(%s)", (content_ids.tolist(),))
+    rows = list(zip(contents.tolist(), neighbors.tolist(), similarities.tolist()))
+    for first in range(0, len(rows), INSERT_PAGE_SIZE):
+        execute_values(cursor, "INSERT INTO content_neighbors (content_id, neighbor_id, similarity) VALUES %s",
+                       rows[first:first + INSERT_PAGE_SIZE], page_size=INSERT_PAGE_SIZE)
+
+# Record the contents' norms and subtract the changes the index now reflects;
+# rows are (content_id, norm, changes)
+def update_state(cursor, rows):
+    if not rows:
+        return
+    execute_values(cursor, """
+        UPDATE content_neighbor_state AS s
+        SET norm = d.norm, pending_changes = s.pending_changes - d.changes
+        FROM (VALUES %s) AS d (content_id, norm, changes)
+        WHERE s.content_id = d.content_id
+    """, sorted(rows), page_size=len(rows))
+
+# Recompute every neighbor list from user_content_scores; also runs inside
+# rebuild_rollups()' transaction. Returns the number of contents indexed.
+def rebuild_recommendations(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT content_id, pending_changes FROM content_neighbor_state")
+        pending = cursor.fetchall()
+        users, contents, scores = load_interactions(connection)
+        content_ids, items = np.unique(contents, return_inverse=True)
+        _, users = np.unique(users, return_inverse=True)
+        norms = np.sqrt(np.bincount(items, scores ** 2, minlength=len(content_ids)))
+        lists = [], [], []
+        for block, similarity in similarity_blocks(users, items, scores, norms, np.arange(len(content_ids))):
+            rows, columns, values = top_neighbors(similarity)
+            for part, column in zip(lists, (content_ids[block[rows]], content_ids[columns], values)):
+                part.append(column)
+        cursor.execute("DELETE FROM content_neighbors")
+        if content_ids.size:
+            write_lists(cursor, content_ids, *(np.concatenate(part) for part in lists))
+        norm_of = dict(zip(content_ids.tolist(), norms.tolist()))
+        update_state(cursor, [(content_id, norm_of.get(content_id, 0.0), changes) for content_id, changes in pending])
+        bump_data_version(cursor, "content_neighbors")
+    return len(content_ids)
+
+# Bring the index up to date with the interactions loaded since the previous
+# refresh, in one transaction; returns the number of changed contents
+def refresh_recommendations(connection):
+    with connection.cursor() as cursor:
+        # Read the change counts before the interactions, so changes committed
+        # in between stay pending for the next refresh
+        cursor.execute("SELECT content_id, pending_changes FROM content_neighbor_state WHERE pending_changes > 0")
+        changed = cursor.fetchall()
+        if not changed:
+            connection.rollback()
+            return 0
+        changed_ids = np.array(sorted(row[0] for row in changed), dtype=np.int64)
+        pending = dict(changed)
+        users, contents, scores = load_interactions(connection, changed_ids)
+        content_ids, items = np.unique(np.concatenate([contents, changed_ids]), return_inverse=True)
+        items = items[:len(contents)]
+        _, users = np.unique(users, return_inverse=True)
+
+        # Norms of the changed contents from their (complete) columns, of the
+        # others as stored by the refresh that last changed them
+        cursor.execute("SELECT content_id, norm FROM content_neighbor_state WHERE content_id = ANY(%s)",
+                       (content_ids.tolist(),))
+        stored = dict(cursor.fetchall())
+        norms = np.array([stored.get(content_id, 0.0) for content_id in content_ids.tolist()])
+        targets = np.searchsorted(content_ids, changed_ids)
+        norms[targets] = np.sqrt(np.bincount(items, scores ** 2, minlength=len(content_ids)))[targets]
+
+        is_target = np.zeros(len(content_ids), dtype=bool)
+        is_target[targets] = True
+        lists = [], [], []
+        entries = [], [], []
+        for block, similarity in similarity_blocks(users, items, scores, norms, targets):
+            rows, columns, values = top_neighbors(similarity)
+            for part, column in zip(lists, (content_ids[block[rows]], content_ids[columns], values)):
+                part.append(column)
+            # The changed contents' new entries in the other contents' lists
+            rows, columns = np.nonzero((similarity > 0) & ~is_target)
+            for part, column in zip(entries, (content_ids[columns], content_ids[block[rows]],
+                                              similarity[rows, columns])):
+                part.append(column)
+        lists = [np.concatenate(part) for part in lists]
+        entries = [np.concatenate(part) for part in entries]
+
+        # Other contents whose lists mention a changed content or may now
+        cursor.execute("SELECT DISTINCT content_id FROM content_neighbors WHERE neighbor_id = ANY(%s)",
+                       (changed_ids.tolist(),))
+        listed = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+        others = np.setdiff1d(np.union1d(entries[0], listed), changed_ids)
+        cursor.execute("""
+            SELECT content_id, neighbor_id, similarity FROM content_neighbors
+            WHERE content_id = ANY(%s) AND NOT neighbor_id = ANY(%s)
+        """, (others.tolist(), changed_ids.tolist()))
+        kept = cursor.fetchall()
+        merged = trim_lists(*(np.concatenate([np.array(column, dtype=entry.dtype), entry])
+                              for column, entry in zip(zip(*kept) if kept else ([], [], []), entries)))
+
+        write_lists(cursor, np.concatenate([changed_ids, others]),
+                    *(np.concatenate(parts) for parts in zip(lists, merged)))
+        update_state(cursor, [(content_id, norm, pending[content_id])
+                              for content_id, norm in zip(changed_ids.tolist(), norms[targets].tolist())])
+        bump_data_version(cursor, "content_neighbors")
+    connection.commit()
+    return len(changed_ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the item-item recommendation index")
+    parser.add_argument("command", choices=["refresh", "rebuild"])
+    parser.add_argument("--interval", type=float, default=None,
+                        help="refresh every N seconds until Ctrl+C (default: once)")
+    args = parser.parse_args()
+    connection = get_connection()
+    try:
+        while True:
+            started = time.perf_counter()
+            if args.command == "rebuild":
+                count = rebuild_recommendations(connection)
+                connection.commit()
+            else:
+                count = refresh_recommendations(connection)
+            if count:
+                print(f"Recommendations: {count} contents {'refreshed' if args.command == 'refresh' else 'indexed'} "
+                      f"in {time.perf_counter() - started:.2f}s")
+                notify_data_changed(["content_neighbors"])
+            if args.command == "rebuild" or args.interval is None:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("Refresh stopped.")
+    finally:
+        connection.close()
@@ -0,0 +1,196 @@
+import sys
+from ingestion.db import get_connection
+from ingestion.versions import bump_data_version
+from ingestion.sketch_rollups import apply_watch_sketches, rebuild_watch_sketches
+from ingestion.recommendations import rebuild_recommendations
+
+# Pre-aggregated tables read by the API instead of scanning the raw tables.
+# They are kept current by apply_rollups(), which the loaders call in the
+# same transaction as the raw inserts, and can be backfilled with:
+#
+#     python -m ingestion.rollups rebuild
+#
+# The tables themselves are created by the migrations in db/migrations
+# (0002, 0006 and 0007); these are the ones a rebuild empties and refills.
+ROLLUP_TABLES = [
+    "revenue_daily", "revenue_weekly", "watch_genre_counts", "watch_monthly_title", "plan_user_counts",
+    # Sketches behind the approx=true endpoints, see ingestion/sketch_rollups.py
+    "viewer_sketches", "title_count_sketches",
+    # Interaction matrix and neighbor index behind /api/recommendations, see
+    # ingestion/recommendations.py
+    "user_content_scores", "content_neighbors", "content_neighbor_state",
+]
+
+# Watch progress in the recommendation matrix. Kept apart from the counts
+# because they also follow progress updates of existing rows (see
+# apply_watch_progress), which must not be counted again.
+WATCH_SCORE_STATEMENTS = [
+    # Rows are upserted in key order so concurrent loaders lock them in
+    # the same order
+    """
+    INSERT INTO user_content_scores (user_id, content_id, progress)
+    SELECT w.user_id, w.content_id, COALESCE(MAX(w.progress), 0)
+    FROM watchhistory w
+    WHERE {source}
+    GROUP BY w.user_id, w.content_id
+    ORDER BY w.user_id, w.content_id
+    ON CONFLICT (user_id, content_id) DO UPDATE
+    SET progress = GREATEST(COALESCE(user_content_scores.progress, 0), excluded.progress)
+    """,
+    """
+    INSERT INTO content_neighbor_state (content_id, pending_changes)
+    SELECT w.content_id, COUNT(*)
+    FROM watchhistory w
+    WHERE {source}
+    GROUP BY w.content_id
+    ORDER BY w.content_id
+    ON CONFLICT (content_id) DO UPDATE
+    SET pending_changes = content_neighbor_state.pending_changes + excluded.pending_changes
+    """,
+]
+
+# Each statement aggregates a set of source rows and adds the result onto the
+# rollup. "{source}" is either a filter on freshly inserted ids (incremental)
+# or TRUE (full rebuild). Rows are upserted in key order so concurrent
+# loaders (e.g. the shards of ingestion/parallel.py) lock them in the same
+# order instead of deadlocking.
+ROLLUP_STATEMENTS = {
+    "paymenthistory": [
+        """
+        INSERT INTO revenue_daily (day, revenue, payment_count)
+        SELECT DATE(payment_date), SUM(amount), COUNT(*)
+        FROM paymenthistory
+        WHERE {source} AND payment_date IS NOT NULL
+        GROUP BY DATE(payment_date)
+        ORDER BY DATE(payment_date)
+        ON CONFLICT (day) DO UPDATE
+        SET revenue = revenue_daily.revenue + excluded.revenue,
+            payment_count = revenue_daily.payment_count + excluded.payment_count
+        """,
+        """
+        INSERT INTO revenue_weekly (week, revenue, payment_count)
+        SELECT DATE_TRUNC('week', payment_date), SUM(amount), COUNT(*)
+        FROM paymenthistory
+        WHERE {source} AND payment_date IS NOT NULL
+        GROUP BY DATE_TRUNC('week', payment_date)
+        ORDER BY DATE_TRUNC('week', payment_date)
+        ON CONFLICT (week) DO UPDATE
+        SET revenue = revenue_weekly.revenue + excluded.revenue,
+            payment_count = revenue_weekly.payment_count + excluded.payment_count
+        """,
+    ],
+    "watchhistory": [
+        # Content without a genre is counted under '' (the key cannot be
+        # NULL) and served as a null genre, as the original GROUP BY did
+        """
+        INSERT INTO watch_genre_counts (genre, watch_count)
+        SELECT COALESCE(c.genre, ''), COUNT(*)
+        FROM watchhistory w
+        JOIN content c ON w.content_id = c.content_id
+        WHERE {source}
+        GROUP BY COALESCE(c.genre, '')
+        ORDER BY COALESCE(c.genre, '')
+        ON CONFLICT (genre) DO UPDATE
+        SET watch_count = watch_genre_counts.watch_count + excluded.watch_count
+        """,
+        """
+        INSERT INTO watch_monthly_title (month, title, watch_count)
+        SELECT DATE_TRUNC('month', w.watched_on), c.title, COUNT(*)
+        FROM watchhistory w
+        JOIN content c ON w.content_id = c.content_id
+        WHERE {source} AND w.watched_on IS NOT NULL
+        GROUP BY DATE_TRUNC('month', w.watched_on), c.title
+        ORDER BY DATE_TRUNC('month', w.watched_on), c.title
+        ON CONFLICT (month, title) DO UPDATE
+        SET watch_count = watch_monthly_title.watch_count + excluded.watch_count
+        """,
+        *WATCH_SCORE_STATEMENTS,
+    ],
+    "reviews": [
+        """
+        INSERT INTO user_content_scores (user_id, content_id, rating)
+        SELECT DISTINCT ON (user_id, content_id) user_id, content_id, rating
+        FROM reviews
+        WHERE {source} AND rating IS NOT NULL
+        ORDER BY user_id, content_id, review_id DESC
+        ON CONFLICT (user_id, content_id) DO UPDATE
+        SET rating = excluded.rating
+        """,
+        """
+        INSERT INTO content_neighbor_state (content_id, pending_changes)
+        SELECT content_id, COUNT(*)
+        FROM reviews
+        WHERE {source} AND rating IS NOT NULL
+        GROUP BY content_id
+        ORDER BY content_id
+        ON CONFLICT (content_id) DO UPDATE
+        SET pending_changes = content_neighbor_state.pending_changes + excluded.pending_changes
+        """,
+    ],
+    "users": [
+        """
+        INSERT INTO plan_user_counts (plan_name, user_count)
+        SELECT s.name, COUNT(*)
+        FROM users u
+        JOIN subscriptions s ON u.subscription_id = s.subscription_id
+        WHERE {source}
+        GROUP BY s.name
+        ORDER BY s.name
+        ON CONFLICT (plan_name) DO UPDATE
+        SET user_count = plan_user_counts.user_count + excluded.user_count
+        """,
+    ],
+}
+
+# Primary key column of each source table, used to select the new rows
+SOURCE_KEYS = {
+    "paymenthistory": "payment_id",
+    "watchhistory": "w.watch_id",
+    "reviews": "review_id",
+    "users": "u.user_id",
+}
+
+# Add freshly inserted rows to the rollups. Must run on the loader's cursor
+# before it commits so raw rows and aggregates land in one transaction.
+def apply_rollups(cursor, table_name, ids):
+    if table_name not in ROLLUP_STATEMENTS or not ids:
+        return
+    source = f"{SOURCE_KEYS[table_name]} = ANY(%s)"
+    for statement in ROLLUP_STATEMENTS[table_name]:
+        cursor.execute(statement.format(source=source), (list(ids),))
+    if table_name == "watchhistory":
+        apply_watch_sketches(cursor, ids)
+
+# Follow progress updates of existing watchhistory rows in the interaction
+# scores; the rows were already counted when they were inserted
+def apply_watch_progress(cursor, ids):
+    if not ids:
+        return
+    source = f"{SOURCE_KEYS['watchhistory']} = ANY(%s)"
+    for statement in WATCH_SCORE_STATEMENTS:
+        cursor.execute(statement.format(source=source), (list(ids),))
+
+# Recompute every rollup from the raw tables in a single transaction. The
+# source tables' data versions are bumped since the aggregates served from
+# them may change.
+def rebuild_rollups(connection):
+    with connection.cursor() as cursor:
+        for table_name in ROLLUP_TABLES:
+            cursor.execute(f"DELETE FROM {table_name}")
+        for source_table, statements in ROLLUP_STATEMENTS.items():
+            for statement in statements:
+                cursor.execute(statement.format(source="TRUE"))
+            bump_data_version(cursor, source_table)
+    rebuild_watch_sketches(connection)
+    rebuild_recommendations(connection)
+    connection.commit()
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("Usage: python -m ingestion.rollups rebuild")
+    connection = get_connection()
+    try:
+        rebuild_rollups(connection)
+        print("Rollup tables rebuild complete.")
+    finally:
+        connection.close()
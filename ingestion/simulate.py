@@ -0,0 +1,233 @@
+import time, random, asyncio, argparse
+from ingestion.db import get_connection
+from psycopg2.extras import execute_values
+from ingestion.bulk import bulk_insert
+from ingestion.pipeline import RETURNING_COLUMNS
+from ingestion.notify import notify_data_changed
+from ingestion.rollups import apply_watch_progress
+from ingestion.versions import bump_data_version
+
+# Long-running simulator that streams watch progress updates, reviews and
+# payments for the existing user population at a target rate:
+#
+#     python -m ingestion.simulate --rate 500 --duration 300
+#
+# An asyncio producer paces events into a bounded queue; a writer drains it
+# and flushes a batch when it reaches --batch-size or when --flush-interval
+# seconds have passed. A full queue blocks the producer (backpressure).
+# A session's first event inserts its watchhistory row; later progress ticks
+# update that row, so the rollups count each session once.
+
+EVENT_MIX = {"watchhistory": 0.85, "paymenthistory": 0.10, "reviews": 0.05}
+EVENT_COLUMNS = {
+    "watchhistory": ("user_id", "content_id", "watched_on", "progress"),
+    "reviews": ("user_id", "content_id", "rating", "review_text"),
+    "paymenthistory": ("user_id", "amount", "payment_date", "method"),
+}
+PAYMENT_METHODS = ["Credit Card", "Debit Card", "PayPal", "Gift Card"]
+REVIEW_TEXTS = ["Not for me.", "It was okay.", "Pretty good.", "Loved it!", "Instant classic."]
+
+class Stats:
+    def __init__(self):
+        self.produced = 0
+        self.written = 0
+        self.flushes = 0
+        self.blocked_events = 0
+        self.blocked_seconds = 0.0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.lag_count = 0
+
+# Simulated audience drawn from the rows already in the database
+class Population:
+    def __init__(self, connection, zipf_exponent=1.1, seed=None):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT u.user_id, s.price
+                FROM users u
+                JOIN subscriptions s ON u.subscription_id = s.subscription_id
+            """)
+            users = cursor.fetchall()
+            cursor.execute("SELECT content_id FROM content")
+            content_ids = [row[0] for row in cursor.fetchall()]
+        if not users or not content_ids:
+            raise RuntimeError("Load users and content before running the simulator")
+        self.random = random.Random(seed)
+        self.user_ids = [row[0] for row in users]
+        self.prices = {row[0]: float(row[1]) for row in users}
+        self.content_ids = content_ids
+        self.random.shuffle(self.content_ids)
+        # Zipf-like popularity so a few titles dominate, as in production
+        weights = [rank ** -zipf_exponent for rank in range(1, len(content_ids) + 1)]
+        total = sum(weights)
+        running = 0.0
+        self.content_cum_weights = []
+        for weight in weights:
+            running += weight / total
+            self.content_cum_weights.append(running)
+        # Open viewing sessions: user_id -> [content_id, progress, started on]
+        self.sessions = {}
+
+    def pick_content(self):
+        return self.random.choices(self.content_ids, cum_weights=self.content_cum_weights)[0]
+
+    def next_event(self):
+        kind = self.random.choices(list(EVENT_MIX), weights=list(EVENT_MIX.values()))[0]
+        user_id = self.random.choice(self.user_ids)
+        now = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+        if kind == "watchhistory":
+            session = self.sessions.get(user_id)
+            if session is None or session[1] >= 100:
+                session = self.sessions[user_id] = [self.pick_content(), 0, now]
+                kind = "watchhistory"
+            else:
+                kind = "progress"
+            session[1] = min(100, session[1] + self.random.randint(5, 30))
+            return kind, (user_id, session[0], session[2], session[1])
+        if kind == "reviews":
+            rating = round(self.random.uniform(0, 10), 1)
+            return kind, (user_id, self.pick_content(), rating, REVIEW_TEXTS[min(int(rating // 2), 4)])
+        return kind, (user_id, self.prices[user_id], now, self.random.choice(PAYMENT_METHODS))
+
+async def produce(population, events, rate, duration, stats):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    while duration is None or loop.time() - started < duration:
+        # Emit however many events are due by now at the target rate
+        due = int((loop.time() - started) * rate) - stats.produced
+        for _ in range(due):
+            event = (*population.next_event(), time.monotonic())
+            if events.full():
+                blocked_at = loop.time()
+                await events.put(event)
+                stats.blocked_events += 1
+                stats.blocked_seconds += loop.time() - blocked_at
+            else:
+                events.put_nowait(event)
+            stats.produced += 1
+        await asyncio.sleep(min(0.01, 1 / rate))
+
+# Set the progress of open sessions on the rows their first event inserted,
+# found by user, content and start time (watchhistory_user_history)
+def update_progress(connection, rows):
+    latest = {}
+    for user_id, content_id, started_on, progress in rows:
+        key = (user_id, content_id, started_on)
+        latest[key] = max(progress, latest.get(key, 0))
+    with connection.cursor() as cursor:
+        updated = execute_values(cursor, """
+            UPDATE watchhistory AS w SET progress = d.progress
+            FROM (VALUES %s) AS d (user_id, content_id, watched_on, progress)
+            WHERE w.user_id = d.user_id AND w.content_id = d.content_id
+              AND w.watched_on = d.watched_on::TIMESTAMP
+            RETURNING w.watch_id
+        """, [(*key, progress) for key, progress in sorted(latest.items())], page_size=len(latest), fetch=True)
+        apply_watch_progress(cursor, [row[0] for row in updated])
+        bump_data_version(cursor, "watchhistory")
+    connection.commit()
+
+def write_batch(connection, batch, stats):
+    by_table = {}
+    for kind, row, _ in batch:
+        by_table.setdefault(kind, []).append(row)
+    # Inserts first: a session may start and progress within one batch
+    progress = by_table.pop("progress", [])
+    for table_name, rows in by_table.items():
+        bulk_insert(connection, table_name, EVENT_COLUMNS[table_name], rows, RETURNING_COLUMNS[table_name],
+                    batch_size=len(rows), keep_ids=False, report=False)
+    if progress:
+        update_progress(connection, progress)
+    committed = time.monotonic()
+    for _, _, created in batch:
+        lag = committed - created
+        stats.lag_total += lag
+        stats.lag_max = max(stats.lag_max, lag)
+    stats.lag_count += len(batch)
+    stats.written += len(batch)
+    stats.flushes += 1
+
+async def write(connection, events, batch_size, flush_interval, stats, done):
+    loop = asyncio.get_running_loop()
+    while not (done.is_set() and events.empty()):
+        batch = []
+        deadline = loop.time() + flush_interval
+        while len(batch) < batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(events.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        if batch:
+            # psycopg2 is blocking, so the write runs on a worker thread
+            await loop.run_in_executor(None, write_batch, connection, batch, stats)
+
+async def report(events, stats, interval, done):
+    loop = asyncio.get_running_loop()
+    last_produced = last_written = 0
+    last_time = loop.time()
+    while not done.is_set():
+        await asyncio.sleep(interval)
+        now = loop.time()
+        elapsed = now - last_time
+        lag_avg = stats.lag_total / stats.lag_count if stats.lag_count else 0.0
+        print(f"produced {(stats.produced - last_produced) / elapsed:8.0f}/s  "
+              f"written {(stats.written - last_written) / elapsed:8.0f}/s  "
+              f"queue {events.qsize():6d}/{events.maxsize}  "
+              f"blocked {stats.blocked_events} events ({stats.blocked_seconds:.2f}s)  "
+              f"lag avg {lag_avg * 1000:.0f}ms max {stats.lag_max * 1000:.0f}ms")
+        if stats.written != last_written:
+            await loop.run_in_executor(None, notify_data_changed, list(EVENT_MIX))
+        last_produced, last_written, last_time = stats.produced, stats.written, now
+        stats.lag_total, stats.lag_count, stats.lag_max = 0.0, 0, 0.0
+
+async def simulate(rate, duration=None, batch_size=500, flush_interval=1.0, queue_size=10000,
+                   report_interval=5.0, seed=None):
+    connection = get_connection()
+    stats = Stats()
+    done = asyncio.Event()
+    started = time.monotonic()
+    try:
+        population = Population(connection, seed=seed)
+        events = asyncio.Queue(maxsize=queue_size)
+        writer = asyncio.create_task(write(connection, events, batch_size, flush_interval, stats, done))
+        reporter = asyncio.create_task(report(events, stats, report_interval, done))
+        producer = asyncio.create_task(produce(population, events, rate, duration, stats))
+        try:
+            await asyncio.wait([producer, writer], return_when=asyncio.FIRST_COMPLETED)
+            # The writer only stops early when a write failed; surface the
+            # error instead of leaving the producer blocked on a full queue
+            if writer.done():
+                producer.cancel()
+                writer.result()
+            await producer
+        finally:
+            producer.cancel()
+            done.set()
+            if not writer.done():
+                await writer
+            reporter.cancel()
+    finally:
+        connection.close()
+    elapsed = time.monotonic() - started
+    print(f"Simulated {stats.written} events in {elapsed:.1f}s "
+          f"({stats.written / elapsed:,.0f} events/sec, target {rate}/sec, {stats.flushes} flushes)")
+    notify_data_changed(list(EVENT_MIX))
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream simulated viewing, review and payment events")
+    parser.add_argument("--rate", type=float, default=100, help="target events per second")
+    parser.add_argument("--duration", type=float, default=None, help="seconds to run (default: until Ctrl+C)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="max seconds between flushes")
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--report-interval", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    try:
+        asyncio.run(simulate(args.rate, args.duration, args.batch_size, args.flush_interval,
+                             args.queue_size, args.report_interval, args.seed))
+    except KeyboardInterrupt:
+        print("Simulation stopped.")
@@ -0,0 +1,92 @@
+import uuid
+from collections import defaultdict
+import numpy as np
+from psycopg2.extras import execute_values
+from shared.sketch_format import HyperLogLog, HeavyHitters
+
+# Maintains the watchhistory sketches read by the approx=true endpoints
+# (data structures and error bounds in shared/sketch_format.py):
+# viewer_sketches holds a HyperLogLog of viewers per (dimension, month, name)
+# for dimension "content" (name = content id) and "genre", and
+# title_count_sketches a count-min sketch with heavy-hitter candidates of
+# watches per content per day. apply_rollups() calls apply_watch_sketches()
+# in the loader's transaction, like the SQL rollups.
+
+REBUILD_CHUNK_SIZE = 50000
+
+WATCH_SKETCH_QUERY = """
+    SELECT w.user_id, w.content_id, c.genre, DATE_TRUNC('month', w.watched_on), DATE(w.watched_on)
+    FROM watchhistory w
+    JOIN content c ON w.content_id = c.content_id
+    WHERE {source} AND w.watched_on IS NOT NULL
+"""
+
+# Merge batch sketches into the stored ones. Missing rows are created empty
+# first, so the upsert locks every row the batch touches (in key order, so
+# concurrent loaders cannot deadlock) before the read-merge-write.
+def _merge_into(cursor, table_name, key_columns, empty, sketches, sketch_type):
+    if not sketches:
+        return
+    keys = sorted(sketches)
+    columns = ", ".join(key_columns)
+    stored = execute_values(cursor, f"""
+        INSERT INTO {table_name} ({columns}, sketch) VALUES %s
+        ON CONFLICT ({columns}) DO UPDATE SET sketch = {table_name}.sketch
+        RETURNING {columns}, sketch
+    """, [key + (empty,) for key in keys], page_size=len(keys), fetch=True)
+    merged = []
+    for row in stored:
+        key = tuple(row[:-1])
+        sketch = sketch_type.from_bytes(row[-1])
+        sketch.merge(sketches[key])
+        merged.append(key + (sketch.to_bytes(),))
+    conditions = " AND ".join(f"t.{column} = d.{column}" for column in key_columns)
+    execute_values(cursor, f"""
+        UPDATE {table_name} AS t SET sketch = d.sketch
+        FROM (VALUES %s) AS d ({columns}, sketch)
+        WHERE {conditions}
+    """, merged, page_size=len(merged))
+
+# rows: (user_id, content_id, genre, month, day) per watch
+def add_watches(cursor, rows):
+    if not rows:
+        return
+    users = np.array([row[0] for row in rows], dtype=np.int64)
+    index, rank = HyperLogLog.positions(users)
+    groups = defaultdict(list)
+    days = defaultdict(list)
+    for position, (_, content_id, genre, month, day) in enumerate(rows):
+        groups[("content", month, str(content_id))].append(position)
+        groups[("genre", month, genre or "")].append(position)
+        days[(day,)].append(content_id)
+
+    viewers = {}
+    for key, positions in groups.items():
+        sketch = viewers[key] = HyperLogLog()
+        sketch.add_positions(index[positions], rank[positions])
+    counts = {}
+    for key, content_ids in days.items():
+        sketch = counts[key] = HeavyHitters()
+        sketch.add(content_ids)
+
+    _merge_into(cursor, "viewer_sketches", ("dimension", "month", "name"), HyperLogLog().to_bytes(),
+                viewers, HyperLogLog)
+    _merge_into(cursor, "title_count_sketches", ("day",), HeavyHitters().to_bytes(), counts, HeavyHitters)
+
+def apply_watch_sketches(cursor, ids):
+    cursor.execute(WATCH_SKETCH_QUERY.format(source="w.watch_id = ANY(%s)"), (list(ids),))
+    add_watches(cursor, cursor.fetchall())
+
+# Recompute the sketches from every watch, REBUILD_CHUNK_SIZE rows at a time
+# through a server-side cursor; runs inside rebuild_rollups()' transaction,
+# after it has emptied the sketch tables
+def rebuild_watch_sketches(connection):
+    with connection.cursor() as cursor:
+        with connection.cursor(name=f"sketches_{uuid.uuid4().hex}") as source:
+            source.itersize = REBUILD_CHUNK_SIZE
+            source.execute(WATCH_SKETCH_QUERY.format(source="TRUE"))
+            while True:
+                rows = source.fetchmany(REBUILD_CHUNK_SIZE)
+                if not rows:
+                    break
+                add_watches(cursor, rows)
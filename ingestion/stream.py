@@ -0,0 +1,104 @@
+import json
+
+CHUNK_SIZE = 1 << 16
+_decoder = json.JSONDecoder()
+_DELIMITERS = frozenset(",]} \t\r\n")
+
+# Incremental reader for the {"table": [ {...}, {...} ], ...} layout used by
+# dataset.json and mock_data/*_mock_data.json. Only one record (plus one read
+# chunk) is held in memory at a time, however large the file is.
+class JsonStream:
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop the consumed prefix so the buffer never outgrows one record + one chunk
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r} in JSON stream")
+        self.pos += 1
+
+    def value(self):
+        # A bare number or literal is only complete once a delimiter follows it
+        if self.peek() not in '{["':
+            while not any(char in _DELIMITERS for char in self.buffer[self.pos:]) and self._fill():
+                pass
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            self.pos = end
+            return value
+
+    def array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' but found {separator!r} in JSON stream")
+
+    # Yield (table_name, records) for each top-level key in file order. Records
+    # not consumed by the caller are skipped before moving to the next table.
+    def tables(self):
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            name = self.value()
+            self.expect(":")
+            if self.peek() == "[":
+                records = self.array()
+                yield name, records
+                for _ in records:
+                    pass
+            else:
+                self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or '}}' but found {separator!r} in JSON stream")
+
+def iter_tables(json_file):
+    with open(json_file, "r") as file:
+        yield from JsonStream(file).tables()
+
+# Stream the records of a single table from a JSON file
+def iter_records(json_file, table_name):
+    for name, records in iter_tables(json_file):
+        if name == table_name:
+            yield from records
+            return
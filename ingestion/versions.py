@@ -0,0 +1,9 @@
+# Data versions read by the API to build ETags (see db/migrations/0004_data_versions.sql).
+# Must run on the loader's cursor before it commits, so readers never see new
+# rows under an old version or a new version without its rows.
+def bump_data_version(cursor, table_name):
+    cursor.execute("""
+        INSERT INTO data_versions (table_name, version, updated_at) VALUES (%s, 1, now())
+        ON CONFLICT (table_name) DO UPDATE
+        SET version = data_versions.version + 1, updated_at = now()
+    """, (table_name,))
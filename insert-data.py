@@ -1,66 +1,51 @@
-import os, json
+import os
+import sys
 import psycopg2
+from ingestion.notify import notify_data_changed
+from ingestion.pipeline import TABLE_DEPENDENCIES
+from ingestion.stream import iter_tables, iter_records
+from ingestion.idmap import open_id_maps
+from ingestion.checkpoints import load_table, source_key
 
 # Function to connect to the database
 def get_connection():
     return psycopg2.connect(os.environ["DATABASE_URL"])
 
-# Insert data into a table and fetch IDs
-def insert_and_fetch_ids(table_name, data, returning_column):
+# Main function to insert data and resolve dependencies. The file is parsed as
+# a stream, so memory stays flat and the first batches commit while the rest
+# of the file is still being read. Every batch is checkpointed, so rerunning
+# the same file after a failure only loads what is missing; plans and users
+# are matched on name / email, and their database ids are kept in the shared
+# id maps (ingestion/idmap.py) for the child tables and upload_data.py.
+def load_data_from_json(json_file):
+    source = source_key(json_file)
     connection = get_connection()
-    cursor = connection.cursor()
-    ids = []
+    loaded = []
+    deferred = []
 
     try:
-        for row in data:
-            columns = ", ".join(row.keys())
-            placeholders = ", ".join(["%s"] * len(row))
-            query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders}) RETURNING {returning_column}"
-            cursor.execute(query, list(row.values()))
-            ids.append(cursor.fetchone()[0])
-
-        connection.commit()
+        id_maps = open_id_maps(connection, source)
+        for table_name, records in iter_tables(json_file):
+            if table_name not in TABLE_DEPENDENCIES:
+                continue
+            if all(parent in loaded for parent in TABLE_DEPENDENCIES[table_name]):
+                load_table(connection, source, table_name, records, id_maps)
+                loaded.append(table_name)
+            else:
+                deferred.append(table_name)
+
+        # Tables listed before their parents get a second pass over the file
+        for table_name in sorted(deferred, key=list(TABLE_DEPENDENCIES).index):
+            load_table(connection, source, table_name, iter_records(json_file, table_name), id_maps)
+            loaded.append(table_name)
     finally:
-        cursor.close()
         connection.close()
-
-    return ids
-
-# Main function to insert data and resolve dependencies
-def load_data_from_json(json_file):
-    with open(json_file, "r") as file:
-        data = json.load(file)
-
-    # Insert subscriptions and fetch subscription_ids
-    subscription_ids = insert_and_fetch_ids("subscriptions", data["subscriptions"], "subscription_id")
-
-    # Update users data with actual subscription_ids
-    for i, user in enumerate(data["users"]):
-        user["subscription_id"] = subscription_ids[i % len(subscription_ids)]
-
-    # Insert users and fetch user_ids
-    user_ids = insert_and_fetch_ids("users", data["users"], "user_id")
-
-    # Insert content and fetch content_ids
-    content_ids = insert_and_fetch_ids("content", data["content"], "content_id")
-
-    # Update watchhistory, reviews, and paymenthistory with actual user_ids and content_ids
-    for watch in data["watchhistory"]:
-        watch["user_id"] = user_ids[watch["user_id"] - 1]
-        watch["content_id"] = content_ids[watch["content_id"] - 1]
-
-    for review in data["reviews"]:
-        review["user_id"] = user_ids[review["user_id"] - 1]
-        review["content_id"] = content_ids[review["content_id"] - 1]
-
-    for payment in data["paymenthistory"]:
-        payment["user_id"] = user_ids[payment["user_id"] - 1]
-
-    # Insert dependent data
-    insert_and_fetch_ids("watchhistory", data["watchhistory"], "watch_id")
-    insert_and_fetch_ids("reviews", data["reviews"], "review_id")
-    insert_and_fetch_ids("paymenthistory", data["paymenthistory"], "payment_id")
-
-# Call the function
-json_file = "dataset.json"
-load_data_from_json(json_file)
+        # Committed batches are visible even when a later one failed, so
+        # cached API aggregates are stale either way
+        if loaded:
+            notify_data_changed(loaded)
+
+# Call the function (python insert-data.py [json_file])
+if __name__ == "__main__":
+    json_file = sys.argv[1] if len(sys.argv) > 1 else "dataset.json"
+    load_data_from_json(json_file)
@@ -1,61 +1,42 @@
-import json, os
+import os, sys
 import psycopg2
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ingestion.notify import notify_data_changed
+from ingestion.stream import iter_records
+from ingestion.idmap import open_id_maps
+from ingestion.checkpoints import load_table, source_key
+
 # Function to connect to the database
 def get_connection():
     return psycopg2.connect(os.environ["DATABASE_URL"])
 
 # ----------------------------Function to upload watchhistory data---------------------------------
 def upload_watchhistory(json_file):
-    with open(json_file, "r") as file:
-        data = json.load(file)
-
     # Connect to the database
     connection = get_connection()
-    cursor = connection.cursor()
 
     try:
-        # Fetch all user_ids from the users table
-        cursor.execute("SELECT user_id FROM users ORDER BY user_id ASC")
-        user_ids = [row[0] for row in cursor.fetchall()]
-
-        # Fetch all content_ids from the content table
-        cursor.execute("SELECT content_id FROM content ORDER BY content_id ASC")
-        content_ids = [row[0] for row in cursor.fetchall()]
-
-        # Resolve user_id and content_id relationships in watchhistory mock data
-        for watch in data["watchhistory"]:
-            user_index = watch["user_id"] - 1  # Adjusting for 0-based index
-            content_index = watch["content_id"] - 1  # Adjusting for 0-based index
-
-            if user_index < len(user_ids) and content_index < len(content_ids):
-                watch["user_id"] = user_ids[user_index]
-                watch["content_id"] = content_ids[content_index]
-            else:
-                raise IndexError(
-                    f"User ID {watch['user_id']} or Content ID {watch['content_id']} in mock data exceeds the number of users or content in the database."
-                )
-
-        # Insert watchhistory data into the database
-        for watch in data["watchhistory"]:
-            cursor.execute("""
-                INSERT INTO watchhistory (user_id, content_id, watched_on, progress)
-                VALUES (%s, %s, %s, %s)
-            """, (watch["user_id"], watch["content_id"], watch["watched_on"], watch["progress"]))
-
-        # Commit the transaction
-        connection.commit()
+        # Mock user_id / content_id values are resolved through the id maps
+        # of the dataset insert-data.py loaded last (one array lookup per
+        # batch, no table scans). Batches committed by an earlier run of this file are
+        # skipped, and rollups are updated with each batch.
+        source = source_key(json_file)
+        id_maps = open_id_maps(connection, source)
+        load_table(connection, source, "watchhistory",
+                   iter_records(json_file, "watchhistory"), id_maps)
         print("Watch history data uploaded successfully!")
+        notify_data_changed(["watchhistory"])
     except (Exception, psycopg2.Error) as error:
         print(f"Error uploading watch history data: {error}")
     finally:
         if connection:
-            cursor.close()
             connection.close()
 
-# Call the function
-json_file = "watchhistory_mock_data2.json"  # Replace with the correct JSON file path
-upload_watchhistory(json_file)
+# Call the function (python upload_data.py [json_file])
+if __name__ == "__main__":
+    json_file = sys.argv[1] if len(sys.argv) > 1 else "watchhistory_mock_data2.json"  # Replace with the correct JSON file path
+    upload_watchhistory(json_file)
 
 # # ------------------------Insert data into the `paymenthistory` table---------------------------
 # def upload_paymenthistory(json_file):
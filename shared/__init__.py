@@ -0,0 +1 @@
+# Definitions shared by the loaders (ingestion/) and the API (analytics-dashboard/)
@@ -0,0 +1,15 @@
+import os
+
+# How much a user engaged with a content, between 0 and 1: the furthest watch
+# progress, the latest review rating out of 10, or the mean of both, over a
+# user_content_scores row aliased {t}. ingestion/recommendations.py weighs
+# the index with it and the API's fetch_recommendations the user's history,
+# so both sides weigh interactions alike.
+INTERACTION_SCORE = """
+    CAST(CASE WHEN {t}.rating IS NULL THEN {t}.progress / 100
+              WHEN {t}.progress IS NULL THEN {t}.rating / 10
+              ELSE ({t}.progress / 100 + {t}.rating / 10) / 2 END AS FLOAT8)
+"""
+
+# Most similar contents kept per content in content_neighbors
+RECOMMENDATION_NEIGHBORS = int(os.environ.get("RECOMMENDATION_NEIGHBORS", "50"))
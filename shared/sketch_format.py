@@ -0,0 +1,141 @@
+import zlib
+import numpy as np
+
+# Storage format of the watchhistory sketches: written at ingestion time by
+# ingestion/sketch_rollups.py and read by the approx=true variants of the
+# endpoints (analytics-dashboard/sketches.py). Both kinds merge losslessly,
+# so a week or a whole year is answered by merging the stored per-day /
+# per-month sketches:
+#
+# - HyperLogLog (HyperLogLog): distinct viewers per (month, content) and
+#   (month, genre). Registers merge by element-wise max. Relative standard
+#   error 1.04 / sqrt(2 ** HLL_PRECISION), about 2.3%.
+# - Count-min sketch with heavy-hitter candidates (HeavyHitters): watches per
+#   content per day. Counters merge by addition. An estimate never
+#   undercounts and overcounts by at most e / CMS_WIDTH (about 0.13%) of the
+#   bucket's total watches with probability 1 - e ** -CMS_DEPTH (about 98%).
+#   Each day keeps the TOP_K contents with the highest estimates; the top
+#   titles of a week or month are ranked among the union of its days'
+#   candidates, so a title that never made a day's top TOP_K is not listed.
+HLL_PRECISION = 11
+CMS_WIDTH = 2048
+CMS_DEPTH = 4
+# At least queries.MAX_TOP_N, the largest n the top-titles endpoint accepts
+TOP_K = 100
+
+HLL_RELATIVE_ERROR = 1.04 / np.sqrt(2 ** HLL_PRECISION)
+CMS_EPSILON = np.e / CMS_WIDTH
+CMS_DELTA = np.exp(-CMS_DEPTH)
+# Sketches are rewritten on every batch that touches them; fast compression
+# keeps that cheap while mostly-empty sketches still shrink to a few bytes
+COMPRESSION_LEVEL = 1
+
+# splitmix64 finalizer: a stable 64-bit hash of integer keys (unlike hash(),
+# the same in every process, which persisted sketches rely on)
+def _hash(values, seed=0):
+    x = np.asarray(values, dtype=np.int64).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15) * np.uint64(seed + 1)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def _bit_length(x):
+    length = np.zeros(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x >= (np.uint64(1) << np.uint64(shift))
+        x = np.where(high, x >> np.uint64(shift), x)
+        length += high * shift
+    return length + (x > 0)
+
+class HyperLogLog:
+    def __init__(self, registers=None):
+        size = 2 ** HLL_PRECISION
+        self.registers = np.zeros(size, dtype=np.uint8) if registers is None else registers
+
+    # Register index and rank (position of the first 1 bit after the index
+    # bits) of each value; split out so a batch is hashed once and spread
+    # over many sketches
+    @staticmethod
+    def positions(values):
+        hashes = _hash(values)
+        bits = 64 - HLL_PRECISION
+        rest = hashes & np.uint64((1 << bits) - 1)
+        return (hashes >> np.uint64(bits)).astype(np.int64), (bits - _bit_length(rest) + 1).astype(np.uint8)
+
+    def add_positions(self, index, rank):
+        np.maximum.at(self.registers, index, rank)
+
+    def add(self, values):
+        self.add_positions(*self.positions(values))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        raw = alpha * size * size / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * size and zeros:
+            # Linear counting is more accurate while few registers are set
+            return int(round(size * np.log(size / zeros)))
+        return int(round(raw))
+
+    def to_bytes(self):
+        return zlib.compress(self.registers.tobytes(), COMPRESSION_LEVEL)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(np.frombuffer(zlib.decompress(bytes(data)), dtype=np.uint8).copy())
+
+class HeavyHitters:
+    def __init__(self, counters=None, candidates=None):
+        self.counters = np.zeros((CMS_DEPTH, CMS_WIDTH), dtype=np.int64) if counters is None else counters
+        self.candidates = np.zeros(0, dtype=np.int64) if candidates is None else candidates
+
+    def _columns(self, keys):
+        return [(_hash(keys, row + 1) % np.uint64(CMS_WIDTH)).astype(np.int64) for row in range(CMS_DEPTH)]
+
+    @property
+    def total(self):
+        return int(self.counters[0].sum())
+
+    def estimate(self, keys):
+        columns = self._columns(keys)
+        return np.min([self.counters[row, columns[row]] for row in range(CMS_DEPTH)], axis=0)
+
+    # Keep the TOP_K keys with the highest estimates among the current
+    # candidates and the keys just added
+    def _keep_top(self, keys):
+        keys = np.union1d(self.candidates, keys)
+        if len(keys) > TOP_K:
+            keys = keys[np.argsort(-self.estimate(keys), kind="stable")[:TOP_K]]
+        self.candidates = np.sort(keys)
+
+    def add(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        for row, columns in enumerate(self._columns(keys)):
+            np.add.at(self.counters[row], columns, 1)
+        self._keep_top(keys)
+
+    def merge(self, other):
+        self.counters += other.counters
+        self._keep_top(other.candidates)
+
+    # (key, estimated count) of the candidates, highest first
+    def top(self):
+        estimates = self.estimate(self.candidates)
+        order = np.argsort(-estimates, kind="stable")
+        return list(zip(self.candidates[order].tolist(), estimates[order].tolist()))
+
+    # One int64 array: candidate count, candidates, counters
+    def to_bytes(self):
+        packed = np.concatenate([[len(self.candidates)], self.candidates, self.counters.ravel()])
+        return zlib.compress(packed.astype(np.int64).tobytes(), COMPRESSION_LEVEL)
+
+    @classmethod
+    def from_bytes(cls, data):
+        packed = np.frombuffer(zlib.decompress(bytes(data)), dtype=np.int64)
+        count = int(packed[0])
+        return cls(packed[1 + count:].reshape(CMS_DEPTH, CMS_WIDTH).copy(), packed[1:1 + count].copy())